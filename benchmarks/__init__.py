@@ -0,0 +1 @@
+"""Performance benchmarks for the Metasploit MCP server, run against a local msfrpcd stub."""
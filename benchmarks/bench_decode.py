@@ -0,0 +1,150 @@
+"""
+Compare decoding msfrpcd responses with decode() + convert() and with decode_response().
+
+    python -m benchmarks.bench_decode --repeat 20
+    python -m benchmarks.bench_decode --record responses/ --password secret   # from a live msfrpcd
+    python -m benchmarks.bench_decode responses/*.msgpack
+    python -m benchmarks.bench_decode --cassette engagement.cassette.gz   # the largest response per method
+
+Without files the responses are built like msfrpcd's: binary strings throughout, with a few
+fields that are not valid UTF-8.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import time
+import tracemalloc
+
+import msgpack
+from pymetasploit3.utils import convert, decode
+
+from msfrpc import MsfRpcClient, MsfRpcMethod
+from utils.cassette import Cassette
+from utils.decoding import decode_response
+from benchmarks.stub_server import binary
+
+# Large responses worth recording from a live msfrpcd
+RECORDED_METHODS = [
+    MsfRpcMethod.ModuleExploits,
+    MsfRpcMethod.ModuleAuxiliary,
+    MsfRpcMethod.ModulePayloads,
+    MsfRpcMethod.SessionList,
+    MsfRpcMethod.JobList,
+]
+
+
+def synthetic_responses(scale):
+    rnd = random.Random(0)
+    exploits = {'modules': ['%s/%s/exploit_%d' % (rnd.choice(['windows', 'linux', 'unix', 'multi']),
+                                                  rnd.choice(['http', 'smb', 'local', 'misc']), i)
+                            for i in range(2500 * scale)]}
+    hosts = {'hosts': [{
+        'created_at': 1700000000 + i, 'address': '10.0.%d.%d' % (i // 256, i % 256),
+        'mac': '00:11:22:33:%02x:%02x' % (i // 256 % 256, i % 256), 'name': 'host-%d' % i,
+        'state': 'alive', 'os_name': rnd.choice(['Windows', 'Linux']), 'os_flavor': '', 'os_sp': '',
+        'os_lang': '', 'updated_at': 1700000000 + i, 'purpose': 'server', 'info': '',
+    } for i in range(1000 * scale)]}
+    sessions = {i: {
+        'type': rnd.choice(['meterpreter', 'shell']), 'tunnel_local': '10.0.0.1:4444',
+        'tunnel_peer': '10.0.1.%d:%d' % (i % 256, 40000 + i), 'via_exploit': 'exploit/multi/handler',
+        'via_payload': 'payload/windows/x64/meterpreter/reverse_tcp', 'desc': 'Meterpreter',
+        'info': 'NT AUTHORITY\\SYSTEM @ HOST-%d' % i, 'workspace': 'default', 'session_host': '10.0.1.%d' % (i % 256),
+        'session_port': 40000 + i, 'target_host': '', 'username': 'msf', 'uuid': '%08x' % rnd.getrandbits(32),
+        'exploit_uuid': '%08x' % rnd.getrandbits(32), 'routes': '', 'arch': 'x64', 'platform': 'windows',
+    } for i in range(1, 100 * scale + 1)}
+    responses = {name: msgpack.packb(binary(data), use_bin_type=True)
+                 for name, data in (('module.exploits', exploits), ('db.hosts', hosts), ('session.list', sessions))}
+    # Session output is not always valid UTF-8
+    ring = binary({'data': 'x' * 64, 'seq': 1})
+    ring[b'data'] = b'\xff\xfe' + bytes(range(256)) * 64
+    responses['session.ring_read'] = msgpack.packb(ring, use_bin_type=True)
+    return responses
+
+
+def record(directory, args):
+    os.makedirs(directory, exist_ok=True)
+    client = MsfRpcClient(args.password, username=args.username, server=args.host, port=args.port, ssl=args.ssl)
+    for method in RECORDED_METHODS:
+        with open(os.path.join(directory, method + '.msgpack'), 'wb') as f:
+            f.write(client.call(method, is_raw=True))
+    client.close()
+
+
+def cassette_responses(path):
+    largest = {}
+    for offset, method, args, status, seconds, body in Cassette.read(path):
+        if status == 200 and len(body) > len(largest.get(method, b'')):
+            largest[method] = body
+    return largest
+
+
+def timed(fn, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def compare(name, data, repeat, encodings, handling):
+    def slow(d):
+        return convert(decode(d), encodings, handling)
+
+    def fast(d):
+        return decode_response(d, encodings, handling)
+
+    if slow(data) != fast(data):
+        raise AssertionError('%s: decode_response differs from convert(decode())' % name)
+    slow_s, slow_peak = timed(slow, data, repeat)
+    fast_s, fast_peak = timed(fast, data, repeat)
+    return {
+        'bytes': len(data),
+        'convert_ms': round(slow_s * 1000, 3),
+        'decode_response_ms': round(fast_s * 1000, 3),
+        'speedup': round(slow_s / fast_s, 2),
+        'convert_peak_kib': round(slow_peak / 1024, 1),
+        'decode_response_peak_kib': round(fast_peak / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*', help='recorded msgpack response bodies')
+    parser.add_argument('--repeat', type=int, default=20, help='timing runs per response, the best is kept')
+    parser.add_argument('--scale', type=int, default=1, help='size multiplier of the synthetic responses')
+    parser.add_argument('--errors', default='replace', help='decode_error_handling for invalid strings')
+    parser.add_argument('--cassette', help='take the largest response of each method from a recorded cassette')
+    parser.add_argument('--record', metavar='DIR', help='save large responses from a live msfrpcd to DIR and exit')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=55553)
+    parser.add_argument('--ssl', action='store_true')
+    parser.add_argument('--username', default='msf')
+    parser.add_argument('--password', default='msf')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args)
+        return
+    if args.cassette:
+        responses = cassette_responses(args.cassette)
+    elif args.files:
+        responses = {}
+        for pattern in args.files:
+            for path in glob.glob(pattern):
+                with open(path, 'rb') as f:
+                    responses[os.path.basename(path)] = f.read()
+    else:
+        responses = synthetic_responses(args.scale)
+    results = {name: compare(name, data, args.repeat, ['utf-8'], args.errors) for name, data in responses.items()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
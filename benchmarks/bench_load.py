@@ -0,0 +1,354 @@
+"""
+Load the MCP server with several simulated MCP clients calling a weighted mix of tools, and report tail latency, event loop lag and RPC fan-out as the number of clients grows.
+
+    python -m benchmarks.bench_load --clients 1,4,16,64 --duration 10
+    python -m benchmarks.bench_load --mix list_sessions=4,console_read=3,module_info=2,list_services=1
+    python -m benchmarks.bench_load --url http://127.0.0.1:8000/sse --clients 1,8,32
+
+By default the clients and the server run in this process: each client has its own MCP session
+with the server over in-memory streams, as the stdio transport would give it, and the server
+talks to a stub msfrpcd (see stub_server.py). With --url the clients connect over SSE to a server
+started with MCP_TRANSPORT=sse, which talks to whatever msfrpcd it is configured for.
+
+For each number of clients, every client calls tools from the mix back to back (or after --think
+seconds) for --duration seconds. Event loop lag and RPC counts are the server's own, read with
+its rpc_stats tool, so they include its background work such as the session registry refresh.
+"""
+import os
+
+# The benchmark must not reuse or overwrite the real server's token file and module snapshot, and the
+# server's periodic metrics and traces would only add noise
+os.environ['MSF_RPC_TOKEN_FILE'] = ''
+os.environ['MSF_MODULE_SNAPSHOT'] = ''
+os.environ['MSF_RPC_METRICS_INTERVAL'] = '0'
+os.environ.pop('MSF_TRACE_FILE', None)
+# Logging every RPC at DEBUG would be most of what an in-process run measures; set it to DEBUG to see its cost
+os.environ.setdefault('FASTMCP_LOG_LEVEL', 'WARNING')
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+
+import anyio
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.shared.memory import create_client_server_memory_streams
+
+from benchmarks.bench_scenarios import percentile
+from benchmarks.stub_server import StubMsfRpcServer
+
+DEFAULT_MIX = 'list_sessions=4,console_read=3,module_info=2,list_services=1'
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def tool_arguments(shared, own):
+    """
+    tool -> function of a random.Random returning the tool's arguments. shared holds what the
+    setup found on the server, own what a client set up for itself (its console). Tools missing
+    here are called without arguments.
+    """
+    return {
+        'list_modules': lambda rng: {'type': 'exploit'},
+        'module_info': lambda rng: {'module_type': 'exploit', 'module_name': rng.choice(shared['exploits'])},
+        'get_options': lambda rng: {'module_type': 'exploit', 'module_name': rng.choice(shared['exploits'])},
+        'search_modules': lambda rng: {'query': rng.choice(shared['exploits']).rsplit('/', 1)[-1]},
+        'console_read': lambda rng: {'console_id': own['console']},
+        'console_write': lambda rng: {'console_id': own['console'], 'command': 'version'},
+        'run_console_command': lambda rng: {'command': 'version', 'timeout': 30},
+        'session_meterpreter_read': lambda rng: {'session_id': rng.choice(shared['meterpreters'])},
+        'session_shell_read': lambda rng: {'session_id': rng.choice(shared['shells'])},
+        'session_run_with_output': lambda rng: {'session_id': rng.choice(shared['meterpreters']),
+                                                'command': 'getuid', 'end_strings': ['getuid done'],
+                                                'timeout': 30},
+    }
+
+
+def result_data(result):
+    """
+    The tool's return value: FastMCP sends dicts as JSON text, and lists as one text item per element.
+    """
+    data = []
+    for content in result.content:
+        try:
+            data.append(json.loads(content.text))
+        except ValueError:
+            data.append(content.text)
+    return data[0] if len(data) == 1 else data
+
+
+def failed(result, data):
+    return result.isError or (isinstance(data, dict) and 'error' in data)
+
+
+@asynccontextmanager
+async def client_session(read, write):
+    """
+    An initialized ClientSession that reads and drops the server's notifications (its log
+    messages), as a real client does; left unread they would hold up the responses behind them.
+    """
+    async def drain(session):
+        async for _ in session.incoming_messages:
+            pass
+
+    async with ClientSession(read, write) as session:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(drain, session)
+            await session.initialize()
+            try:
+                yield session
+            finally:
+                tg.cancel_scope.cancel()
+
+
+@asynccontextmanager
+async def in_process_session(server):
+    """
+    An MCP session with the server in this process over in-memory streams. Closing it ends the
+    server side like a stdio client hanging up, so the server's lifespan exits normally.
+    """
+    async with create_client_server_memory_streams() as (client_streams, server_streams):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(server.run, server_streams[0], server_streams[1], server.create_initialization_options())
+            try:
+                async with client_session(*client_streams) as session:
+                    yield session
+            finally:
+                await client_streams[1].aclose()
+
+
+@asynccontextmanager
+async def sse_session(url):
+    async with sse_client(url) as (read, write):
+        async with client_session(read, write) as session:
+            yield session
+
+
+class SimulatedClient(object):
+
+    def __init__(self, number, connect, mix, shared, seed):
+        """
+        One MCP client: its session, its console and the calls it made.
+        """
+        self.number = number
+        self.connect = connect
+        self.mix = mix
+        self.rng = random.Random(seed)
+        self.own = {}
+        self.arguments = tool_arguments(shared, self.own)
+        self.arguments['destroy_console'] = lambda rng: {'console_id': self.own['console']}
+        self.calls = []
+        self.ready = asyncio.Event()
+        self.done = asyncio.Event()
+
+    async def call(self, session, name):
+        args = self.arguments[name](self.rng) if name in self.arguments else {}
+        result = await session.call_tool(name, args)
+        return result, result_data(result)
+
+    async def lifecycle(self, step):
+        """
+        Connect and warm up, call tools from the mix while the step runs, then hang up once the
+        step has read the server's stats. It all happens in one task, as the MCP transports need.
+        """
+        try:
+            async with self.connect() as session:
+                if {'console_read', 'console_write'} & set(self.mix):
+                    result, data = await self.call(session, 'create_console')
+                    if failed(result, data):
+                        raise RuntimeError('client %d could not create a console: %s' % (self.number, data))
+                    self.own['console'] = str(data['console_id'])
+                # Warm up every tool, so the timed calls do not pay one-off loads
+                for name in self.mix:
+                    await self.call(session, name)
+                self.ready.set()
+                await step.go.wait()
+                await self.run(session, step.deadline, step.think)
+                self.done.set()
+                await step.hang_up.wait()
+                if 'console' in self.own:
+                    await self.call(session, 'destroy_console')
+        finally:
+            self.ready.set()
+            self.done.set()
+
+    async def run(self, session, deadline, think):
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                result, data = await self.call(session, name)
+                error = str(data)[:200] if failed(result, data) else None
+            except Exception as e:
+                error = '%s: %s' % (type(e).__name__, e)
+            self.calls.append((name, time.perf_counter() - started, error))
+            if think:
+                await asyncio.sleep(self.rng.uniform(0, 2 * think))
+
+
+class Step(object):
+    """
+    Starts and stops the clients of one step together.
+    """
+
+    def __init__(self, think):
+        self.think = think
+        self.deadline = 0.0
+        self.go = asyncio.Event()
+        self.hang_up = asyncio.Event()
+
+
+def latency(seconds):
+    ordered = sorted(seconds)
+    if not ordered:
+        return {}
+    return {
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+async def rpc_stats(control, reset=False):
+    result = await control.call_tool('rpc_stats', {'reset': reset})
+    return result_data(result)
+
+
+async def settle(control, timeout=60.0, interval=0.5):
+    """
+    Wait until the server stops making RPCs, bar a background refresh or so, so the work that
+    connecting and warming up started (a module catalog build, console pool refills) is not
+    counted against the step.
+    """
+    deadline = time.perf_counter() + timeout
+    calls = (await rpc_stats(control))['rpc']['calls']
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(interval)
+        previous, calls = calls, (await rpc_stats(control))['rpc']['calls']
+        if calls - previous <= 1:
+            return
+
+
+async def run_step(control, connect, n, args, mix, shared):
+    step = Step(args.think)
+    clients = [SimulatedClient(i, connect, mix, shared, seed=args.seed + i) for i in range(n)]
+    tasks = [asyncio.create_task(c.lifecycle(step)) for c in clients]
+    try:
+        await asyncio.gather(*(c.ready.wait() for c in clients))
+        await settle(control)
+        await rpc_stats(control, reset=True)
+        started = time.perf_counter()
+        step.deadline = started + args.duration
+        step.go.set()
+        await asyncio.gather(*(c.done.wait() for c in clients))
+        elapsed = time.perf_counter() - started
+        stats = await rpc_stats(control)
+    finally:
+        step.go.set()
+        step.hang_up.set()
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+
+    calls = [call for c in clients for call in c.calls]
+    tools = {}
+    for name in mix:
+        mine = [call for call in calls if call[0] == name]
+        errors = [error for _, _, error in mine if error]
+        tools[name] = dict(calls=len(mine), errors=len(errors), first_error=errors[0] if errors else None,
+                           **latency([seconds for _, seconds, _ in mine]))
+    rpc_calls = {method: m['calls'] for method, m in stats['rpc']['methods'].items()}
+    return dict(
+        clients=n,
+        calls=len(calls),
+        errors=sum(t['errors'] for t in tools.values()),
+        seconds=round(elapsed, 3),
+        calls_per_second=round(len(calls) / elapsed, 1),
+        **latency([seconds for _, seconds, _ in calls]),
+        tools=tools,
+        event_loop_lag=stats['event_loop'],
+        rpc_per_call=round(stats['rpc']['calls'] / len(calls), 2) if calls else 0.0,
+        rpc_calls=dict(sorted(rpc_calls.items(), key=lambda item: -item[1])),
+        rpc_errors=stats['rpc']['errors'],
+    )
+
+
+async def run_all(args, mix):
+    if args.url:
+        def connect():
+            return sse_session(args.url)
+    else:
+        from mcp_server import mcp
+
+        def connect():
+            return in_process_session(mcp._mcp_server)
+
+    steps = []
+    async with connect() as control:
+        # One connection stays open throughout, so the server's shared state outlives the steps
+        exploits = result_data(await control.call_tool('list_modules', {'type': 'exploit'}))
+        sessions = result_data(await control.call_tool('list_sessions', {}))
+        rng = random.Random(args.seed)
+        shared = {
+            'exploits': rng.sample(exploits, min(len(exploits), args.modules_used)),
+            'meterpreters': [sid for sid, s in sessions.items() if s.get('type') == 'meterpreter'] or ['1'],
+            'shells': [sid for sid, s in sessions.items() if s.get('type') == 'shell'] or ['1'],
+        }
+        for n in args.clients:
+            steps.append(await run_step(control, connect, n, args, mix, shared))
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', default='1,4,16', help='comma-separated numbers of concurrent clients')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds each number of clients runs')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='comma-separated tool=weight pairs')
+    parser.add_argument('--think', type=float, default=0.0, help='mean seconds a client waits between calls')
+    parser.add_argument('--modules-used', type=int, default=50, help='distinct exploits module_info asks about')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', help='the SSE endpoint of a running server, instead of one in this process')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the stub adds to every call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds, at random')
+    parser.add_argument('--modules', type=int, default=1000, help='canned modules per module type in the stub')
+    parser.add_argument('--hosts', type=int, default=1000, help='hosts in the stub database')
+    parser.add_argument('--sessions', type=int, default=10, help='sessions open in the stub')
+    parser.add_argument('--console-delay', type=float, default=0.02, help='seconds before console output appears')
+    parser.add_argument('--save', metavar='FILE', help='write the results to FILE')
+    args = parser.parse_args()
+    args.clients = [int(n) for n in args.clients.split(',')]
+    mix = parse_mix(args.mix)
+
+    server = None
+    if not args.url:
+        server = StubMsfRpcServer(latency=args.latency, jitter=args.jitter, modules=args.modules, hosts=args.hosts,
+                                  sessions=args.sessions, console_delay=args.console_delay).serve_in_thread()
+        os.environ['MSF_RPC_PORT'] = str(server.port)
+    try:
+        steps = asyncio.run(run_all(args, mix))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {'config': {k: v for k, v in vars(args).items() if k != 'save'}, 'mix': mix, 'steps': steps}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Replay a recorded cassette's calls through the asyncio client against the replay server, and
+report where the client spends its time per method: encoding, HTTP, decoding and converting.
+
+    python -m benchmarks.bench_replay engagement.cassette.gz
+    python -m benchmarks.bench_replay engagement.cassette.gz --speed 0 --no-fast-decode --no-response-cache
+
+Calls are sent at their recorded offsets, scaled by --speed, so the concurrency of the recording
+is kept; with --speed 0 they are sent back to back, --concurrency at a time.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import msgpack
+
+from msfrpc import MsfRpcError
+from msfrpc_async import AsyncMsfRpcClient
+from utils.response_cache import ResponseCache
+from benchmarks.replay_server import ReplayMsfRpcServer
+
+
+async def replay(server, args):
+    records = server.records
+    limit = asyncio.Semaphore(args.concurrency)
+    errors = 0
+
+    async def one(client, offset, method, packed, begin):
+        nonlocal errors
+        if args.speed:
+            await asyncio.sleep(max(0.0, begin + offset / args.speed - time.perf_counter()))
+        async with limit:
+            try:
+                result = await client.call(method, msgpack.unpackb(packed, raw=False))
+            except (MsfRpcError, httpx.HTTPError, UnicodeDecodeError):
+                errors += 1
+            else:
+                errors += isinstance(result, dict) and result.get('error') is True
+
+    response_cache = ResponseCache() if args.response_cache else None
+    async with AsyncMsfRpcClient('msf', server='127.0.0.1', port=server.port, fast_decode=args.fast_decode,
+                                 decode_error_handling=args.errors, response_cache=response_cache,
+                                 pool_size=args.concurrency) as client:
+        await client.login()
+        client.metrics.reset()
+        begin = time.perf_counter()
+        await asyncio.gather(*(one(client, offset, method, packed, begin)
+                               for offset, method, packed, status, seconds, body in records))
+        elapsed = time.perf_counter() - begin
+        stats = client.metrics.stats
+    return {
+        'calls': len(records),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'recorded_seconds': round(records[-1][0] + records[-1][4], 3) if records else 0.0,
+        'methods': {method: {key: m[key] for key in ('calls', 'bytes_received', 'mean_ms', 'p50_ms', 'p95_ms',
+                                                      'phases_ms')}
+                    for method, m in stats['methods'].items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('cassette', help='a cassette recorded with MSF_RPC_CASSETTE')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='times faster than recorded to send calls and answer them, 0 for as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=10, help='calls in flight at most')
+    parser.add_argument('--errors', default='replace', help='decode_error_handling for invalid strings')
+    parser.add_argument('--no-fast-decode', dest='fast_decode', action='store_false',
+                        help='decode responses with decode() + convert()')
+    parser.add_argument('--no-response-cache', dest='response_cache', action='store_false',
+                        help='send every list call to the server')
+    args = parser.parse_args()
+
+    server = ReplayMsfRpcServer(args.cassette, speed=args.speed).serve_in_thread()
+    try:
+        result = asyncio.run(replay(server, args))
+    finally:
+        server.shutdown()
+    result['server'] = server.stats
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
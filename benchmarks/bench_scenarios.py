@@ -0,0 +1,304 @@
+"""
+Run every MCP tool, and the client managers, against the stub msfrpcd and report per-scenario throughput, latency percentiles and RPC counts.
+
+    python -m benchmarks.bench_scenarios --iterations 50 --concurrency 4
+    python -m benchmarks.bench_scenarios --latency 0.002 --jitter 0.002 --hosts 10000 --save baseline.json
+    python -m benchmarks.bench_scenarios --baseline baseline.json --threshold 0.25
+    python -m benchmarks.bench_scenarios --only list_hosts,run_console_command
+
+With --baseline each scenario is compared with the saved run. A scenario regresses when its median
+latency grows by more than the threshold (and by at least --min-delta-ms), or when it makes at least
+half an RPC more per call. The exit status is 1 if any scenario regressed.
+"""
+import os
+
+# The benchmarks must not reuse or overwrite the real server's token file and module snapshot, and the
+# server's periodic metrics and traces would only add noise
+os.environ['MSF_RPC_TOKEN_FILE'] = ''
+os.environ['MSF_MODULE_SNAPSHOT'] = ''
+os.environ['MSF_RPC_METRICS_INTERVAL'] = '0'
+os.environ.pop('MSF_TRACE_FILE', None)
+
+import argparse
+import asyncio
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from msfrpc import MsfRpcClient, MsfRpcMethod
+from utils.console_pool import ConsolePool
+from benchmarks.stub_server import StubMsfRpcServer
+from tools import console, database, diagnostics, execute, exploits, jobs, modules, sessions
+from utils import msf_utils
+
+EXPLOIT = 'windows/smb/ms17_010_eternalblue'
+AUXILIARY = 'scanner/portscan/tcp'
+PAYLOAD = 'payload/stub/module_00003'
+
+
+class BenchContext(object):
+    """
+    Stands in for the MCP request context the tools log through.
+    """
+
+    async def debug(self, message):
+        pass
+
+    info = warning = error = debug
+
+
+def tool_scenarios(server, n):
+    """
+    name -> function of the iteration number returning the awaitable tool call. Scenarios that use
+    something up (a job to stop, a console to destroy) get n + 1 of them, one for the warm-up call.
+    """
+    ctx = BenchContext()
+    meterpreters = [sid for sid, s in server.sessions.items() if s['type'] == 'meterpreter']
+    meterpreter = meterpreters[0]
+    shell = next(sid for sid, s in server.sessions.items() if s['type'] == 'shell')
+    stoppable_sessions = [server.open_session('shell') for _ in range(n + 1)]
+    stoppable_jobs = [server.start_job('auxiliary/' + AUXILIARY)['job_id'] for _ in range(n + 1)]
+    job = server.start_job('exploit/multi/handler')['job_id']
+    consoles = [server.console_create()['id'] for _ in range(n + 2)]
+    workspaces = ['bench-%d' % i for i in range(n + 1)]
+    for name in workspaces:
+        server.db_add_workspace(name)
+    return {
+        'list_modules': lambda i: modules.list_modules(ctx, 'exploit'),
+        'search_modules': lambda i: modules.search_modules(ctx, 'module_0004'),
+        'module_info': lambda i: modules.module_info(ctx, 'exploit', EXPLOIT),
+        'get_options': lambda i: execute.get_options(ctx, 'exploit', EXPLOIT),
+        'set_option': lambda i: execute.set_option(ctx, 'exploit', EXPLOIT, 'RHOSTS', '10.0.0.%d' % (i % 256)),
+        'execute_module': lambda i: execute.execute_module(ctx, 'auxiliary', AUXILIARY, {'RHOSTS': '10.0.0.1'}),
+        'execute_exploit': lambda i: exploits.execute_module(ctx, 'exploit', EXPLOIT, {'RHOSTS': '10.0.0.1'},
+                                                             payload=PAYLOAD, payload_options={'LHOST': '10.0.0.2'}),
+        'check_exploit': lambda i: exploits.check_exploit(ctx, EXPLOIT, {'RHOSTS': '10.0.0.1'}),
+        'list_compatible_payloads': lambda i: exploits.list_compatible_payloads(ctx, EXPLOIT),
+        'get_module_options': lambda i: exploits.get_module_options(ctx, 'exploit', EXPLOIT),
+        'generate_payload': lambda i: exploits.generate_payload(ctx, PAYLOAD, format='exe'),
+        'list_sessions': lambda i: sessions.list_sessions(ctx),
+        'session_meterpreter_write': lambda i: sessions.session_meterpreter_write(ctx, str(meterpreter), 'sysinfo'),
+        'session_meterpreter_read': lambda i: sessions.session_meterpreter_read(ctx, str(meterpreter)),
+        'session_shell_write': lambda i: sessions.session_shell_write(ctx, str(shell), 'whoami'),
+        'session_shell_read': lambda i: sessions.session_shell_read(ctx, str(shell)),
+        # Concurrent commands in one session would read each other's output: spread them over the sessions
+        'session_run_with_output': lambda i: sessions.session_run_with_output(
+            ctx, str(meterpreters[i % len(meterpreters)]), 'getuid', ['getuid done'], 10),
+        'stop_session': lambda i: sessions.stop_session(ctx, str(stoppable_sessions[i])),
+        'list_jobs': lambda i: jobs.list_jobs(ctx),
+        'job_info': lambda i: jobs.job_info(ctx, str(job)),
+        'stop_job': lambda i: jobs.stop_job(ctx, str(stoppable_jobs[i])),
+        'create_console': lambda i: console.create_console(ctx),
+        'destroy_console': lambda i: console.destroy_console(ctx, consoles[i]),
+        'list_consoles': lambda i: console.list_consoles(ctx),
+        'console_write': lambda i: console.console_write(ctx, consoles[-1], 'version'),
+        'console_read': lambda i: console.console_read(ctx, consoles[-1]),
+        'run_console_command': lambda i: console.run_console_command(ctx, 'version', timeout=10),
+        'list_workspaces': lambda i: database.list_workspaces(ctx),
+        'create_workspace': lambda i: database.create_workspace(ctx, 'bench-new-%d' % i),
+        'delete_workspace': lambda i: database.delete_workspace(ctx, workspaces[i]),
+        'current_workspace': lambda i: database.current_workspace(ctx),
+        'list_hosts': lambda i: database.list_hosts(ctx),
+        'list_services': lambda i: database.list_services(ctx),
+        'list_vulns': lambda i: database.list_vulns(ctx),
+        'import_scan': lambda i: database.import_scan(ctx, '<nmaprun></nmaprun>'),
+        'rpc_stats': lambda i: diagnostics.rpc_stats(ctx),
+    }
+
+
+def manager_scenarios(client, pool):
+    """
+    name -> function of the iteration number returning a blocking call on the MsfRpcClient managers.
+    """
+    def console_command(i):
+        with pool.lease() as c:
+            return c.run_command('version', timeout=10)
+
+    def module_batch(i):
+        with client.batch() as batch:
+            for k in range(10):
+                batch.call(MsfRpcMethod.ModuleInfo, ['exploit', 'stub/module_%05d' % k])
+        return batch.results()
+
+    return {
+        'client.modules.exploits': lambda i: client.modules.exploits,
+        'client.modules.use': lambda i: client.modules.use('exploit', EXPLOIT),
+        'client.modules.batch_info': module_batch,
+        'client.sessions.list': lambda i: client.sessions.list,
+        'client.jobs.list': lambda i: client.jobs.list,
+        'client.db.hosts': lambda i: client.db.workspaces.workspace().hosts.list,
+        'client.consoles.run_command': console_command,
+    }
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def failed(result):
+    return isinstance(result, dict) and 'error' in result
+
+
+async def run_scenario(server, call, iterations, concurrency, blocking=False):
+    """
+    Time iterations calls, at most concurrency at once, after one warm-up call and the background work
+    it started.
+    """
+    async def one(i):
+        try:
+            if blocking:
+                return await asyncio.to_thread(call, i)
+            return await call(i)
+        except Exception as e:
+            return {'error': '%s: %s' % (type(e).__name__, e)}
+
+    await one(iterations)
+    await settle()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+
+    async def timed(i):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await one(i)
+            latencies.append(time.perf_counter() - start)
+            if failed(result):
+                errors.append(str(result['error']))
+
+    before = dict(server.calls)
+    start = time.perf_counter()
+    await asyncio.gather(*[timed(i) for i in range(iterations)])
+    elapsed = time.perf_counter() - start
+    rpcs = {method: count - before.get(method, 0) for method, count in server.calls.items()
+            if count != before.get(method, 0)}
+    latencies.sort()
+    return {
+        'calls': iterations,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'seconds': round(elapsed, 4),
+        'calls_per_second': round(iterations / elapsed, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'rpc_per_call': round(sum(rpcs.values()) / iterations, 2),
+        'rpc_calls': dict(sorted(rpcs.items(), key=lambda item: -item[1])),
+    }
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """
+    Per scenario, the baseline and current throughput, latencies and RPCs per call, and whether it regressed.
+    The tail latency of a few dozen calls is too noisy to judge by, so only the median is.
+    """
+    comparison = {}
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        def change(key):
+            return [before[key], current[key], round(current[key] / before[key] - 1, 3) if before[key] else None]
+
+        comparison[name] = {
+            'calls_per_second': change('calls_per_second'),
+            'p50_ms': change('p50_ms'),
+            'p95_ms': change('p95_ms'),
+            'rpc_per_call': [before['rpc_per_call'], current['rpc_per_call']],
+            'regressed': (current['p50_ms'] > before['p50_ms'] * (1 + threshold) and
+                          current['p50_ms'] - before['p50_ms'] >= min_delta_ms) or
+                         # Cached lists expiring mid-run add a fraction of an RPC per call
+                         current['rpc_per_call'] - before['rpc_per_call'] >= 0.5,
+        }
+    return comparison
+
+
+async def settle(timeout=30.0):
+    """
+    Wait for the background work a scenario started (module catalog builds, console pool refills), so
+    its RPCs are not counted against the next scenario.
+    """
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+
+
+async def run_all(server, args, selected):
+    results = {}
+    scenarios = tool_scenarios(server, args.iterations)
+    for name, call in scenarios.items():
+        if selected is None or name in selected:
+            results[name] = await run_scenario(server, call, args.iterations, args.concurrency)
+            await settle()
+    if args.managers:
+        with MsfRpcClient('msf', server='127.0.0.1', port=server.port) as client:
+            pool = ConsolePool(client, size=args.concurrency, max_size=args.concurrency)
+            for name, call in manager_scenarios(client, pool).items():
+                if selected is None or name in selected:
+                    results[name] = await run_scenario(server, call, args.iterations, args.concurrency, blocking=True)
+            pool.close()
+    await msf_utils.get_console_pool().close()
+    await msf_utils.disconnect_async()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50, help='timed calls per scenario')
+    parser.add_argument('--concurrency', type=int, default=4, help='calls in flight at once')
+    parser.add_argument('--only', help='comma-separated scenarios to run')
+    parser.add_argument('--no-managers', dest='managers', action='store_false',
+                        help='skip the MsfRpcClient manager scenarios')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the stub adds to every call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds, at random')
+    parser.add_argument('--modules', type=int, default=1000, help='canned modules per module type')
+    parser.add_argument('--hosts', type=int, default=1000, help='hosts in the stub database')
+    parser.add_argument('--sessions', type=int, default=10, help='sessions open in the stub')
+    parser.add_argument('--session-lines', type=int, default=20, help='lines of output per session command')
+    parser.add_argument('--command-delay', type=float, default=0.01, help='seconds before session output appears')
+    parser.add_argument('--console-delay', type=float, default=0.02, help='seconds before console output appears')
+    parser.add_argument('--payload-size', type=int, default=1048576, help='bytes of generated payloads')
+    parser.add_argument('--save', metavar='FILE', help='write the results to FILE, e.g. as a baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='compare with results saved by --save')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative change that counts as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='smaller latency changes are noise, never regressions')
+    args = parser.parse_args()
+
+    server = StubMsfRpcServer(latency=args.latency, jitter=args.jitter, modules=args.modules, hosts=args.hosts,
+                              sessions=args.sessions, session_lines=args.session_lines,
+                              command_delay=args.command_delay, console_delay=args.console_delay,
+                              payload_size=args.payload_size).serve_in_thread()
+    os.environ['MSF_RPC_PORT'] = str(server.port)
+    payload_dir = tempfile.mkdtemp(prefix='bench-payloads-')
+    exploits.PAYLOAD_DIR = payload_dir
+    selected = set(args.only.split(',')) if args.only else None
+    try:
+        results = asyncio.run(run_all(server, args, selected))
+    finally:
+        shutil.rmtree(payload_dir, ignore_errors=True)
+        server.shutdown()
+
+    report = {'config': {k: v for k, v in vars(args).items() if k not in ('save', 'baseline', 'only')},
+              'scenarios': results}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['comparison'] = compare(results, baseline['scenarios'], args.threshold, args.min_delta_ms)
+        report['regressed'] = sorted(name for name, c in report['comparison'].items() if c['regressed'])
+        regressed = bool(report['regressed'])
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Compare a cold module catalog build with a warm start from the on-disk snapshot.
+
+    python -m benchmarks.bench_startup --modules 1000 --latency 0.002
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from msfrpc_async import AsyncMsfRpcClient
+from utils.module_cache import ModuleCache
+from benchmarks.stub_server import StubMsfRpcServer
+from utils.module_catalog import ModuleCatalog
+
+
+def rpc_calls(server):
+    return sum(server.calls.values())
+
+
+async def start(server, path, warm):
+    """
+    What a freshly launched MCP server does before it can answer search_modules.
+    """
+    catalog = ModuleCatalog(snapshot_path=path)
+    cache = ModuleCache()
+    calls = rpc_calls(server)
+    begin = time.perf_counter()
+    if warm:
+        catalog.load(path, cache)
+    loaded = time.perf_counter()
+    async with AsyncMsfRpcClient('msf', server='127.0.0.1', port=server.port, module_cache=cache) as client:
+        await client.login()
+        await catalog.refresh(client)
+    end = time.perf_counter()
+    return {
+        'ready_ms': round(((loaded if warm else end) - begin) * 1000, 2),
+        'up_to_date_ms': round((end - begin) * 1000, 2),
+        'rpc_calls': rpc_calls(server) - calls,
+        'modules': len(catalog.records),
+        'snapshot_bytes': os.path.getsize(path),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modules', type=int, default=1000, help='canned modules per module type')
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds the stub adds to every call')
+    args = parser.parse_args()
+
+    server = StubMsfRpcServer(latency=args.latency, modules=args.modules).serve_in_thread()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'modules.msgpack')
+        results = {'cold': asyncio.run(start(server, path, warm=False))}
+        results['warm'] = asyncio.run(start(server, path, warm=True))
+        server.modules += 1  # one new module per type: only those are fetched
+        results['warm_changed'] = asyncio.run(start(server, path, warm=True))
+    results['speedup'] = round(results['cold']['up_to_date_ms'] / results['warm']['up_to_date_ms'], 1)
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare the pooled keep-alive transport of MsfRpcClient with one connection per call.
+
+    python -m benchmarks.bench_transport --calls 500 --latency 0.001
+    python -m benchmarks.bench_transport --certfile cert.pem --keyfile key.pem
+"""
+import argparse
+import json
+import statistics
+import time
+
+import requests
+
+from msfrpc import MsfRpcClient, MsfRpcMethod
+from benchmarks.stub_server import StubMsfRpcServer
+
+
+class PerRequestClient(MsfRpcClient):
+    """
+    The transport MsfRpcClient used before pooling: a new TCP connection, and TLS handshake, per call.
+    """
+
+    def post_request(self, url, payload, timeout=None, method=None, stream=False):
+        return requests.post(url, data=payload, headers=self.headers, verify=False, timeout=timeout or self.timeout,
+                             stream=stream)
+
+
+def run(client, calls, method):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(calls):
+        t = time.perf_counter()
+        client.call(method)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'calls': calls,
+        'seconds': round(elapsed, 4),
+        'calls_per_second': round(calls / elapsed, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--method', default=MsfRpcMethod.CoreVersion)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the stub adds to every call')
+    parser.add_argument('--certfile', help='run the stub over TLS with this certificate')
+    parser.add_argument('--keyfile', help='private key for --certfile')
+    args = parser.parse_args()
+
+    server = StubMsfRpcServer(latency=args.latency)
+    if args.certfile:
+        server.use_tls(args.certfile, args.keyfile)
+    server.serve_in_thread()
+    opts = {'server': '127.0.0.1', 'port': server.port, 'ssl': bool(args.certfile)}
+
+    results = {}
+    for name, cls in (('per_request', PerRequestClient), ('pooled', MsfRpcClient)):
+        with cls('msf', **opts) as client:
+            client.call(args.method)  # warm up
+            results[name] = run(client, args.calls, args.method)
+    results['speedup'] = round(results['per_request']['seconds'] / results['pooled']['seconds'], 2)
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Serve a cassette recorded from a real msfrpcd (see utils/cassette.py) back over the msgpack-RPC protocol.
+
+Each call is answered with the response msfrpcd gave to the same method and arguments, in
+recorded order, after the recorded round trip time divided by --speed (0 answers at once).
+A call asked more often than it was recorded gets its last response again, so polling loops
+keep working; a call never recorded with those arguments gets the next recorded response of
+its method. Logins and tokens are answered by the server itself and any token is accepted.
+
+    MSF_RPC_CASSETTE=engagement.cassette.gz python mcp_server.py     # record
+    python -m benchmarks.replay_server engagement.cassette.gz --port 55553 --speed 10
+"""
+import argparse
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import msgpack
+
+from utils.cassette import Cassette
+from benchmarks.stub_server import binary, rpc_error
+
+
+class ReplayRpcHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like msfrpcd
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = msgpack.unpackb(self.rfile.read(length), raw=False)
+        status, body = self.server.dispatch(request[0], request[1:])
+        self.send_response(status)
+        self.send_header('Content-Type', 'binary/message-pack')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayMsfRpcServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, cassette, address=('127.0.0.1', 0), speed=1.0):
+        """
+        Mandatory Arguments:
+        - cassette : the path of the cassette to serve
+
+        Optional Keyword Arguments:
+        - address : the (host, port) to listen on, port 0 picks a free one
+        - speed : how many times faster than recorded to answer, 0 answers at once (default: 1.0)
+        """
+        super().__init__(address, ReplayRpcHandler)
+        self.speed = speed
+        self.records = list(Cassette.read(cassette))
+        self.calls = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        self._by_args = {}
+        self._by_method = {}
+        for offset, method, args, status, seconds, body in self.records:
+            response = (status, seconds, body)
+            self._by_args.setdefault((method, args), deque()).append(response)
+            self._by_method.setdefault(method, deque()).append(response)
+        self.tokens = set()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def dispatch(self, method, args):
+        """
+        Returns the HTTP status and body answering a call.
+        """
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if method in Cassette.unrecorded:
+            return 200, msgpack.packb(binary(self.auth(method, args)), use_bin_type=True)
+        with self._lock:
+            responses = self._by_args.get((method, Cassette.key(args[1:])))
+            if responses is None:
+                self.misses[method] = self.misses.get(method, 0) + 1
+                responses = self._by_method.get(method)
+            if responses is None:
+                response = None
+            else:
+                # Keep the last response for calls repeated more often than recorded
+                response = responses.popleft() if len(responses) > 1 else responses[0]
+        if response is None:
+            error = rpc_error('Unknown API Call: %s (not in the cassette)' % method)
+            return error['error_code'], msgpack.packb(binary(error), use_bin_type=True)
+        status, seconds, body = response
+        if self.speed:
+            time.sleep(seconds / self.speed)
+        return status, body
+
+    def auth(self, method, args):
+        if method == 'auth.login':
+            token = 'TEMP' + uuid.uuid4().hex[:28]
+            self.tokens.add(token)
+            return {'result': 'success', 'token': token}
+        if method == 'auth.token_generate':
+            token = uuid.uuid4().hex
+            self.tokens.add(token)
+            return {'result': 'success', 'token': token}
+        if method == 'auth.token_list':
+            return {'tokens': sorted(self.tokens)}
+        if method == 'auth.token_add':
+            self.tokens.add(args[1])
+        elif method in ('auth.token_remove', 'auth.logout'):
+            self.tokens.discard(args[1])
+        return {'result': 'success'}
+
+    @property
+    def stats(self):
+        return {
+            'records': len(self.records),
+            'calls': dict(self.calls),
+            'misses': dict(self.misses),
+        }
+
+    def serve_in_thread(self):
+        """
+        Serve requests from a daemon thread and return the server.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a recorded cassette as msfrpcd.')
+    parser.add_argument('cassette', help='a cassette recorded with MSF_RPC_CASSETTE')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=55553)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='times faster than recorded to answer, 0 answers at once')
+    args = parser.parse_args()
+
+    server = ReplayMsfRpcServer(args.cassette, (args.host, args.port), args.speed)
+    print('replaying %d calls from %s on %s:%d' % (len(server.records), args.cassette, args.host, server.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print('calls %s, not recorded with those arguments %s' % (server.calls, server.misses))
+
+
+if __name__ == '__main__':
+    main()
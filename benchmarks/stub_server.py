@@ -0,0 +1,520 @@
+"""
+A local stand-in for msfrpcd that speaks the msgpack-RPC protocol over HTTP.
+
+It answers the RPC methods the MCP tools and the client managers use with canned,
+size-scalable data (modules, database hosts, services and vulns, sessions, jobs,
+consoles), so the client and the tools can be measured without a running Metasploit
+daemon. Latency, jitter and how slowly consoles and sessions produce output are
+configurable.
+
+    python -m benchmarks.stub_server --port 55553
+    python -m benchmarks.stub_server --latency 0.002 --jitter 0.003 --hosts 10000 --sessions 50
+"""
+import argparse
+import random
+import ssl
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import msgpack
+
+
+def binary(data):
+    """msfrpcd answers with binary strings; mirror that so the client decodes real-looking responses."""
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    if isinstance(data, list):
+        return [binary(i) for i in data]
+    if isinstance(data, dict):
+        return {binary(k): binary(v) for k, v in data.items()}
+    return data
+
+
+def rpc_error(message, error_class='Msf::RPC::Exception', code=500):
+    return {
+        'error': True,
+        'error_class': error_class,
+        'error_string': message,
+        'error_message': message,
+        'error_code': code,
+    }
+
+
+class StubRpcHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like msfrpcd
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = msgpack.unpackb(self.rfile.read(length), raw=False)
+        response = self.server.dispatch(request[0], request[1:])
+        body = msgpack.packb(binary(response), use_bin_type=True)
+        # msfrpcd sends errors with their error_code as the HTTP status
+        error = isinstance(response, dict) and response.get('error') is True
+        self.send_response(response['error_code'] if error else 200)
+        self.send_header('Content-Type', 'binary/message-pack')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubMsfRpcServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), username='msf', password='msf', latency=0.0, modules=100,
+                 command_delay=0.05, payload_size=1048576, jitter=0.0, hosts=1000, sessions=2, session_lines=2,
+                 console_delay=None):
+        """
+        Mandatory Arguments:
+        - address : the (host, port) to listen on, port 0 picks a free one
+
+        Optional Keyword Arguments:
+        - username / password : the credentials accepted by auth.login
+        - latency : seconds added to every call, to mimic a remote daemon
+        - jitter : up to this many more seconds, picked at random, added to every call
+        - modules : the number of canned modules per module type
+        - hosts : the number of hosts in the database, with 3 services each and a vuln every 4 hosts
+        - sessions : the number of open sessions, alternately meterpreter and shell
+        - session_lines : lines of output per session command, for chatty sessions
+        - command_delay : seconds before a session command's output can be read
+        - console_delay : the same for console commands, by default command_delay
+        - payload_size : the bytes module.execute returns for payload modules
+        """
+        super().__init__(address, StubRpcHandler)
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.modules = modules
+        self.hosts = hosts
+        self.session_lines = session_lines
+        self.command_delay = command_delay
+        self.console_delay = command_delay if console_delay is None else console_delay
+        self.payload_size = payload_size
+        self.jobs = 0
+        self.running_jobs = {}
+        self.sessions = {}
+        self.session_output = {}
+        self.workspaces = ['default']
+        self.current_workspace = 'default'
+        self._tables = {}
+        self.consoles = {}
+        self.tokens = set()
+        self.calls = {}
+        self._lock = threading.Lock()
+        for _ in range(sessions):
+            self.open_session()
+        self.methods = {
+            'auth.login': self.auth_login,
+            'auth.logout': self.auth_token_remove,
+            'auth.token_add': self.auth_token_add,
+            'auth.token_remove': self.auth_token_remove,
+            'auth.token_list': self.auth_token_list,
+            'core.version': self.core_version,
+            'core.module_stats': self.core_module_stats,
+            'module.exploits': self.module_list('exploit'),
+            'module.auxiliary': self.module_list('auxiliary'),
+            'module.post': self.module_list('post'),
+            'module.payloads': self.module_list('payload'),
+            'module.encoders': self.module_list('encoder'),
+            'module.nops': self.module_list('nop'),
+            'module.info': self.module_info,
+            'module.options': self.module_options,
+            'module.search': self.module_search,
+            'module.execute': self.module_execute,
+            'module.target_compatible_payloads': self.module_target_compatible_payloads,
+            'module.compatible_payloads': self.module_compatible_payloads,
+            'module.check': self.module_check,
+            'job.list': self.job_list,
+            'job.info': self.job_info,
+            'job.stop': self.job_stop,
+            'plugin.loaded': self.plugin_loaded,
+            'db.workspaces': self.db_workspaces,
+            'db.current_workspace': self.db_current_workspace,
+            'db.set_workspace': self.db_set_workspace,
+            'db.add_workspace': self.db_add_workspace,
+            'db.del_workspace': self.db_del_workspace,
+            'db.hosts': self.db_table('hosts'),
+            'db.services': self.db_table('services'),
+            'db.vulns': self.db_table('vulns'),
+            'db.import_data': self.db_import_data,
+            'console.list': self.console_list,
+            'console.create': self.console_create,
+            'console.destroy': self.console_destroy,
+            'console.write': self.console_write,
+            'console.read': self.console_read,
+            'session.list': self.session_list,
+            'session.stop': self.session_stop,
+            'session.meterpreter_write': self.session_write,
+            'session.meterpreter_read': self.session_read,
+            'session.shell_write': self.session_write,
+            'session.shell_read': self.session_read,
+        }
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def dispatch(self, method, args):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if method != 'auth.login':
+            if not args or args[0] not in self.tokens:
+                return rpc_error('Invalid Authentication Token', code=401)
+            args = args[1:]
+        handler = self.methods.get(method)
+        if handler is None:
+            return rpc_error('Unknown API Call: %s' % method)
+        return handler(*args)
+
+    def auth_login(self, username, password):
+        if (username, password) != (self.username, self.password):
+            return rpc_error('Login Failed', code=401)
+        token = 'TEMP' + uuid.uuid4().hex[:28]
+        self.tokens.add(token)
+        return {'result': 'success', 'token': token}
+
+    def auth_token_add(self, token):
+        self.tokens.add(token)
+        return {'result': 'success'}
+
+    def auth_token_remove(self, token):
+        self.tokens.discard(token)
+        return {'result': 'success'}
+
+    def auth_token_list(self):
+        return {'tokens': sorted(self.tokens)}
+
+    def core_version(self):
+        return {'version': '6.4.0-stub', 'ruby': '3.2.2', 'api': '1.0'}
+
+    def core_module_stats(self):
+        return {key: self.modules for key in ('exploits', 'auxiliary', 'post', 'payloads', 'encoders', 'nops')}
+
+    def module_list(self, mtype):
+        def handler():
+            return {'modules': ['%s/stub/module_%05d' % (mtype, i) for i in range(self.modules)]}
+        return handler
+
+    def module_info(self, mtype, mname):
+        return {
+            'type': mtype,
+            'name': mname.rsplit('/', 1)[-1].replace('_', ' ').title(),
+            'fullname': '%s/%s' % (mtype, mname),
+            'rank': 'excellent',
+            'disclosuredate': '2017-03-14',
+            'description': 'Canned description of %s.' % mname,
+            'license': 'Metasploit Framework License (BSD)',
+            'filepath': '/opt/metasploit-framework/modules/%ss/%s.rb' % (mtype, mname),
+            'arch': ['x86', 'x64'],
+            'platform': ['windows'],
+            'authors': ['stub'],
+            'privileged': False,
+            'check': True,
+            'references': [['CVE', '2017-0144'], ['URL', 'https://example.invalid/%s' % mname]],
+            'targets': {0: 'Automatic'},
+            'default_target': 0,
+            'stance': 'aggressive',
+            'options': ['RHOSTS', 'RPORT'],
+        }
+
+    def module_options(self, mtype, mname):
+        def option(otype, required, default=None, desc=''):
+            opt = {'type': otype, 'required': required, 'advanced': False, 'evasion': False, 'desc': desc}
+            if default is not None:
+                opt['default'] = default
+            return opt
+        if mtype == 'payload':
+            return {
+                'LHOST': option('address', True, desc='The listen address'),
+                'LPORT': option('port', True, 4444, 'The listen port'),
+                'VERBOSE': option('bool', False, False, 'Enable detailed status messages'),
+            }
+        return {
+            'RHOSTS': option('rhosts', True, desc='The target host(s)'),
+            'RPORT': option('port', True, 445, 'The target port (TCP)'),
+            'VERBOSE': option('bool', False, False, 'Enable detailed status messages'),
+        }
+
+    def module_execute(self, mtype, mname, opts):
+        if mtype == 'payload':
+            # Bytes that are not valid UTF-8, like a real executable
+            block = bytes(range(128, 256)) + uuid.uuid4().bytes * 8
+            return {'payload': (block * (self.payload_size // len(block) + 1))[:self.payload_size]}
+        return self.start_job('%s/%s' % (mtype, mname))
+
+    def start_job(self, name):
+        with self._lock:
+            self.jobs += 1
+            self.running_jobs[str(self.jobs)] = {'jid': self.jobs, 'name': name, 'start_time': int(time.time()),
+                                                 'datastore': {}}
+            return {'job_id': self.jobs, 'uuid': uuid.uuid4().hex[:8]}
+
+    def module_target_compatible_payloads(self, mname, target):
+        return {'payloads': self.module_list('payload')()['modules']}
+
+    def module_compatible_payloads(self, mname):
+        return {'payloads': self.module_list('payload')()['modules']}
+
+    def module_check(self, mtype, mname, opts):
+        return self.start_job('%s/%s (check)' % (mtype, mname))
+
+    def job_list(self):
+        with self._lock:
+            return {jid: job['name'] for jid, job in self.running_jobs.items()}
+
+    def job_info(self, jid):
+        job = self.running_jobs.get(str(jid))
+        return job if job is not None else rpc_error('Invalid Job')
+
+    def job_stop(self, jid):
+        with self._lock:
+            if self.running_jobs.pop(str(jid), None) is None:
+                return rpc_error('Invalid Job')
+        return {'result': 'success'}
+
+    def plugin_loaded(self):
+        return {'plugins': []}
+
+    def db_workspaces(self):
+        return {'workspaces': [{'id': i + 1, 'name': name, 'created_at': 1700000000, 'updated_at': 1700000000}
+                               for i, name in enumerate(self.workspaces)]}
+
+    def db_current_workspace(self):
+        return {'workspace': self.current_workspace, 'workspace_id': self.workspaces.index(self.current_workspace) + 1}
+
+    def db_set_workspace(self, name):
+        if name not in self.workspaces:
+            return {'result': 'failed'}
+        self.current_workspace = name
+        return {'result': 'success'}
+
+    def db_add_workspace(self, name):
+        with self._lock:
+            if name not in self.workspaces:
+                self.workspaces.append(name)
+        return {'result': 'success'}
+
+    def db_del_workspace(self, name):
+        with self._lock:
+            if name in self.workspaces and name != 'default':
+                self.workspaces.remove(name)
+                if self.current_workspace == name:
+                    self.current_workspace = 'default'
+        return {'result': 'success'}
+
+    def db_import_data(self, opts):
+        return {'result': 'success'}
+
+    def db_table(self, table):
+        def handler(opts=None):
+            # Built once per size: building them dominates otherwise
+            key = (table, self.hosts)
+            if key not in self._tables:
+                self._tables[key] = getattr(self, '_%s' % table)()
+            return {table: self._tables[key]}
+        return handler
+
+    def _hosts(self):
+        rnd = random.Random(0)
+        return [{
+            'created_at': 1700000000 + i, 'address': '10.%d.%d.%d' % (i // 65536 % 256, i // 256 % 256, i % 256),
+            'mac': '00:11:22:%02x:%02x:%02x' % (i // 65536 % 256, i // 256 % 256, i % 256), 'name': 'host-%d' % i,
+            'state': 'alive', 'os_name': rnd.choice(['Windows', 'Linux', 'FreeBSD']), 'os_flavor': '', 'os_sp': '',
+            'os_lang': '', 'updated_at': 1700000000 + i, 'purpose': rnd.choice(['server', 'client', 'device']),
+            'info': '',
+        } for i in range(self.hosts)]
+
+    def _services(self):
+        services = []
+        for host in self._hosts():
+            for port, name in ((22, 'ssh'), (80, 'http'), (445, 'smb')):
+                services.append({'host': host['address'], 'created_at': host['created_at'], 'updated_at':
+                                 host['updated_at'], 'port': port, 'proto': 'tcp', 'state': 'open', 'name': name,
+                                 'info': '%s service on %s' % (name, host['name'])})
+        return services
+
+    def _vulns(self):
+        return [{'port': 445, 'proto': 'tcp', 'time': host['created_at'], 'host': host['address'],
+                 'name': 'MS17-010 SMB RCE', 'refs': 'CVE-2017-0144,MSB-MS17-010'}
+                for host in self._hosts()[::4]]
+
+    def module_search(self, query):
+        terms = query.lower().split()
+        found = []
+        for mtype in ('exploit', 'auxiliary', 'post', 'payload', 'encoder', 'nop'):
+            for i in range(self.modules):
+                mname = '%s/stub/module_%05d' % (mtype, i)
+                if all(term in mname for term in terms):
+                    info = self.module_info(mtype, mname)
+                    found.append({k: info[k] for k in ('type', 'name', 'fullname', 'rank', 'disclosuredate')})
+        return found
+
+    @staticmethod
+    def session_info(stype, platform):
+        return {
+            'type': stype,
+            'tunnel_local': '10.0.0.1:4444',
+            'tunnel_peer': '10.0.0.2:49152',
+            'via_exploit': 'exploit/multi/handler',
+            'via_payload': 'payload/windows/meterpreter/reverse_tcp',
+            'desc': 'Meterpreter' if stype == 'meterpreter' else 'Command shell',
+            'info': 'NT AUTHORITY\\SYSTEM @ STUB',
+            'workspace': 'default',
+            'session_host': '10.0.0.2',
+            'session_port': 49152,
+            'target_host': '10.0.0.2',
+            'username': 'msf',
+            'uuid': uuid.uuid4().hex[:8],
+            'exploit_uuid': uuid.uuid4().hex[:8],
+            'routes': '',
+            'arch': 'x86',
+            'platform': platform,
+        }
+
+    def open_session(self, stype=None):
+        """
+        Add a session, alternately meterpreter and shell unless stype is given. Returns its id.
+        """
+        with self._lock:
+            sid = max(self.sessions, default=0) + 1
+            stype = stype or ('meterpreter' if sid % 2 else 'shell')
+            self.sessions[sid] = self.session_info(stype, 'x86/windows' if stype == 'meterpreter' else 'windows')
+            self.session_output[sid] = []
+        return sid
+
+    def session_list(self):
+        with self._lock:
+            return dict(self.sessions)
+
+    def session_stop(self, sid):
+        with self._lock:
+            if self.sessions.pop(int(sid), None) is None:
+                return rpc_error('Unknown Session ID %s' % sid)
+            self.session_output.pop(int(sid), None)
+        return {'result': 'success'}
+
+    def session_write(self, sid, data):
+        sid = int(sid)
+        if sid not in self.sessions:
+            return rpc_error('Unknown Session ID %s' % sid)
+        # Output shows up command_delay seconds later, session_lines lines over two reads like a slow command
+        ready = time.monotonic() + self.command_delay
+        command = data.strip()
+        lines = ''.join('output %d of %s\n' % (i, command) for i in range(max(1, self.session_lines - 1)))
+        with self._lock:
+            self.session_output[sid].append((ready, lines))
+            self.session_output[sid].append((ready + self.command_delay, '[+] %s done\n' % command))
+        return {'result': 'success'}
+
+    def session_read(self, sid):
+        sid = int(sid)
+        if sid not in self.sessions:
+            return rpc_error('Unknown Session ID %s' % sid)
+        now = time.monotonic()
+        with self._lock:
+            queue = self.session_output[sid]
+            ready = [data for at, data in queue if at <= now]
+            self.session_output[sid] = [(at, data) for at, data in queue if at > now]
+        return {'data': ''.join(ready)}
+
+    def console_list(self):
+        now = time.monotonic()
+        with self._lock:
+            return {'consoles': [{'id': cid, 'prompt': 'msf6 > ', 'busy': c['busy_until'] > now}
+                                 for cid, c in self.consoles.items()]}
+
+    def console_create(self):
+        with self._lock:
+            cid = str(len(self.consoles))
+            while cid in self.consoles:
+                cid = str(int(cid) + 1)
+            self.consoles[cid] = {'busy_until': 0.0, 'output': []}
+        return {'id': cid, 'prompt': 'msf6 > ', 'busy': False}
+
+    def console_destroy(self, cid):
+        with self._lock:
+            if self.consoles.pop(cid, None) is None:
+                return {'result': 'failure'}
+        return {'result': 'success'}
+
+    def console_write(self, cid, data):
+        # Each command keeps the console busy for two console_delay steps, printing a line after each
+        now = time.monotonic()
+        command = data.strip()
+        with self._lock:
+            console = self.consoles.get(cid)
+            if console is None:
+                return {'result': 'failure'}
+            start = max(now, console['busy_until'])
+            console['output'].append((start + self.console_delay, '[*] running %s\n' % command))
+            console['output'].append((start + 2 * self.console_delay, '[*] %s completed\n' % command))
+            console['busy_until'] = start + 2 * self.console_delay
+        return {'wrote': len(data)}
+
+    def console_read(self, cid):
+        now = time.monotonic()
+        with self._lock:
+            console = self.consoles.get(cid)
+            if console is None:
+                return {'result': 'failure'}
+            ready = [data for at, data in console['output'] if at <= now]
+            console['output'] = [(at, data) for at, data in console['output'] if at > now]
+            busy = console['busy_until'] > now
+        return {'data': ''.join(ready), 'prompt': 'msf6 > ', 'busy': busy}
+
+    def use_tls(self, certfile, keyfile=None):
+        """
+        Serve over TLS, so the benchmarks pay the handshake like an ssl=True msfrpcd.
+        """
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        return self
+
+    def serve_in_thread(self):
+        """
+        Serve requests from a daemon thread and return the server.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local msgpack-RPC stand-in for msfrpcd.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=55553)
+    parser.add_argument('--username', default='msf')
+    parser.add_argument('--password', default='msf')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds, at random')
+    parser.add_argument('--modules', type=int, default=100, help='canned modules per module type')
+    parser.add_argument('--hosts', type=int, default=1000, help='hosts in the database')
+    parser.add_argument('--sessions', type=int, default=2, help='open sessions')
+    parser.add_argument('--session-lines', type=int, default=2, help='lines of output per session command')
+    parser.add_argument('--command-delay', type=float, default=0.05, help='seconds before session output appears')
+    parser.add_argument('--console-delay', type=float, help='seconds before console output appears')
+    parser.add_argument('--payload-size', type=int, default=1048576, help='bytes returned for generated payloads')
+    parser.add_argument('--certfile', help='serve over TLS with this certificate')
+    parser.add_argument('--keyfile', help='private key for --certfile')
+    args = parser.parse_args()
+
+    server = StubMsfRpcServer((args.host, args.port), args.username, args.password, args.latency, args.modules,
+                              command_delay=args.command_delay, payload_size=args.payload_size, jitter=args.jitter,
+                              hosts=args.hosts, sessions=args.sessions, session_lines=args.session_lines,
+                              console_delay=args.console_delay)
+    if args.certfile:
+        server.use_tls(args.certfile, args.keyfile)
+    print('stub msfrpcd listening on %s:%d' % (args.host, server.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -30,11 +30,17 @@ logging.basicConfig(
 load_dotenv()
 
 def main():
-    """Run the MCP server."""
+    """Run the MCP server.
+
+    MCP_TRANSPORT=sse serves several clients at once over HTTP, on FASTMCP_HOST (default 127.0.0.1)
+    and FASTMCP_PORT (default 8000), instead of a single client on stdio.
+    """
     # logger.info("Starting Metasploit MCP server...")
-    import asyncio
-    
-    asyncio.run(mcp.run(transport='stdio'))
+    transport = os.environ.get('MCP_TRANSPORT', 'stdio')
+    if 'FASTMCP_HOST' not in os.environ:
+        # FastMCP listens on every interface by default
+        mcp.settings.host = '127.0.0.1'
+    mcp.run(transport=transport)
 
 if __name__ == "__main__":
     # Run the MCP server
@@ -2,7 +2,8 @@ import asyncio
 import os
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
-from tools import modules, sessions, console, jobs, exploits, database, execute
+from tools import modules, sessions, console, jobs, exploits, database, execute, diagnostics
+from utils.msf_utils import lifespan
 
 load_dotenv()  # Load environment variables
 
@@ -11,8 +12,10 @@ mcp = FastMCP(
     "metasploit-mcp-server",
     description="An MCP server for interacting with the Metasploit Framework.",
     dependencies=["pymetasploit3>=1.0.6"],
-    log_level="DEBUG",
-    debug=True
+    # Every RPC is logged at DEBUG, which costs more than the RPC itself under load
+    log_level=os.environ.get('FASTMCP_LOG_LEVEL', 'DEBUG'),
+    debug=True,
+    lifespan=lifespan
 )
 
 # Add module management tools
@@ -58,7 +61,7 @@ mcp.add_tool(
 mcp.add_tool(
     sessions.session_shell_read,
     name="session_shell_read",
-    description="Read output from a shell session. Required arg: session_id (integer). Returns the session output buffer."
+    description="Read output from a shell session. Required arg: session_id (integer). Optional arg: seq, the seq returned by an earlier read, to resume from there without losing output read by other calls. Returns the output (data) and the seq to resume from."
 )
 mcp.add_tool(
     sessions.session_shell_write,
@@ -68,7 +71,7 @@ mcp.add_tool(
 mcp.add_tool(
     sessions.session_meterpreter_read,
     name="session_meterpreter_read",
-    description="Read output from a Meterpreter session. Required arg: session_id (integer). Returns the session output buffer."
+    description="Read output from a Meterpreter session. Required arg: session_id (integer). Optional arg: seq, the seq returned by an earlier read, to resume from there without losing output read by other calls. Returns the output (data) and the seq to resume from."
 )
 mcp.add_tool(
     sessions.session_meterpreter_write,
@@ -95,7 +98,7 @@ mcp.add_tool(
 mcp.add_tool(
     console.destroy_console,
     name="destroy_console",
-    description="Destroy a Metasploit console. Required arg: console_id (string). Frees up resources by closing the console."
+    description="Destroy a Metasploit console. Required arg: console_id (integer or string). Frees up resources by closing the console."
 )
 mcp.add_tool(
     console.list_consoles,
@@ -105,17 +108,17 @@ mcp.add_tool(
 mcp.add_tool(
     console.console_write,
     name="console_write",
-    description="Write a command to a Metasploit console. Required args: console_id (string) and command (string). Use console_read to get output."
+    description="Write a command to a Metasploit console. Required args: console_id (integer or string) and command (string). Use console_read to get output."
 )
 mcp.add_tool(
     console.console_read,
     name="console_read",
-    description="Read output from a Metasploit console. Required arg: console_id (string). Returns console output buffer and prompt status."
+    description="Read output from a Metasploit console. Required arg: console_id (integer or string). Returns console output buffer and prompt status."
 )
 mcp.add_tool(
     console.run_console_command,
     name="run_console_command",
-    description="Run a command in a console and get the output. Required arg: command (string). Creates temporary console, runs command, and returns output."
+    description="Run a command in a console and get the output. Required arg: command (string). Optional args: console_id (integer or string) to run it in an existing console, otherwise a ready console from the pool is used; timeout (integer, seconds, default 30)."
 )
 
 # Add job management tools
@@ -151,6 +154,11 @@ mcp.add_tool(
     name="list_compatible_payloads",
     description="List all payloads compatible with a specific exploit module. Required arg: module_name. Returns list of compatible payload names and descriptions."
 )
+mcp.add_tool(
+    exploits.generate_payload,
+    name="generate_payload",
+    description="Generate a payload and save it to a file on the server. Required arg: payload (e.g. 'windows/x64/meterpreter/reverse_tcp'). Optional args: options (dict, e.g. LHOST/LPORT), format (string, e.g. 'exe', 'elf', 'raw'; default 'raw'), preview_bytes (integer). Returns the file path, size and sha256 rather than the payload bytes."
+)
 mcp.add_tool(
     exploits.get_module_options,
     name="get_module_options",
@@ -199,4 +207,11 @@ mcp.add_tool(
     description="Import scan results into the database. Required args: file_path (string) and file_type (e.g., 'nmap', 'nessus'). Supports various scan file formats."
 )
 
+# Add diagnostics tools
+mcp.add_tool(
+    diagnostics.rpc_stats,
+    name="rpc_stats",
+    description="Show per-method Metasploit RPC metrics: call counts, errors, retries, p50/p95/p99 latency, bytes sent and received, and time spent encoding, on HTTP, decoding and converting. Also reports event loop lag, the retry/circuit breaker state, cache hit rates, the console pool and session registry. Optional args: format ('json' or 'prometheus'; default 'json'), reset (boolean) to clear the call metrics and lag samples after reading them."
+)
+
 # Note: The server is run from main.py, not from here
\ No newline at end of file
@@ -3,20 +3,37 @@
 from numbers import Number
 from pymetasploit3.utils import *
 import requests
+import requests.adapters
 import uuid
 import time
-import re
-import random
+import threading
+import contextvars
+import os
+import tempfile
 import msgpack
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import requests.packages.urllib3
-from retry import retry
+from urllib3.exceptions import NewConnectionError
+from utils.decoding import decode_response, SpooledResponse
+from utils.module_cache import ModuleCache
+from utils.pattern_matcher import MultiPatternMatcher
+from utils.response_cache import ResponseCache
+from utils.retry_policy import RetryPolicy
+from utils.rpc_metrics import RpcMetrics
+from utils.session_buffer import SessionOutputBuffer
+from utils.singleflight import Singleflight
+from utils.tracing import record_span, span
 requests.packages.urllib3.disable_warnings()
 
 __all__ = [
     'MsfRpcError',
+    'MsfRpcUnavailableError',
+    'SessionRegistry',
     'MsfRpcMethod',
     'MsfPlugins',
     'MsfRpcClient',
+    'MsfRpcBatch',
     'MsfTable',
     'NotesTable',
     'LootsTable',
@@ -42,6 +59,7 @@ __all__ = [
     'PayloadModule',
     'NopModule',
     'ModuleManager',
+    'SessionOutputStream',
     'MsfSession',
     'MeterpreterSession',
     'ShellSession',
@@ -189,9 +207,44 @@ class MsfAuthError(MsfError):
         self.msg = msg
 
 
+class MsfRpcUnavailableError(MsfRpcError):
+    pass
+
+
 class MsfRpcClient(object):
 
     def __init__(self, password, **kwargs):
+        """
+        Initializes the msfrpc client and logs in unless a token is given.
+
+        Mandatory Arguments:
+        - password : the password used to login to msfrpcd
+
+        Optional Keyword Arguments:
+        - username : the username used to authenticate to msfrpcd (default: msf)
+        - uri : the msfrpcd URI (default: /api/)
+        - port : the remote msfrpcd port to connect to (default: 55553)
+        - server : the remote server IP address hosting msfrpcd (default: 127.0.0.1)
+        - ssl : if true uses SSL else regular HTTP (default: False)
+        - token : an existing API token, skips the login
+        - pool_size : the maximum number of keep-alive connections kept open to msfrpcd (default: 10)
+        - timeout : default per-call timeout in seconds, either a number or a (connect, read) tuple (default: None)
+        - module_cache : a ModuleCache for module metadata, can be shared between clients (default: a new one)
+        - session_buffer_size : characters of output kept per session for resumable reads (default: 1048576)
+        - auth_check_interval : seconds without a successful call after which ensure_auth() checks
+                                the token is still valid (default: 300)
+        - token_manager : notified of every permanent token the client adds, and supplies them (default: None)
+        - retry_policy : the RetryPolicy for failed requests, can be shared between clients (default: a new one)
+        - coalesce : merge concurrent identical read-only calls into one request (default: True)
+        - response_cache : the ResponseCache for list calls, can be shared between clients,
+                           None disables it (default: a new one)
+        - session_refresh_interval : seconds between refreshes of the session registry once it is
+                                     started (default: 2)
+        - fast_decode : decode strings while unpacking responses instead of converting them
+                        afterwards, see decode_response (default: True)
+        - metrics : the RpcMetrics to record calls in, can be shared between clients (default: a new one)
+        - cassette : a Cassette to record every call and its response in, for replaying them (default: None)
+        """
         self.uri = kwargs.get('uri', '/api/')
         self.port = kwargs.get('port', 55553)
         self.host = kwargs.get('server', '127.0.0.1')
@@ -199,40 +252,267 @@ class MsfRpcClient(object):
         self.token = kwargs.get('token')
         self.encodings = kwargs.get('encodings', ['utf-8'])
         self.decode_error_handling: str = kwargs.get('decode_error_handling', 'strict')
+        self.fast_decode = kwargs.get('fast_decode', True)
+        self.pool_size = kwargs.get('pool_size', 10)
+        self.timeout = kwargs.get('timeout')
+        self.module_cache = kwargs.get('module_cache') or ModuleCache()
+        self.session_buffer_size = kwargs.get('session_buffer_size', 1048576)
+        self.auth_check_interval = kwargs.get('auth_check_interval', 300)
+        self.token_manager = kwargs.get('token_manager')
+        self.retry_policy = kwargs.get('retry_policy') or RetryPolicy()
+        self.singleflight = Singleflight() if kwargs.get('coalesce', True) else None
+        self.metrics = kwargs.get('metrics') or RpcMetrics()
+        self.cassette = kwargs.get('cassette')
+        self.response_cache = kwargs['response_cache'] if 'response_cache' in kwargs else ResponseCache()
         self.headers = {"Content-type": "binary/message-pack"}
+        self._session_buffers = {}
+        self.session_registry = SessionRegistry(self, interval=kwargs.get('session_refresh_interval', 2.0))
+        self._http = self._http_session()
+        self._executor = None
+        self._username = kwargs.get('username', 'msf')
+        self._password = password
+        self._login_lock = threading.Lock()
+        self._auth_checked = 0.0
         if self.token is None:
-            self.login(kwargs.get('username', 'msf'), password)
+            self.login(self._username, password)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-    def call(self, method, opts=None, is_raw=False):
+    @property
+    def url(self):
+        """
+        The msfrpcd API endpoint.
+        """
+        if self.ssl is True:
+            return "https://%s:%s%s" % (self.host, self.port, self.uri)
+        return "http://%s:%s%s" % (self.host, self.port, self.uri)
+
+    def _http_session(self):
+        """
+        Build the keep-alive HTTP session shared by every call of this client.
+        """
+        http = requests.Session()
+        http.headers.update(self.headers)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        http.mount('http://', adapter)
+        http.mount('https://', adapter)
+        return http
+
+    def call(self, method, opts=None, is_raw=False, timeout=None):
+        """
+        Call an msfrpcd method.
+
+        Mandatory Arguments:
+        - method : the RPC method name (see MsfRpcMethod)
+
+        Optional Keyword Arguments:
+        - opts : the list of method arguments
+        - is_raw : return the undecoded response body
+        - timeout : the timeout for this call, overrides the client default
+        """
         if not isinstance(opts, list):
             opts = []
-        if method != 'auth.login':
-            if self.token is None:
-                raise MsfAuthError("MsfRPC: Not Authenticated")
+        started = time.perf_counter()
+        error = True
+        try:
+            if method == MsfRpcMethod.AuthLogin:
+                with self.metrics.measure(method, 'encode'):
+                    payload = encode([method] + opts)
+                r = self.post_request(self.url, payload, timeout=timeout, method=method)
+            elif self.response_cache is not None and self.response_cache.caches(method):
+                key = encode(opts)
+                r = self.response_cache.get(method, key)
+                if r is None:
+                    generation = self.response_cache.generation
+                    r = self._fetch(method, opts, timeout)
+                    if r.status_code == 200:
+                        self.response_cache.put(method, key, r, generation)
+            else:
+                try:
+                    r = self._fetch(method, opts, timeout)
+                finally:
+                    if self.response_cache is not None:
+                        self.response_cache.invalidate(method)
 
-        if method != "auth.login":
-            opts.insert(0, self.token)
+            if method in ModuleCache.invalidated_by:
+                self.module_cache.clear()
 
-        if self.ssl is True:
-            url = "https://%s:%s%s" % (self.host, self.port, self.uri)
-        else:
-            url = "http://%s:%s%s" % (self.host, self.port, self.uri)
+            error = r.status_code != 200
+            if is_raw:
+                return r.content
 
-        opts.insert(0, method)
-        payload = encode(opts)
+            if self.fast_decode:
+                with self.metrics.measure(method, 'decode'):
+                    return decode_response(r.content, self.encodings, self.decode_error_handling)
+            with self.metrics.measure(method, 'decode'):
+                data = decode(r.content)
+            with self.metrics.measure(method, 'convert'):
+                return convert(data, self.encodings, self.decode_error_handling)  # convert all keys/vals to utf8
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.observe(method, elapsed, error)
+            record_span(method, elapsed, error, **{'rpc.method': method})
 
-        r = self.post_request(url, payload)
+    def _fetch(self, method, opts, timeout):
+        """
+        Send an authenticated call, sharing the response of an identical read-only call in flight.
+        """
+        if self.singleflight is not None and method in Singleflight.coalescible:
+            return self.singleflight.do((method, encode(opts)), lambda: self._request(method, opts, timeout))
+        return self._request(method, opts, timeout)
 
-        opts[:] = []  # Clear opts list
+    def call_spooled(self, method, opts=None, timeout=None, spill_threshold=65536, directory=None):
+        """
+        Call an msfrpcd method and spool its response to a temporary file as it arrives instead of
+        holding it in memory. Returns a SpooledResponse, which the caller closes to delete the file.
 
-        if is_raw:
-            return r.content
+        Mandatory Arguments:
+        - method : the RPC method name (see MsfRpcMethod)
 
-        return convert(decode(r.content), self.encodings, self.decode_error_handling)  # convert all keys/vals to utf8
+        Optional Keyword Arguments:
+        - opts : the list of method arguments
+        - timeout : the timeout for this call, overrides the client default
+        - spill_threshold : fields larger than this many bytes are left in the file (default: 65536)
+        - directory : where to create the file (default: the system temporary directory)
+        """
+        if not isinstance(opts, list):
+            opts = []
+        started = time.perf_counter()
+        error = True
+        try:
+            try:
+                r = self._request(method, opts, timeout, stream=True)
+            finally:
+                if self.response_cache is not None:
+                    self.response_cache.invalidate(method)
+            fd, path = tempfile.mkstemp(prefix='msfrpc-', suffix='.msgpack', dir=directory)
+            received = 0
+            try:
+                with self.metrics.measure(method, 'http'), os.fdopen(fd, 'wb') as f:
+                    for chunk in r.iter_content(65536):
+                        received += len(chunk)
+                        f.write(chunk)
+            except BaseException:
+                os.unlink(path)
+                raise
+            finally:
+                r.close()
+                self.metrics.transferred(method, received=received)
+            error = r.status_code != 200
+            if self.cassette is not None:
+                with open(path, 'rb') as f:
+                    self.cassette.record(method, opts, r.status_code, f.read(), time.perf_counter() - started)
+            with self.metrics.measure(method, 'decode'):
+                return SpooledResponse(path, self.encodings, self.decode_error_handling, spill_threshold)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.observe(method, elapsed, error)
+            record_span(method, elapsed, error, **{'rpc.method': method})
+
+    def _request(self, method, opts, timeout, stream=False):
+        """
+        Send an authenticated call, logging in again once if msfrpcd rejects the token.
+        """
+        token = self.token
+        if token is None:
+            raise MsfAuthError("MsfRPC: Not Authenticated")
+        with self.metrics.measure(method, 'encode'):
+            payload = encode([method, token] + opts)
+        sent = time.perf_counter()
+        r = self.post_request(self.url, payload, timeout=timeout, method=method, stream=stream)
+        if r.status_code == 401 and self._password is not None:
+            # The token expired or was removed from msfrpcd: log in again and retry once
+            r.close()
+            self._relogin(token)
+            with self.metrics.measure(method, 'encode'):
+                payload = encode([method, self.token] + opts)
+            sent = time.perf_counter()
+            r = self.post_request(self.url, payload, timeout=timeout, method=method, stream=stream)
+            if r.status_code == 401:
+                r.close()
+                raise MsfAuthError("MsfRPC: Authentication failed: msfrpcd rejected the new token")
+        if r.status_code != 401:
+            self._auth_checked = time.monotonic()
+        if self.cassette is not None and not stream:
+            self.cassette.record(method, opts, r.status_code, r.content, time.perf_counter() - sent)
+        return r
+
+    def post_request(self, url, payload, timeout=None, method=None, stream=False):
+        """
+        POST a request to msfrpcd, retrying failures as the retry policy allows. With stream the
+        body is left to be read from the response.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        policy = self.retry_policy
+        started = time.monotonic()
+        attempt = 0
+        with self.metrics.measure(method, 'http'):
+            while True:
+                if not policy.before_attempt(method):
+                    raise MsfRpcUnavailableError(policy.unavailable(method))
+                self.metrics.transferred(method, sent=len(payload))
+                try:
+                    r = self._http.post(url, data=payload, verify=False, timeout=timeout, stream=stream)
+                except requests.exceptions.RequestException as e:
+                    # Refused or timed out connections never reached msfrpcd
+                    sent = not (isinstance(e, requests.exceptions.ConnectTimeout) or
+                                isinstance(getattr(e.args[0] if e.args else None, 'reason', None), NewConnectionError))
+                    delay = policy.on_failure(method, sent, attempt, started)
+                    if delay is None:
+                        raise
+                    self.metrics.retried(method)
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                except BaseException:
+                    policy.on_abort()
+                    raise
+                policy.on_success()
+                if not stream:
+                    self.metrics.transferred(method, received=len(r.content))
+                return r
+
+    def batch(self):
+        """
+        Returns an MsfRpcBatch: calls queued on it are sent concurrently when the with block exits.
+        """
+        return MsfRpcBatch(self)
+
+    def session_buffer(self, sid):
+        """
+        Returns the SessionOutputBuffer recording everything read from a session.
 
-    @retry(tries=3, delay=1, backoff=2)
-    def post_request(self, url, payload):
-        return requests.post(url, data=payload, headers=self.headers, verify=False)
+        Mandatory Arguments:
+        - sid : the session identifier
+        """
+        sid = str(sid)
+        if sid not in self._session_buffers:
+            self._session_buffers[sid] = SessionOutputBuffer(self.session_buffer_size)
+        return self._session_buffers[sid]
+
+    @property
+    def executor(self):
+        """
+        The worker threads batches use, one per pooled connection.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='msfrpc')
+        return self._executor
+
+    def close(self):
+        """
+        Close the pooled connections to msfrpcd. The client reconnects on its next call.
+        """
+        self.session_registry.stop()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._http.close()
 
     def login(self, user, password):
         auth = self.call(MsfRpcMethod.AuthLogin, [user, password])
@@ -241,16 +521,36 @@ class MsfRpcClient(object):
                 self.token = auth['token']
                 token = self.add_perm_token()
                 self.token = token
+                # Drop the temporary login token rather than leave it to expire in msfrpcd
+                self.call(MsfRpcMethod.AuthLogout, [auth['token']])
                 return True
         except Exception:
             raise MsfAuthError("MsfRPC: Authentication failed")
 
+    def _relogin(self, failed_token):
+        with self._login_lock:
+            if self.token == failed_token:  # else a concurrent call already logged in again
+                self.login(self._username, self._password)
+
+    def ensure_auth(self):
+        """
+        If no call succeeded for auth_check_interval seconds, check the token with a core.version
+        call, which logs in again if it was rejected.
+        """
+        if time.monotonic() - self._auth_checked > self.auth_check_interval:
+            self.call(MsfRpcMethod.CoreVersion)
+
     def add_perm_token(self):
         """
         Add a permanent UUID4 API token
         """
-        token = str(uuid.uuid4())
+        if self.token_manager is not None:
+            token = self.token_manager.new_token()
+        else:
+            token = str(uuid.uuid4())
         self.call(MsfRpcMethod.AuthTokenAdd, [token])
+        if self.token_manager is not None:
+            self.token_manager.added(token)
         return token
 
     def logout(self):
@@ -323,6 +623,82 @@ class MsfRpcClient(object):
         return AuthManager(self)
 
 
+class MsfRpcBatch(object):
+
+    def __init__(self, rpc):
+        """
+        Queues independent RPCs and sends them concurrently over the client's connection pool.
+
+            with client.batch() as batch:
+                info = batch.call(MsfRpcMethod.ModuleInfo, ['exploit', name])
+                options = batch.call(MsfRpcMethod.ModuleOptions, ['exploit', name])
+            info.result(), options.result()
+
+        Each call gets its own Future, so one failed call does not affect the others.
+
+        Mandatory Arguments:
+        - rpc : the msfrpc client object.
+        """
+        self.rpc = rpc
+        self._calls = []
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+        else:
+            for future, _ in self._calls:
+                future.cancel()
+
+    def call(self, method, opts=None, is_raw=False, timeout=None):
+        """
+        Queue a call, see MsfRpcClient.call. Returns a Future holding its response or exception.
+        """
+        future = Future()
+        self._calls.append((future, (method, opts, is_raw, timeout)))
+        return future
+
+    def execute(self):
+        """
+        Send all queued calls concurrently and wait for them. Returns the futures in call order.
+        """
+        calls, self._calls = self._calls, []
+        if len(calls) == 1:
+            self._run(*calls[0])
+        else:
+            # Each worker runs in a copy of the caller's context, so its calls join the caller's trace
+            for done in [self.rpc.executor.submit(contextvars.copy_context().run, self._run, *c) for c in calls]:
+                done.result()
+        self._futures = [future for future, _ in calls]
+        return self._futures
+
+    def _run(self, future, args):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self.rpc.call(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    def results(self, return_exceptions=False):
+        """
+        The responses of the executed calls, in call order.
+
+        Optional Keyword Arguments:
+        - return_exceptions : put a failed call's exception in its slot instead of raising the first one.
+        """
+        results = []
+        for future in self._futures:
+            if return_exceptions and future.exception() is not None:
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+        return results
+
+
 class MsfTable(object):
 
     def __init__(self, rpc, wname):
@@ -410,7 +786,7 @@ class NotesTable(MsfTable):
         """
         kwargs.update({'data': data, 'type': rtype})
         kwargs.update(kwargs.pop('service', {}))
-        self.dbreport('note', kwargs)
+        return self.dbreport('note', kwargs)
 
     def delete(self, **kwargs):
         """
@@ -424,7 +800,7 @@ class NotesTable(MsfTable):
         - proto : the protocol associated with a Note.
         - ntype : the note type, e.g. 'smb_peer_os'.
         """
-        self.dbdel('note', kwargs)
+        return self.dbdel('note', kwargs)
 
     def get(self, **kwargs):
         """
@@ -482,7 +858,7 @@ class LootsTable(MsfTable):
         - data : the data within the Loot.
         """
         kwargs.update({'path': path, 'type': rtype})
-        self.dbreport('loot', kwargs)
+        return self.dbreport('loot', kwargs)
 
     update = report
 
@@ -542,7 +918,7 @@ class HostsTable(MsfTable):
         - virtual_host : the name of the VM host software, e.g. 'VMWare', 'QEMU', 'Xen', etc.
         """
         kwargs.update({'host': host})
-        self.dbreport('host', kwargs)
+        return self.dbreport('host', kwargs)
 
     def delete(self, **kwargs):
         """
@@ -555,7 +931,7 @@ class HostsTable(MsfTable):
         """
         if not any([i in kwargs for i in ('host', 'address', 'addresses')]):
             raise TypeError('Expected host, address, or addresses.')
-        self.dbdel('host', kwargs)
+        return self.dbdel('host', kwargs)
 
     def get(self, **kwargs):
         """
@@ -608,7 +984,7 @@ class ServicesTable(MsfTable):
         - sname : an alias for the above
         """
         kwargs.update({'host': host, 'port': port, 'proto': proto})
-        self.dbreport('service', kwargs)
+        return self.dbreport('service', kwargs)
 
     def delete(self, **kwargs):
         """
@@ -627,7 +1003,7 @@ class ServicesTable(MsfTable):
         if not any([i in kwargs for i in ('host', 'address', 'addresses')]) and \
                 not all([i in kwargs for i in ('proto', 'port')]):
             raise TypeError('Expected host or port/proto pair.')
-        self.dbdel('service', kwargs)
+        return self.dbdel('service', kwargs)
 
     def get(self, **kwargs):
         """
@@ -688,7 +1064,7 @@ class VulnsTable(MsfTable):
         - refs : an array of Ref objects or string names of references.
         """
         kwargs.update({'host': host, 'name': name})
-        self.dbreport('vuln', kwargs)
+        return self.dbreport('vuln', kwargs)
 
     def delete(self, **kwargs):
         """
@@ -701,7 +1077,7 @@ class VulnsTable(MsfTable):
         """
         if not any([i in kwargs for i in ('host', 'address', 'addresses')]):
             raise TypeError('Expected host, address, or addresses.')
-        self.dbdel('vuln', kwargs)
+        return self.dbdel('vuln', kwargs)
 
     def get(self, **kwargs):
         """
@@ -745,7 +1121,7 @@ class EventsTable(MsfTable):
         """
         if not any([i in kwargs for i in ('username', 'host')]):
             raise TypeError('Expected either username or host')
-        self.dbreport('vuln', kwargs)
+        return self.dbreport('vuln', kwargs)
 
     update = report
 
@@ -785,7 +1161,7 @@ class ClientsTable(MsfTable):
         Returns a Client.
         """
         kwargs.update({'host': host, 'ua_string': ua_string})
-        self.dbreport('client', kwargs)
+        return self.dbreport('client', kwargs)
 
     def delete(self, **kwargs):
         """
@@ -796,7 +1172,7 @@ class ClientsTable(MsfTable):
         - address : the address associated with a Note, not required if 'host' or 'addresses' is specified.
         - addresses : a list of addresses associated with Notes, not required if 'host' or 'address' is specified.
         """
-        self.dbdel('client', kwargs)
+        return self.dbdel('client', kwargs)
 
     def get(self, **kwargs):
         """
@@ -1258,7 +1634,7 @@ class CoreManager(MsfManager):
 
 class MsfModule(object):
 
-    def __init__(self, rpc, mtype, mname):
+    def __init__(self, rpc, mtype, mname, info=None, options=None):
         """
         Initializes an msf module object.
 
@@ -1266,18 +1642,32 @@ class MsfModule(object):
         - rpc : the msfrpc client object.
         - mtype : the module type (e.g. 'exploit')
         - mname : the module name (e.g. 'exploits/windows/http/icecast_header')
+
+        Optional Keyword Arguments:
+        - info : an already fetched module.info response, skips that RPC.
+        - options : an already fetched module.options response, skips that RPC.
         """
 
         self.moduletype = mtype
         self.modulename = mname
         self.rpc = rpc
-        self._info = rpc.call(MsfRpcMethod.ModuleInfo, [mtype, mname])
+        if info is None and options is None:
+            with rpc.batch() as batch:
+                batch.call(MsfRpcMethod.ModuleInfo, [mtype, mname])
+                batch.call(MsfRpcMethod.ModuleOptions, [mtype, mname])
+            info, options = batch.results()
+        if info is None:
+            info = rpc.call(MsfRpcMethod.ModuleInfo, [mtype, mname])
+        self._info = info
         property_attributes = ["advanced", "evasion", "options", "required", "runoptions"]
         for k in self._info:
-            if k not in property_attributes:
-                # don't try to set property attributes
+            if k not in property_attributes and not hasattr(type(self), k):
+                # don't try to set property attributes, nor shadow methods such as check()
+                # with the info key of the same name
                 setattr(self, k, self._info.get(k))
-        self._moptions = rpc.call(MsfRpcMethod.ModuleOptions, [mtype, mname])
+        if options is None:
+            options = rpc.call(MsfRpcMethod.ModuleOptions, [mtype, mname])
+        self._moptions = options
         self._roptions = []
         self._aoptions = []
         self._eoptions = []
@@ -1430,35 +1820,7 @@ class MsfModule(object):
         - payload : the payload of an exploit module (this is mandatory if the module is an exploit).
         - **kwargs : can contain any module options.
         """
-        runopts = self.runoptions.copy()
-        if isinstance(self, ExploitModule):
-            payload = kwargs.get('payload')
-            runopts['TARGET'] = self.target
-            if 'DisablePayloadHandler' in runopts and runopts['DisablePayloadHandler']:
-                pass
-            elif payload is None:
-                runopts['DisablePayloadHandler'] = True
-            else:
-                if isinstance(payload, PayloadModule):
-                    if payload.modulename not in self.payloads:
-                        raise ValueError(
-                            'Invalid payload (%s) for given target (%d).' % (payload.modulename, self.target)
-                        )
-                    runopts['PAYLOAD'] = payload.modulename
-                    for k, v in payload.runoptions.items():
-                        if v is None or (isinstance(v, str) and not v):
-                            continue
-                        if k not in runopts or runopts[k] is None or \
-                                (isinstance(runopts[k], str) and not runopts[k]):
-                            runopts[k] = v
-                #                    runopts.update(payload.runoptions)
-                elif isinstance(payload, str):
-                    if payload not in self.payloads:
-                        raise ValueError('Invalid payload (%s) for given target (%d).' % (payload, self.target))
-                    runopts['PAYLOAD'] = payload
-                else:
-                    raise TypeError("Expected type str or PayloadModule not '%s'" % type(kwargs['payload']).__name__)
-
+        runopts = self._payload_runoptions(kwargs.get('payload'))
         return self.rpc.call(MsfRpcMethod.ModuleExecute, [self.moduletype, self.modulename, runopts])
 
     def check(self, **kwargs):
@@ -1468,9 +1830,18 @@ class MsfModule(object):
         Optional Keyword Arguments:
         - **kwargs : can contain any module options.
         """
+        runopts = self._payload_runoptions(kwargs.get('payload'))
+        return self.rpc.call(MsfRpcMethod.ModuleCheck, [self.moduletype, self.modulename, runopts])
+
+    def _payload_runoptions(self, payload, payloads=None):
+        """
+        The run options for execute/check, with the exploit target and payload options merged in.
+
+        Optional Keyword Arguments:
+        - payloads : the payloads compatible with the current target, fetched only when needed if omitted.
+        """
         runopts = self.runoptions.copy()
         if isinstance(self, ExploitModule):
-            payload = kwargs.get('payload')
             runopts['TARGET'] = self.target
             if 'DisablePayloadHandler' in runopts and runopts['DisablePayloadHandler']:
                 pass
@@ -1478,7 +1849,9 @@ class MsfModule(object):
                 runopts['DisablePayloadHandler'] = True
             else:
                 if isinstance(payload, PayloadModule):
-                    if payload.modulename not in self.payloads:
+                    if payloads is None:
+                        payloads = self.payloads
+                    if payload.modulename not in payloads:
                         raise ValueError(
                             'Invalid payload (%s) for given target (%d).' % (payload.modulename, self.target)
                         )
@@ -1491,18 +1864,19 @@ class MsfModule(object):
                             runopts[k] = v
                 #                    runopts.update(payload.runoptions)
                 elif isinstance(payload, str):
-                    if payload not in self.payloads:
+                    if payloads is None:
+                        payloads = self.payloads
+                    if payload not in payloads:
                         raise ValueError('Invalid payload (%s) for given target (%d).' % (payload, self.target))
                     runopts['PAYLOAD'] = payload
                 else:
-                    raise TypeError("Expected type str or PayloadModule not '%s'" % type(kwargs['payload']).__name__)
-
-        return self.rpc.call(MsfRpcMethod.ModuleCheck, [self.moduletype, self.modulename, runopts])
+                    raise TypeError("Expected type str or PayloadModule not '%s'" % type(payload).__name__)
+        return runopts
 
 
 class ExploitModule(MsfModule):
 
-    def __init__(self, rpc, exploit):
+    def __init__(self, rpc, exploit, **kwargs):
         """
         Initializes the use of an exploit module.
 
@@ -1510,7 +1884,7 @@ class ExploitModule(MsfModule):
         - rpc : the rpc client used to communicate with msfrpcd
         - exploit : the name of the exploit module.
         """
-        super(ExploitModule, self).__init__(rpc, 'exploit', exploit)
+        super(ExploitModule, self).__init__(rpc, 'exploit', exploit, **kwargs)
         self._target = self._info.get('default_target', 0)
 
     @property
@@ -1546,7 +1920,11 @@ class ExploitModule(MsfModule):
         Optional Keyword Arguments:
         - t : the target ID (default: 0, e.g. 'Automatic')
         """
-        return self.rpc.call(MsfRpcMethod.ModuleTargetCompatiblePayloads, [self.modulename, t])['payloads']
+        payloads = self.rpc.module_cache.get('exploit', self.modulename, ('payloads', t))
+        if payloads is None:
+            payloads = self.rpc.call(MsfRpcMethod.ModuleTargetCompatiblePayloads, [self.modulename, t])['payloads']
+            self.rpc.module_cache.put('exploit', self.modulename, ('payloads', t), payloads)
+        return list(payloads)
 
     def targetevasionpayloads(self, t=0):
         """
@@ -1560,7 +1938,7 @@ class ExploitModule(MsfModule):
 
 class PostModule(MsfModule):
 
-    def __init__(self, rpc, post):
+    def __init__(self, rpc, post, **kwargs):
         """
         Initializes the use of a post exploitation module.
 
@@ -1568,7 +1946,7 @@ class PostModule(MsfModule):
         - rpc : the rpc client used to communicate with msfrpcd
         - post : the name of the post exploitation module.
         """
-        super(PostModule, self).__init__(rpc, 'post', post)
+        super(PostModule, self).__init__(rpc, 'post', post, **kwargs)
         self._action = self._info.get('default_action', "")
 
     @property
@@ -1592,7 +1970,7 @@ class PostModule(MsfModule):
 
 class EncoderModule(MsfModule):
 
-    def __init__(self, rpc, encoder):
+    def __init__(self, rpc, encoder, **kwargs):
         """
         Initializes the use of an encoder module.
 
@@ -1600,12 +1978,12 @@ class EncoderModule(MsfModule):
         - rpc : the rpc client used to communicate with msfrpcd
         - encoder : the name of the encoder module.
         """
-        super(EncoderModule, self).__init__(rpc, 'encoder', encoder)
+        super(EncoderModule, self).__init__(rpc, 'encoder', encoder, **kwargs)
 
 
 class AuxiliaryModule(MsfModule):
 
-    def __init__(self, rpc, auxiliary):
+    def __init__(self, rpc, auxiliary, **kwargs):
         """
         Initializes the use of an auxiliary module.
 
@@ -1613,7 +1991,7 @@ class AuxiliaryModule(MsfModule):
         - rpc : the rpc client used to communicate with msfrpcd
         - auxiliary : the name of the auxiliary module.
         """
-        super(AuxiliaryModule, self).__init__(rpc, 'auxiliary', auxiliary)
+        super(AuxiliaryModule, self).__init__(rpc, 'auxiliary', auxiliary, **kwargs)
         self._action = self._info.get('default_action', "")
 
     @property
@@ -1630,7 +2008,7 @@ class AuxiliaryModule(MsfModule):
 
 class PayloadModule(MsfModule):
 
-    def __init__(self, rpc, payload):
+    def __init__(self, rpc, payload, **kwargs):
         """
         Initializes the use of a payload module.
 
@@ -1638,12 +2016,12 @@ class PayloadModule(MsfModule):
         - rpc : the rpc client used to communicate with msfrpcd
         - payload : the name of the payload module.
         """
-        super(PayloadModule, self).__init__(rpc, 'payload', payload)
+        super(PayloadModule, self).__init__(rpc, 'payload', payload, **kwargs)
 
 
 class NopModule(MsfModule):
 
-    def __init__(self, rpc, nop):
+    def __init__(self, rpc, nop, **kwargs):
         """
         Initializes the use of a nop module.
 
@@ -1651,11 +2029,20 @@ class NopModule(MsfModule):
         - rpc : the rpc client used to communicate with msfrpcd
         - nop : the name of the nop module.
         """
-        super(NopModule, self).__init__(rpc, 'nop', nop)
+        super(NopModule, self).__init__(rpc, 'nop', nop, **kwargs)
 
 
 class ModuleManager(MsfManager):
 
+    module_classes = {
+        'exploit': ExploitModule,
+        'post': PostModule,
+        'encoder': EncoderModule,
+        'auxiliary': AuxiliaryModule,
+        'nop': NopModule,
+        'payload': PayloadModule,
+    }
+
     def execute(self, modtype, modname, **kwargs):
         """
         Execute the module.
@@ -1787,46 +2174,137 @@ class ModuleManager(MsfManager):
 
     def use(self, mtype, mname):
         """
-        Returns a module object.
+        Returns a module object. Module info and options come from the client's ModuleCache when possible.
 
         Mandatory Arguments:
+        - mtype : the module type (e.g. 'exploit')
         - mname : the module name (e.g. 'exploits/windows/http/icecast_header')
         """
-        if mtype == 'exploit':
-            return ExploitModule(self.rpc, mname)
-        elif mtype == 'post':
-            return PostModule(self.rpc, mname)
-        elif mtype == 'encoder':
-            return EncoderModule(self.rpc, mname)
-        elif mtype == 'auxiliary':
-            return AuxiliaryModule(self.rpc, mname)
-        elif mtype == 'nop':
-            return NopModule(self.rpc, mname)
-        elif mtype == 'payload':
-            return PayloadModule(self.rpc, mname)
-        raise MsfRpcError('Unknown module type %s not: exploit, post, encoder, auxiliary, nop, or payload' % mname)
+        cls = self.module_classes.get(mtype)
+        if cls is None:
+            raise MsfRpcError('Unknown module type %s not: exploit, post, encoder, auxiliary, nop, or payload' % mname)
+        with span('modules.use', **{'module.type': mtype, 'module.name': mname}) as s:
+            metadata = self.rpc.module_cache.get(mtype, mname, 'metadata')
+            s.set('module.cached', metadata is not None)
+            if metadata is None:
+                with self.rpc.batch() as batch:
+                    batch.call(MsfRpcMethod.ModuleInfo, [mtype, mname])
+                    batch.call(MsfRpcMethod.ModuleOptions, [mtype, mname])
+                metadata = tuple(batch.results())
+                if not any(isinstance(r, dict) and r.get('error') for r in metadata):
+                    self.rpc.module_cache.put(mtype, mname, 'metadata', metadata)
+        info, options = metadata
+        # MsfModule adds keys to its options (e.g. ACTION), so hand it copies of the cached dicts
+        return cls(self.rpc, mname, info=dict(info), options=dict(options))
+
+
+class SessionOutputStream(object):
+
+    def __init__(self, session, end_strs=None, timeout=300, min_interval=0.01, max_interval=1.0, backoff=2):
+        """
+        Streams the output of a session as it arrives. Iterating yields each non-empty chunk read
+        from the session and stops once an end string shows up, or after the first chunk if there
+        are no end strings, or when the timeout runs out. Empty reads back off exponentially from
+        min_interval to max_interval, and any output resets the wait to min_interval, so a command
+        that answers at once is returned within milliseconds instead of after a fixed 1s poll.
+
+        Mandatory Arguments:
+        - session : the meterpreter or shell session to read from.
+
+        Optional Keyword Arguments:
+        - end_strs : strings which signify the output is complete (default: None)
+        - timeout : seconds to keep reading (default: 300)
+        - min_interval / max_interval : the bounds of the wait between empty reads, in seconds
+        - backoff : the factor the wait grows by after each empty read (default: 2)
+        """
+        self.session = session
+        self.end_strs = list(end_strs) if end_strs else None
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.deadline = time.monotonic() + timeout
+        self.chunks = []
+        self.reads = 0
+        self.finished = False
+        self.matcher = MultiPatternMatcher(self.end_strs) if self.end_strs else None
+
+    def feed(self, data):
+        """
+        Add data read from the session. Returns True once the output is complete.
+        """
+        self.reads += 1
+        if not data:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+            return self.finished
+        self.chunks.append(data)
+        self.interval = self.min_interval
+        if self.matcher is None or self.matcher.feed(data) is not None:
+            self.finished = True
+        return self.finished
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    @property
+    def wait(self):
+        """
+        Seconds to wait before the next read.
+        """
+        return max(0, min(self.interval, self.deadline - time.monotonic()))
+
+    @property
+    def output(self):
+        """
+        Everything read so far.
+        """
+        return ''.join(self.chunks)
+
+    def __iter__(self):
+        while not self.finished and not self.expired:
+            data = self.session.read()
+            self.feed(data)
+            if data:
+                yield data
+            if not self.finished:
+                time.sleep(self.wait)
+
+    def timeout_error(self, cmd):
+        msg = f"Command <{repr(cmd)[1:-1]}> timed out in <{self.timeout}s> on session <{self.session.sid}>"
+        if self.end_strs is not None:
+            msg += f" without finding any termination strings within <{self.end_strs}> in the output: <{self.output}>"
+        return MsfError(msg)
 
 
 class MsfSession(object):
 
-    def __init__(self, sid, rpc, sd):
+    __slots__ = ('sid', 'rpc', 'info')
+
+    def __init__(self, sid, rpc, info):
         """
-        Initialize a meterpreter or shell session.
+        Initialize a meterpreter or shell session handle.
 
         Mandatory Arguments:
         - sid : the session identifier.
         - rpc : the msfrpc client object.
-        - sd : the session description
+        - info : the session's record from session.list, the handle keeps its own copy
         """
         self.sid = sid
         self.rpc = rpc
-        self.__dict__.update(sd)
-        for s in self.__dict__:
-            if re.match(r'\d+', s):
-                if 'plugins' not in self.__dict__[s]:
-                    self.__dict__[s]['plugins'] = []
-                if 'write_dir' not in self.__dict__[s]:
-                    self.__dict__[s]['write_dir'] = ''
+        self.info = dict(info)
+        self.info.setdefault('plugins', [])
+        self.info.setdefault('write_dir', '')
+
+    def __getattr__(self, name):
+        # The record's fields stay readable as attributes, e.g. session.type or session.tunnel_peer
+        if name != 'info':
+            try:
+                return self.info[name]
+            except KeyError:
+                pass
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
 
     def stop(self):
         """
@@ -1845,14 +2323,31 @@ class MsfSession(object):
     def ring(self):
         return SessionRing(self.rpc, self.sid)
 
+    def stream(self, end_strs=None, timeout=300, **kwargs):
+        """
+        Returns a SessionOutputStream over the session's output.
+
+        Optional Keyword Arguments:
+        - end_strs : strings which signify the output is complete (default: None)
+        - timeout : seconds to keep reading (default: 300)
+        - any other SessionOutputStream keyword argument
+        """
+        return SessionOutputStream(self, end_strs, timeout, **kwargs)
+
 
 class MeterpreterSession(MsfSession):
 
+    __slots__ = ()
+
     def read(self):
         """
-        Read data from the meterpreter session.
+        Read data from the meterpreter session. The data is also recorded in the session buffer.
         """
-        return self.rpc.call(MsfRpcMethod.SessionMeterpreterRead, [self.sid])['data']
+        buffer = self.rpc.session_buffer(self.sid)
+        with buffer.lock:
+            data = self.rpc.call(MsfRpcMethod.SessionMeterpreterRead, [self.sid])['data']
+            buffer.append(data)
+        return data
 
     def write(self, data):
         """
@@ -1885,13 +2380,6 @@ class MeterpreterSession(MsfSession):
         self.rpc.call(MsfRpcMethod.SessionMeterpreterScript, [self.sid, path])
         return self.read()
 
-    @property
-    def info(self):
-        """
-        Get the session's data dictionary
-        """
-        return self.__dict__[self.sid]
-
     @property
     def sep(self):
         """
@@ -1929,7 +2417,7 @@ class MeterpreterSession(MsfSession):
         """
         end_strs = ['Success', 'has already been loaded']
         out = self.run_with_output(f'load {plugin}', end_strs)
-        self.__dict__[self.sid]['plugins'].append(plugin)
+        self.info['plugins'].append(plugin)
         return out
 
     def run_with_output(self, cmd, end_strs=None, timeout=301, timeout_exception=True, api_call='write'):
@@ -1950,33 +2438,20 @@ class MeterpreterSession(MsfSession):
             out = ''
         else:
             out = self.runsingle(cmd)
-        time.sleep(1)
-        out += self.gather_output(cmd, out, end_strs, timeout, timeout_exception)  # gather last of data buffer
-        return out
+        return self.gather_output(cmd, out, end_strs, timeout, timeout_exception)
 
     def gather_output(self, cmd, out, end_strs, timeout, timeout_exception):
         """
-        Wait for session command to get all output.
+        Wait for session command to get all output, starting from what was already read in out.
         """
-        counter = 1
-        while counter < timeout:
-            out += self.read()
-            if end_strs == None:
-                if len(out) > 0:
-                    return out
-            else:
-                if any(end_str in out for end_str in end_strs):
-                    return out
-            time.sleep(1)
-            counter += 1
-
-        if timeout_exception:
-            msg = f"Command <{repr(cmd)[1:-1]}> timed out in <{timeout}s> on session <{self.sid}>"
-            if end_strs == None:
-                msg += f" without finding any termination strings within <{end_strs}> in the output: <{out}>"
-            raise MsfError(msg)
-        else:
-            return out
+        stream = self.stream(end_strs, timeout)
+        if out:
+            stream.feed(out)
+        for _ in stream:
+            pass
+        if not stream.finished and timeout_exception:
+            raise stream.timeout_error(cmd)
+        return stream.output
 
     def run_shell_cmd_with_output(self, cmd, end_strs, exit_shell=True, timeout=301, timeout_exception=True):
         """
@@ -2040,7 +2515,7 @@ class MeterpreterSession(MsfSession):
             out = self.run_shell_cmd_with_output('echo %TEMP%', ['>'])
             # Example output: 'echo %TEMP%\nC:\\Users\\user\\AppData\\Local\\Temp\r\n\r\nC:\\Windows\\system32>'
             write_dir = out.split('\n')[1][:-1] + '\\'
-            self.__dict__[self.sid]['write_dir'] = write_dir
+            self.info['write_dir'] = write_dir
             return write_dir
         else:
             return self.info['write_dir']
@@ -2088,11 +2563,17 @@ class SessionRing(object):
 
 class ShellSession(MsfSession):
 
+    __slots__ = ()
+
     def read(self):
         """
-        Read data from the shell session.
+        Read data from the shell session. The data is also recorded in the session buffer.
         """
-        return self.rpc.call(MsfRpcMethod.SessionShellRead, [self.sid])['data']
+        buffer = self.rpc.session_buffer(self.sid)
+        with buffer.lock:
+            data = self.rpc.call(MsfRpcMethod.SessionShellRead, [self.sid])['data']
+            buffer.append(data)
+        return data
 
     def write(self, data):
         """
@@ -2131,17 +2612,156 @@ class ShellSession(MsfSession):
         """
         Wait for session command to get all output.
         """
-        out = ''
-        counter = 0
-        while counter < timeout + 1:
-            time.sleep(1)
-            out += self.read()
-            if any(end_str in out for end_str in end_strs):
-                return out
-            counter += 1
+        stream = self.stream(end_strs, timeout)
+        for _ in stream:
+            pass
+        if not stream.finished:
+            raise stream.timeout_error(cmd)
+        return stream.output
 
-        raise MsfError(f"Command <{repr(cmd)[1:-1]}> timed out in <{timeout}s> on session <{self.sid}> "
-                       f"without finding any termination strings within <{end_strs}> in the output: <{out}>")
+
+class SessionRegistry(object):
+
+    def __init__(self, rpc, interval=2.0, max_age=5.0, history=256):
+        """
+        The sessions msfrpcd holds, indexed by id and uuid. Every session.list response the client
+        sees is diffed against it to record 'opened' and 'closed' events, and start() refreshes it
+        in the background, so looking a session up usually needs no RPC at all.
+
+        Mandatory Arguments:
+        - rpc : the msfrpc client object.
+
+        Optional Keyword Arguments:
+        - interval : seconds between background refreshes (default: 2)
+        - max_age : lookups refresh the registry first when it is older than this (default: 5)
+        - history : the number of events kept in events (default: 256)
+        """
+        self.rpc = rpc
+        self.interval = interval
+        self.max_age = max_age
+        self.sessions = {}
+        self.events = deque(maxlen=history)
+        self.refreshed = None
+        self.refreshes = 0
+        self._uuids = {}
+        self._seq = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = None
+
+    def update(self, table):
+        """
+        Replace the registry with a session.list response and return the events it implies.
+
+        Mandatory Arguments:
+        - table : the session.list response, session records keyed by id
+        """
+        table = {str(k): v for k, v in table.items()}
+        events = []
+        with self._lock:
+            # The sessions found by the first refresh were not opened now: record no events for them
+            known = self.sessions if self.refreshed is not None else table
+            for sid in self.sessions.keys() - table.keys():
+                events.append(self._event('closed', sid, self.sessions[sid]))
+            for sid in table.keys() - known.keys():
+                events.append(self._event('opened', sid, table[sid]))
+            self.sessions = table
+            self._uuids = {record.get('uuid'): sid for sid, record in table.items()}
+            self.refreshed = time.monotonic()
+            self.refreshes += 1
+            self.events.extend(events)
+        for event in events:
+            for listener in self._listeners:
+                listener(event)
+        return events
+
+    def _event(self, kind, sid, record):
+        self._seq += 1
+        return {'seq': self._seq, 'event': kind, 'id': sid, 'uuid': record.get('uuid'),
+                'type': record.get('type'), 'time': time.time()}
+
+    def lookup(self, sid):
+        """
+        Returns (id, record) for a session id or uuid as last seen, or None.
+        """
+        sid = str(sid)
+        with self._lock:
+            if sid not in self.sessions:
+                sid = self._uuids.get(sid)
+            if sid is None:
+                return None
+            return sid, self.sessions[sid]
+
+    @property
+    def fresh(self):
+        return self.refreshed is not None and time.monotonic() - self.refreshed <= self.max_age
+
+    def refresh(self):
+        """
+        Fetch session.list and update the registry with it.
+        """
+        # Sessions msfrpcd opens on its own, e.g. from a handler job, invalidate no cached list
+        if self.rpc.response_cache is not None:
+            self.rpc.response_cache.discard(MsfRpcMethod.SessionList)
+        return self.update(self.rpc.call(MsfRpcMethod.SessionList))
+
+    def get(self, sid):
+        """
+        Returns (id, record) for a session id or uuid, refreshing the registry when it is stale or
+        does not know the session yet. Raises KeyError for unknown sessions.
+        """
+        found = self.lookup(sid) if self.fresh else None
+        if found is None:
+            self.refresh()
+            found = self.lookup(sid)
+        if found is None:
+            raise KeyError('Session ID (%s) does not exist' % sid)
+        return found
+
+    def subscribe(self, listener):
+        """
+        Call listener(event) for every event from now on.
+        """
+        self._listeners.append(listener)
+
+    def since(self, seq=0):
+        """
+        The recorded events after seq.
+        """
+        with self._lock:
+            return [e for e in self.events if e['seq'] > seq]
+
+    def start(self):
+        """
+        Refresh the registry every interval seconds from a daemon thread, until stop().
+        """
+        if self._stop is not None:
+            return
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop,), name='msf-session-registry', daemon=True).start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def _run(self, stop):
+        while not stop.is_set():
+            try:
+                self.refresh()
+            except (MsfError, MsfRpcError, requests.exceptions.RequestException):
+                # msfrpcd is unreachable or rejected the call: keep the last known sessions
+                pass
+            stop.wait(self.interval)
+
+    @property
+    def stats(self):
+        return {
+            'sessions': len(self.sessions),
+            'refreshes': self.refreshes,
+            'age': None if self.refreshed is None else time.monotonic() - self.refreshed,
+            'events': self._seq,
+        }
 
 
 class SessionManager(MsfManager):
@@ -2151,7 +2771,9 @@ class SessionManager(MsfManager):
         """
         A list of active sessions.
         """
-        return {str(k): v for k, v in self.rpc.call(MsfRpcMethod.SessionList).items()}  # Convert int id to str
+        registry = self.rpc.session_registry
+        registry.update(self.rpc.call(MsfRpcMethod.SessionList))
+        return dict(registry.sessions)
 
     def session(self, sid):
         """
@@ -2160,20 +2782,12 @@ class SessionManager(MsfManager):
         Mandatory Arguments:
         - sid : the session identifier or uuid
         """
-        s = self.list
-        if sid not in s:
-            for k in s:
-                if s[k]['uuid'] == sid:
-                    if s[k]['type'] == 'meterpreter':
-                        return MeterpreterSession(k, self.rpc, s)
-                    elif s[k]['type'] == 'shell':
-                        return ShellSession(k, self.rpc, s)
-            raise KeyError('Session ID (%s) does not exist' % sid)
-        if s[sid]['type'] == 'meterpreter':
-            return MeterpreterSession(sid, self.rpc, s)
-        elif s[sid]['type'] == 'shell':
-            return ShellSession(sid, self.rpc, s)
-        raise NotImplementedError('Could not determine session type: %s' % s[sid]['type'])
+        sid, record = self.rpc.session_registry.get(sid)
+        if record['type'] == 'meterpreter':
+            return MeterpreterSession(sid, self.rpc, record)
+        elif record['type'] == 'shell':
+            return ShellSession(sid, self.rpc, record)
+        raise NotImplementedError('Could not determine session type: %s' % record['type'])
 
 
 class MsfConsole(object):
@@ -2197,12 +2811,17 @@ class MsfConsole(object):
                 raise MsfRpcError('Unable to create a new console.')
         else:
             self.cid = cid
+        self.busy = None
+        self.prompt = None
 
     def read(self):
         """
-        Read data from the console.
+        Read data from the console. The busy flag and prompt it returns are kept in .busy and .prompt.
         """
-        return self.rpc.call(MsfRpcMethod.ConsoleRead, [self.cid])
+        result = self.rpc.call(MsfRpcMethod.ConsoleRead, [self.cid])
+        self.busy = result.get('busy')
+        self.prompt = result.get('prompt')
+        return result
 
     def write(self, command):
         """
@@ -2249,20 +2868,97 @@ class MsfConsole(object):
             if c['id'] == self.cid:
                 return c['busy']
 
-    def run_module_with_output(self, mod, payload=None, run_as_job=False, timeout=301):
+    def run_command(self, command, timeout=30, min_interval=0.01, max_interval=1.0, settle=1.0, end_strs=None):
+        """
+        Run console commands and collect their output until the console is idle again.
+
+        Busy state comes from the console.read responses themselves, so no console.list calls are
+        needed. Reads back off exponentially from min_interval to max_interval while nothing
+        arrives. msfrpcd may report the console idle before it has picked the command up, so an
+        idle console only ends the wait once it produced output, was seen busy, or settle seconds
+        passed, and only when the next read finds it still idle with nothing more to print: between
+        the lines of a multi-line command the console can look idle for a moment. Returns a dict with the accumulated 'data', the 'prompt', and whether the command
+        'finished' within the timeout.
+
+        Mandatory Arguments:
+        - command : the console command, or several separated by newlines
+
+        Optional Keyword Arguments:
+        - timeout : seconds to wait for the command (default: 30)
+        - min_interval / max_interval : the bounds of the wait between reads, in seconds
+        - settle : seconds after which an idle console without output counts as done (default: 1)
+        - end_strs : strings which signify the command is done even if the console is still busy
+        """
+        self.write(command)
+        start = time.monotonic()
+        deadline = start + timeout
+        interval = min_interval
+        chunks = []
+        matcher = MultiPatternMatcher(end_strs) if end_strs else None
+        seen_busy = False
+        idle = False
+        while True:
+            result = self.read()
+            if result['data']:
+                chunks.append(result['data'])
+                interval = min_interval
+                if matcher is not None and matcher.feed(result['data']) is not None:
+                    finished = True
+                    break
+            else:
+                interval = min(interval * 2, max_interval)
+            seen_busy = seen_busy or result['busy']
+            now = time.monotonic()
+            if result['busy'] or not (chunks or seen_busy or now - start >= settle):
+                idle = False
+            elif idle and not result['data']:
+                finished = True
+                break
+            else:
+                # Confirm with one more read straight away
+                idle = True
+                interval = min_interval
+            if now >= deadline:
+                finished = False
+                break
+            time.sleep(min(interval, deadline - now))
+        return {'data': ''.join(chunks), 'prompt': result.get('prompt', ''), 'finished': finished}
+
+    def run_module_with_output(self, mod, payload=None, run_as_job=False, timeout=301, end_strs=None):
         """
         Execute a module and wait for the returned data
 
+        The whole module script is sent in one write and output is collected by run_command, so
+        a run costs one write plus adaptively spaced reads.
+
         Mandatory Arguments:
         - mod : the MsfModule object
 
         Optional Keyword Arguments:
         - payload : the MsfModule object to be used as payload
+        - end_strs : strings which signify the module is done, e.g. ['Exploit completed'], so the
+                     wait can end before the console reports it is no longer busy
         """
-        options_str = 'use {}/{}\n'.format(mod.moduletype, mod.modulename)
-        if self.rpc.consoles.console(self.cid).is_busy():
+        # Clears the data buffer and tells whether the console is busy in one call
+        if self.read()['busy']:
             raise MsfError('Console {} is busy'.format(self.cid))
-        self.rpc.consoles.console(self.cid).read()  # clear data buffer
+        options_str = self.module_script(mod, payload, run_as_job)
+        return self.run_command(options_str, timeout, end_strs=end_strs)['data']
+
+    @staticmethod
+    def module_script(mod, payload=None, run_as_job=False, payloads=None):
+        """
+        The console commands that set up and run a module.
+
+        Mandatory Arguments:
+        - mod : the MsfModule object
+
+        Optional Keyword Arguments:
+        - payload : the MsfModule object to be used as payload
+        - run_as_job : run the module in the background
+        - payloads : the payloads compatible with the exploit target, fetched only when needed if omitted.
+        """
+        options_str = 'use {}/{}\n'.format(mod.moduletype, mod.modulename)
         opts = mod.runoptions.copy()
         if payload is None:
             opts['DisablePayloadHandler'] = True
@@ -2279,7 +2975,9 @@ class MsfConsole(object):
             if 'DisablePayloadHandler' in opts and opts['DisablePayloadHandler']:
                 pass
             elif isinstance(payload, PayloadModule):
-                if payload.modulename not in mod.payloads:
+                if payloads is None:
+                    payloads = mod.payloads
+                if payload.modulename not in payloads:
                     raise ValueError(
                         'Invalid payload ({}) for given target ({}).'.format(payload.modulename, mod.target))
                 options_str += 'set payload {}\n'.format(payload.modulename)
@@ -2294,16 +2992,7 @@ class MsfConsole(object):
         options_str += 'run -z'
         if run_as_job:
             options_str += " -j"
-        self.rpc.consoles.console(self.cid).write(options_str)
-        data = ''
-        timer = 0
-        while data == '' or self.rpc.consoles.console(self.cid).is_busy():
-            time.sleep(1)
-            data += self.rpc.consoles.console(self.cid).read()['data']
-            timer += 1
-            if timer > timeout:
-                break
-        return data
+        return options_str
 
 
 class ConsoleManager(MsfManager):
@@ -0,0 +1,1755 @@
+#!/usr/bin/env python3
+"""
+asyncio flavour of the msfrpc client.
+
+AsyncMsfRpcClient talks to msfrpcd over a pooled, non-blocking httpx transport and
+exposes the same managers as MsfRpcClient, whose RPC methods and properties return
+awaitables instead of blocking the event loop.
+"""
+
+import asyncio
+import contextvars
+import os
+import tempfile
+import time
+import uuid
+
+import httpx
+from pymetasploit3.utils import convert, decode, encode
+
+from msfrpc import (
+    MsfRpcError,
+    MsfRpcUnavailableError,
+    MsfRpcMethod,
+    SessionRegistry,
+    MsfError,
+    MsfAuthError,
+    MsfManager,
+    MsfTable,
+    NotesTable,
+    LootsTable,
+    CredsTable,
+    HostsTable,
+    ServicesTable,
+    VulnsTable,
+    EventsTable,
+    ClientsTable,
+    Workspace,
+    MsfModule,
+    ExploitModule,
+    PostModule,
+    EncoderModule,
+    AuxiliaryModule,
+    PayloadModule,
+    NopModule,
+    SessionOutputStream,
+    MsfSession,
+    MsfConsole,
+)
+from utils.decoding import decode_response, SpooledResponse
+from utils.module_cache import ModuleCache
+from utils.pattern_matcher import MultiPatternMatcher
+from utils.response_cache import ResponseCache
+from utils.retry_policy import RetryPolicy
+from utils.rpc_metrics import RpcMetrics
+from utils.session_buffer import SessionOutputBuffer
+from utils.singleflight import AsyncSingleflight, Singleflight
+from utils.tracing import record_span, span
+
+__all__ = [
+    'AsyncMsfRpcClient',
+    'AsyncMsfRpcBatch',
+    'AsyncWorkspace',
+    'AsyncWorkspaceManager',
+    'AsyncDbManager',
+    'AsyncAuthManager',
+    'AsyncJobManager',
+    'AsyncCoreManager',
+    'AsyncModuleManager',
+    'AsyncSessionOutputStream',
+    'AsyncMsfSession',
+    'AsyncMeterpreterSession',
+    'AsyncShellSession',
+    'AsyncSessionRing',
+    'AsyncSessionRegistry',
+    'AsyncSessionManager',
+    'AsyncMsfConsole',
+    'AsyncConsoleManager'
+]
+
+
+class AsyncMsfRpcClient(object):
+
+    def __init__(self, password, **kwargs):
+        """
+        Initializes the asyncio msfrpc client. No I/O happens here: the client logs in
+        on its first call, or when login() is awaited.
+
+        Mandatory Arguments:
+        - password : the password used to login to msfrpcd
+
+        Optional Keyword Arguments:
+        - username : the username used to authenticate to msfrpcd (default: msf)
+        - uri : the msfrpcd URI (default: /api/)
+        - port : the remote msfrpcd port to connect to (default: 55553)
+        - server : the remote server IP address hosting msfrpcd (default: 127.0.0.1)
+        - ssl : if true uses SSL else regular HTTP (default: False)
+        - token : an existing API token, skips the login
+        - pool_size : the maximum number of keep-alive connections kept open to msfrpcd (default: 10)
+        - timeout : default per-call timeout in seconds (default: None)
+        - module_cache : a ModuleCache for module metadata, can be shared between clients (default: a new one)
+        - session_buffer_size : characters of output kept per session for resumable reads (default: 1048576)
+        - auth_check_interval : seconds without a successful call after which ensure_auth() checks
+                                the token is still valid (default: 300)
+        - token_manager : notified of every permanent token the client adds, and supplies them (default: None)
+        - retry_policy : the RetryPolicy for failed requests, can be shared between clients (default: a new one)
+        - coalesce : merge concurrent identical read-only calls into one request (default: True)
+        - response_cache : the ResponseCache for list calls, can be shared between clients,
+                           None disables it (default: a new one)
+        - session_refresh_interval : seconds between refreshes of the session registry once it is
+                                     started (default: 2)
+        - fast_decode : decode strings while unpacking responses instead of converting them
+                        afterwards, see decode_response (default: True)
+        - metrics : the RpcMetrics to record calls in, can be shared between clients (default: a new one)
+        - cassette : a Cassette to record every call and its response in, for replaying them (default: None)
+        """
+        self.uri = kwargs.get('uri', '/api/')
+        self.port = kwargs.get('port', 55553)
+        self.host = kwargs.get('server', '127.0.0.1')
+        self.ssl = kwargs.get('ssl', False)
+        self.token = kwargs.get('token')
+        self.encodings = kwargs.get('encodings', ['utf-8'])
+        self.decode_error_handling: str = kwargs.get('decode_error_handling', 'strict')
+        self.fast_decode = kwargs.get('fast_decode', True)
+        self.pool_size = kwargs.get('pool_size', 10)
+        self.timeout = kwargs.get('timeout')
+        self.module_cache = kwargs.get('module_cache') or ModuleCache()
+        self.session_buffer_size = kwargs.get('session_buffer_size', 1048576)
+        self.auth_check_interval = kwargs.get('auth_check_interval', 300)
+        self.token_manager = kwargs.get('token_manager')
+        self.retry_policy = kwargs.get('retry_policy') or RetryPolicy()
+        self.singleflight = AsyncSingleflight() if kwargs.get('coalesce', True) else None
+        self.metrics = kwargs.get('metrics') or RpcMetrics()
+        self.cassette = kwargs.get('cassette')
+        self.response_cache = kwargs['response_cache'] if 'response_cache' in kwargs else ResponseCache()
+        self.headers = {"Content-type": "binary/message-pack"}
+        self._session_buffers = {}
+        self.session_registry = AsyncSessionRegistry(self, interval=kwargs.get('session_refresh_interval', 2.0))
+        self._username = kwargs.get('username', 'msf')
+        self._password = password
+        self._login_lock = asyncio.Lock()
+        self._auth_checked = 0.0
+        self._http = httpx.AsyncClient(
+            headers=self.headers,
+            verify=False,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    @property
+    def url(self):
+        """
+        The msfrpcd API endpoint.
+        """
+        if self.ssl is True:
+            return "https://%s:%s%s" % (self.host, self.port, self.uri)
+        return "http://%s:%s%s" % (self.host, self.port, self.uri)
+
+    async def call(self, method, opts=None, is_raw=False, timeout=None):
+        """
+        Call an msfrpcd method.
+
+        Mandatory Arguments:
+        - method : the RPC method name (see MsfRpcMethod)
+
+        Optional Keyword Arguments:
+        - opts : the list of method arguments
+        - is_raw : return the undecoded response body
+        - timeout : the timeout for this call, overrides the client default
+        """
+        if not isinstance(opts, list):
+            opts = []
+        started = time.perf_counter()
+        error = True
+        try:
+            if method == MsfRpcMethod.AuthLogin:
+                with self.metrics.measure(method, 'encode'):
+                    payload = encode([method] + opts)
+                r = await self.post_request(self.url, payload, timeout=timeout, method=method)
+            elif self.response_cache is not None and self.response_cache.caches(method):
+                key = encode(opts)
+                r = self.response_cache.get(method, key)
+                if r is None:
+                    generation = self.response_cache.generation
+                    r = await self._fetch(method, opts, timeout)
+                    if r.status_code == 200:
+                        self.response_cache.put(method, key, r, generation)
+            else:
+                try:
+                    r = await self._fetch(method, opts, timeout)
+                finally:
+                    if self.response_cache is not None:
+                        self.response_cache.invalidate(method)
+
+            if method in ModuleCache.invalidated_by:
+                self.module_cache.clear()
+
+            error = r.status_code != 200
+            if is_raw:
+                return r.content
+
+            if self.fast_decode:
+                with self.metrics.measure(method, 'decode'):
+                    return decode_response(r.content, self.encodings, self.decode_error_handling)
+            with self.metrics.measure(method, 'decode'):
+                data = decode(r.content)
+            with self.metrics.measure(method, 'convert'):
+                return convert(data, self.encodings, self.decode_error_handling)  # convert all keys/vals to utf8
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.observe(method, elapsed, error)
+            record_span(method, elapsed, error, **{'rpc.method': method})
+
+    async def _fetch(self, method, opts, timeout):
+        """
+        Send an authenticated call, sharing the response of an identical read-only call in flight.
+        """
+        if self.singleflight is not None and method in Singleflight.coalescible:
+            return await self.singleflight.do((method, encode(opts)), lambda: self._request(method, opts, timeout))
+        return await self._request(method, opts, timeout)
+
+    async def call_spooled(self, method, opts=None, timeout=None, spill_threshold=65536, directory=None):
+        """
+        Call an msfrpcd method and spool its response to a temporary file as it arrives instead of
+        holding it in memory. Returns a SpooledResponse, which the caller closes to delete the file.
+        The response is decoded in a worker thread.
+
+        Mandatory Arguments:
+        - method : the RPC method name (see MsfRpcMethod)
+
+        Optional Keyword Arguments:
+        - opts : the list of method arguments
+        - timeout : the timeout for this call, overrides the client default
+        - spill_threshold : fields larger than this many bytes are left in the file (default: 65536)
+        - directory : where to create the file (default: the system temporary directory)
+        """
+        if not isinstance(opts, list):
+            opts = []
+        started = time.perf_counter()
+        error = True
+        try:
+            try:
+                r = await self._request(method, opts, timeout, stream=True)
+            finally:
+                if self.response_cache is not None:
+                    self.response_cache.invalidate(method)
+            fd, path = tempfile.mkstemp(prefix='msfrpc-', suffix='.msgpack', dir=directory)
+            received = 0
+            try:
+                with self.metrics.measure(method, 'http'), os.fdopen(fd, 'wb') as f:
+                    async for chunk in r.aiter_bytes(65536):
+                        received += len(chunk)
+                        f.write(chunk)
+            except BaseException:
+                os.unlink(path)
+                raise
+            finally:
+                await r.aclose()
+                self.metrics.transferred(method, received=received)
+            error = r.status_code != 200
+            if self.cassette is not None:
+                with open(path, 'rb') as f:
+                    self.cassette.record(method, opts, r.status_code, f.read(), time.perf_counter() - started)
+            with self.metrics.measure(method, 'decode'):
+                return await asyncio.to_thread(SpooledResponse, path, self.encodings, self.decode_error_handling,
+                                               spill_threshold)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.observe(method, elapsed, error)
+            record_span(method, elapsed, error, **{'rpc.method': method})
+
+    async def _request(self, method, opts, timeout, stream=False):
+        """
+        Send an authenticated call, logging in first if needed and again once if msfrpcd
+        rejects the token.
+        """
+        if self.token is None:
+            await self.login()
+        if self.token is None:
+            raise MsfAuthError("MsfRPC: Not Authenticated")
+        token = self.token
+        with self.metrics.measure(method, 'encode'):
+            payload = encode([method, token] + opts)
+        sent = time.perf_counter()
+        r = await self.post_request(self.url, payload, timeout=timeout, method=method, stream=stream)
+        if r.status_code == 401 and self._password is not None:
+            # The token expired or was removed from msfrpcd: log in again and retry once
+            await r.aclose()
+            await self._relogin(token)
+            with self.metrics.measure(method, 'encode'):
+                payload = encode([method, self.token] + opts)
+            sent = time.perf_counter()
+            r = await self.post_request(self.url, payload, timeout=timeout, method=method, stream=stream)
+            if r.status_code == 401:
+                await r.aclose()
+                raise MsfAuthError("MsfRPC: Authentication failed: msfrpcd rejected the new token")
+        if r.status_code != 401:
+            self._auth_checked = time.monotonic()
+        if self.cassette is not None and not stream:
+            self.cassette.record(method, opts, r.status_code, r.content, time.perf_counter() - sent)
+        return r
+
+    async def post_request(self, url, payload, timeout=None, method=None, stream=False):
+        """
+        POST a request to msfrpcd, retrying failures as the retry policy allows. With stream the
+        body is left to be read from the response, which the caller closes.
+        """
+        if timeout is None:
+            timeout = httpx.USE_CLIENT_DEFAULT
+        policy = self.retry_policy
+        started = time.monotonic()
+        attempt = 0
+        with self.metrics.measure(method, 'http'):
+            while True:
+                if not policy.before_attempt(method):
+                    raise MsfRpcUnavailableError(policy.unavailable(method))
+                self.metrics.transferred(method, sent=len(payload))
+                try:
+                    if stream:
+                        request = self._http.build_request('POST', url, content=payload, timeout=timeout)
+                        r = await self._http.send(request, stream=True)
+                    else:
+                        r = await self._http.post(url, content=payload, timeout=timeout)
+                except httpx.TransportError as e:
+                    # Refused or timed out connections, or no free pooled connection, never reached msfrpcd
+                    sent = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+                    delay = policy.on_failure(method, sent, attempt, started)
+                    if delay is None:
+                        raise
+                    self.metrics.retried(method)
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                except BaseException:
+                    # Cancelled by a tool timeout or a client hanging up, or the client was closed
+                    policy.on_abort()
+                    raise
+                policy.on_success()
+                if not stream:
+                    self.metrics.transferred(method, received=len(r.content))
+                return r
+
+    async def login(self, user=None, password=None):
+        """
+        Login to msfrpcd and switch to a permanent token.
+
+        Optional Arguments:
+        - user : the username, defaults to the one the client was created with
+        - password : the password, defaults to the one the client was created with
+        """
+        async with self._login_lock:
+            if self.token is not None and user is None:
+                return True  # a concurrent caller already logged in
+            user = user or self._username
+            password = password or self._password
+            auth = await self.call(MsfRpcMethod.AuthLogin, [user, password])
+            try:
+                if auth['result'] == 'success':
+                    self.token = auth['token']
+                    token = await self.add_perm_token()
+                    self.token = token
+                    # Drop the temporary login token rather than leave it to expire in msfrpcd
+                    await self.call(MsfRpcMethod.AuthLogout, [auth['token']])
+                    return True
+            except Exception:
+                raise MsfAuthError("MsfRPC: Authentication failed")
+
+    async def _relogin(self, failed_token):
+        async with self._login_lock:
+            if self.token != failed_token:
+                return  # a concurrent call already logged in again
+            self.token = None
+        await self.login()
+
+    async def ensure_auth(self):
+        """
+        Log in unless the client holds a token. If no call succeeded for auth_check_interval
+        seconds, check the token with a core.version call, which logs in again if it was rejected.
+        """
+        if self.token is None:
+            await self.login()
+        elif time.monotonic() - self._auth_checked > self.auth_check_interval:
+            await self.call(MsfRpcMethod.CoreVersion)
+
+    async def add_perm_token(self):
+        """
+        Add a permanent UUID4 API token
+        """
+        if self.token_manager is not None:
+            token = self.token_manager.new_token()
+        else:
+            token = str(uuid.uuid4())
+        await self.call(MsfRpcMethod.AuthTokenAdd, [token])
+        if self.token_manager is not None:
+            self.token_manager.added(token)
+        return token
+
+    async def logout(self):
+        """
+        Logs the current user out. Note: do not call directly.
+        """
+        await self.call(MsfRpcMethod.AuthLogout, [self.token])
+
+    def batch(self, concurrency=None):
+        """
+        Returns an AsyncMsfRpcBatch: calls queued on it are sent concurrently when the async with block exits.
+
+        Optional Keyword Arguments:
+        - concurrency : the most calls in flight at once, None sends them all at once (default: None)
+        """
+        return AsyncMsfRpcBatch(self, concurrency)
+
+    def session_buffer(self, sid):
+        """
+        Returns the SessionOutputBuffer recording everything read from a session.
+
+        Mandatory Arguments:
+        - sid : the session identifier
+        """
+        sid = str(sid)
+        if sid not in self._session_buffers:
+            self._session_buffers[sid] = SessionOutputBuffer(self.session_buffer_size, lock=asyncio.Lock())
+        return self._session_buffers[sid]
+
+    async def aclose(self):
+        """
+        Close the pooled connections to msfrpcd.
+        """
+        self.session_registry.stop()
+        await self._http.aclose()
+
+    @property
+    def core(self):
+        """
+        The msf RPC core manager.
+        """
+        return AsyncCoreManager(self)
+
+    @property
+    def modules(self):
+        """
+        The msf RPC modules RPC manager.
+        """
+        return AsyncModuleManager(self)
+
+    @property
+    def sessions(self):
+        """
+        The msf RPC sessions (meterpreter & shell) manager.
+        """
+        return AsyncSessionManager(self)
+
+    @property
+    def jobs(self):
+        """
+        The msf RPC jobs manager.
+        """
+        return AsyncJobManager(self)
+
+    @property
+    def consoles(self):
+        """
+        The msf RPC consoles manager
+        """
+        return AsyncConsoleManager(self)
+
+    @property
+    def authenticated(self):
+        """
+        Whether or not this client is authenticated.
+        """
+        return self.token is not None
+
+    @property
+    def db(self):
+        """
+        The msf RPC database manager.
+        """
+        return AsyncDbManager(self)
+
+    @property
+    def auth(self):
+        """
+        The msf authentication manager.
+        """
+        return AsyncAuthManager(self)
+
+
+class AsyncMsfRpcBatch(object):
+
+    def __init__(self, rpc, concurrency=None):
+        """
+        Queues independent RPCs and sends them concurrently over the client's connection pool.
+
+            async with client.batch() as batch:
+                info = batch.call(MsfRpcMethod.ModuleInfo, ['exploit', name])
+                options = batch.call(MsfRpcMethod.ModuleOptions, ['exploit', name])
+            info.result(), options.result()
+
+        Each call gets its own Future, so one failed call does not affect the others.
+
+        Mandatory Arguments:
+        - rpc : the msfrpc client object.
+
+        Optional Keyword Arguments:
+        - concurrency : the most calls in flight at once, None sends them all at once (default: None)
+        """
+        self.rpc = rpc
+        self._limit = asyncio.Semaphore(concurrency) if concurrency else None
+        self._calls = []
+        self._futures = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.execute()
+        else:
+            for future, _ in self._calls:
+                future.cancel()
+
+    def call(self, method, opts=None, is_raw=False, timeout=None):
+        """
+        Queue a call, see AsyncMsfRpcClient.call. Returns a Future holding its response or exception.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._calls.append((future, (method, opts, is_raw, timeout)))
+        return future
+
+    async def execute(self):
+        """
+        Send all queued calls concurrently and wait for them. Returns the futures in call order.
+        """
+        calls, self._calls = self._calls, []
+        await asyncio.gather(*(self._run(*c) for c in calls))
+        self._futures = [future for future, _ in calls]
+        return self._futures
+
+    async def _run(self, future, args):
+        try:
+            if self._limit is None:
+                result = await self.rpc.call(*args)
+            else:
+                async with self._limit:
+                    result = await self.rpc.call(*args)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    def results(self, return_exceptions=False):
+        """
+        The responses of the executed calls, in call order.
+
+        Optional Keyword Arguments:
+        - return_exceptions : put a failed call's exception in its slot instead of raising the first one.
+        """
+        results = []
+        for future in self._futures:
+            if return_exceptions and future.exception() is not None:
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+        return results
+
+
+class AsyncMsfTable(MsfTable):
+    """
+    MsfTable whose RPC helpers are coroutines. The concrete tables below put it after the
+    synchronous table class in their MRO, so find/list/report/delete/get return awaitables.
+    """
+
+    def dbreport(self, atype, attrs):
+        attrs.update({'workspace': self.name})
+        return self.rpc.call('db.report_%s' % atype, [attrs])
+
+    def dbdel(self, atype, attrs):
+        attrs.update({'workspace': self.name})
+        return self.rpc.call('db.del_%s' % atype, [attrs])
+
+    async def dbget(self, atype, attrs):
+        attrs.update({'workspace': self.name})
+        return (await self.rpc.call('db.get_%s' % atype, [attrs]))[atype]
+
+    async def records(self, atypes, **kwargs):
+        kwargs.update({'workspace': self.name})
+        return (await self.rpc.call('db.%s' % atypes, [kwargs]))[atypes]
+
+
+class AsyncNotesTable(NotesTable, AsyncMsfTable):
+    pass
+
+
+class AsyncLootsTable(LootsTable, AsyncMsfTable):
+    pass
+
+
+class AsyncCredsTable(CredsTable, AsyncMsfTable):
+    pass
+
+
+class AsyncHostsTable(HostsTable, AsyncMsfTable):
+    pass
+
+
+class AsyncServicesTable(ServicesTable, AsyncMsfTable):
+    pass
+
+
+class AsyncVulnsTable(VulnsTable, AsyncMsfTable):
+    pass
+
+
+class AsyncEventsTable(EventsTable, AsyncMsfTable):
+    pass
+
+
+class AsyncClientsTable(ClientsTable, AsyncMsfTable):
+    pass
+
+
+class AsyncWorkspace(Workspace):
+
+    @property
+    def notes(self):
+        """
+        Returns the notes table for the current workspace.
+        """
+        return AsyncNotesTable(self.rpc, self.name)
+
+    @property
+    def hosts(self):
+        """
+        Returns the hosts table for the current workspace.
+        """
+        return AsyncHostsTable(self.rpc, self.name)
+
+    @property
+    def services(self):
+        """
+        Returns the services table for the current workspace.
+        """
+        return AsyncServicesTable(self.rpc, self.name)
+
+    @property
+    def vulns(self):
+        """
+        Returns the vulns table for the current workspace.
+        """
+        return AsyncVulnsTable(self.rpc, self.name)
+
+    @property
+    def events(self):
+        """
+        Returns the events table for the current workspace.
+        """
+        return AsyncEventsTable(self.rpc, self.name)
+
+    @property
+    def loots(self):
+        """
+        Returns the loots table for the current workspace.
+        """
+        return AsyncLootsTable(self.rpc, self.name)
+
+    @property
+    def creds(self):
+        """
+        Returns the creds table for the current workspace.
+        """
+        return AsyncCredsTable(self.rpc, self.name)
+
+    @property
+    def clients(self):
+        """
+        Returns the clients table for the current workspace.
+        """
+        return AsyncClientsTable(self.rpc, self.name)
+
+    def delete(self):
+        """
+        Delete the current workspace.
+        """
+        return self.rpc.call(MsfRpcMethod.DbDelWorkspace, [{'workspace': self.name}])
+
+    def importdata(self, data):
+        return self.rpc.call(MsfRpcMethod.DbImportData, [{'workspace': self.name, 'data': data}])
+
+    def importfile(self, fname):
+        with open(fname, mode='r') as r:
+            return self.importdata(r.read())
+
+
+class AsyncWorkspaceManager(MsfManager):
+
+    @property
+    def list(self):
+        """
+        The list of all workspaces in the current msf database.
+        """
+        return self._list()
+
+    async def _list(self):
+        return (await self.rpc.call(MsfRpcMethod.DbWorkspaces))['workspaces']
+
+    async def workspace(self, name='default'):
+        """
+        Returns a Workspace object for the given workspace name.
+
+        Optional Arguments:
+        - name : the name of the workspace
+        """
+        w = await self.list
+        if name not in w:
+            await self.add(name)
+        return AsyncWorkspace(self.rpc, name)
+
+    def add(self, name):
+        """
+        Adds a workspace with the given name.
+
+        Mandatory Arguments:
+        - name : the name of the workspace
+        """
+        return self.rpc.call(MsfRpcMethod.DbAddWorkspace, [name])
+
+    async def get(self, name):
+        """
+        Get a workspace with the given name.
+
+        Mandatory Arguments:
+        - name : the name of the workspace
+        """
+        res = await self.rpc.call(MsfRpcMethod.DbGetWorkspace, [name])
+        return res.get('workspace')
+
+    def remove(self, name):
+        """
+        Removes the workspace with the given name.
+
+        Mandatory Arguments:
+        - name : the name of the workspace
+        """
+        return self.rpc.call(MsfRpcMethod.DbDelWorkspace, [name])
+
+    def set(self, name):
+        """
+        Sets the current workspace.
+
+        Mandatory Arguments:
+        - name : the name of the workspace
+        """
+        return self.rpc.call(MsfRpcMethod.DbSetWorkspace, [name])
+
+    @property
+    def current(self):
+        """
+        The current workspace.
+        """
+        return self._current()
+
+    async def _current(self):
+        return await self.workspace((await self.rpc.call(MsfRpcMethod.DbCurrentWorkspace))['workspace'])
+
+
+class AsyncDbManager(MsfManager):
+
+    async def connect(self, username, database='msf', **kwargs):
+        """
+        Connects to a database and creates the msf schema if necessary.
+
+        Mandatory Arguments:
+        - username : the username for the database connection
+
+        Optional Keyword Arguments:
+        - host, driver, password, port : see DbManager.connect
+        - database : the database name (default: 'msf')
+        """
+        runopts = {'username': username, 'database': database}
+        runopts.update(kwargs)
+        res = await self.rpc.call(MsfRpcMethod.DbConnect, [runopts])
+        return res['result'] == 'success'
+
+    @property
+    def driver(self):
+        """
+        The current database driver in use.
+        """
+        return self._driver()
+
+    async def _driver(self):
+        return (await self.rpc.call(MsfRpcMethod.DbDriver, [{}]))['driver']
+
+    @property
+    def status(self):
+        """
+        The status of the database connection.
+        """
+        return self.rpc.call(MsfRpcMethod.DbStatus)
+
+    def disconnect(self):
+        """
+        Disconnect from the database.
+        """
+        return self.rpc.call(MsfRpcMethod.DbDisconnect)
+
+    @property
+    def workspaces(self):
+        """
+        A WorkspaceManager object.
+        """
+        return AsyncWorkspaceManager(self.rpc)
+
+    @property
+    def workspace(self):
+        """
+        The name of the current workspace.
+        """
+        return self._workspace()
+
+    async def _workspace(self):
+        return (await self.rpc.call(MsfRpcMethod.DbCurrentWorkspace))['workspace']
+
+
+class AsyncAuthManager(MsfManager):
+
+    def logout(self, sid):
+        """
+        Logs out a user for a given session ID.
+
+        Mandatory Arguments:
+        - sid : a session ID that is active.
+        """
+        return self.rpc.call(MsfRpcMethod.AuthLogout, [sid])
+
+    @property
+    def tokens(self):
+        """
+        The current list of active session IDs.
+        """
+        return self._tokens()
+
+    async def _tokens(self):
+        return (await self.rpc.call(MsfRpcMethod.AuthTokenList))['tokens']
+
+    def add(self, token):
+        """
+        Add a session ID or token.
+
+        Mandatory Argument:
+        - token : a random string used as a session identifier.
+        """
+        return self.rpc.call(MsfRpcMethod.AuthTokenAdd, [token])
+
+    def remove(self, token):
+        """
+        Remove a session ID or token.
+
+        Mandatory Argument:
+        - token : a session ID or token that is active.
+        """
+        return self.rpc.call(MsfRpcMethod.AuthTokenRemove, [token])
+
+    async def generate(self):
+        """
+        Generate a session ID or token.
+        """
+        return (await self.rpc.call(MsfRpcMethod.AuthTokenGenerate))['token']
+
+
+class AsyncJobManager(MsfManager):
+
+    @property
+    def list(self):
+        """
+        A list of currently running jobs.
+        """
+        return self.rpc.call(MsfRpcMethod.JobList)
+
+    def stop(self, jobid):
+        """
+        Stop a job.
+
+        Mandatory Argument:
+        - jobid : the ID of the job.
+        """
+        return self.rpc.call(MsfRpcMethod.JobStop, [jobid])
+
+    def info(self, jobid):
+        """
+        Get job information for a particular job.
+
+        Mandatory Argument:
+        - jobid : the ID of the job.
+        """
+        return self.rpc.call(MsfRpcMethod.JobInfo, [jobid])
+
+    def info_by_uuid(self, uuid):
+        """
+        Get job information for a particular job by its UUID.
+
+        Mandatory Argument:
+        - uuid : the UUID of the job.
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleResults, [uuid])
+
+
+class AsyncCoreManager(MsfManager):
+
+    @property
+    def version(self):
+        """
+        The version of msf core.
+        """
+        return self.rpc.call(MsfRpcMethod.CoreVersion)
+
+    def stop(self):
+        """
+        Stop the core.
+        """
+        return self.rpc.call(MsfRpcMethod.CoreStop)
+
+    def setg(self, var, val):
+        """
+        Set a global variable
+
+        Mandatory Arguments:
+        - var : the variable name
+        - val : the variable value
+        """
+        return self.rpc.call(MsfRpcMethod.CoreSetG, [var, val])
+
+    def unsetg(self, var):
+        """
+        Unset a global variable
+
+        Mandatory Arguments:
+        - var : the variable name
+        """
+        return self.rpc.call(MsfRpcMethod.CoreUnsetG, [var])
+
+    def save(self):
+        """
+        Save the core state.
+        """
+        return self.rpc.call(MsfRpcMethod.CoreSave)
+
+    def reload(self):
+        """
+        Reload all modules in the core.
+        """
+        return self.rpc.call(MsfRpcMethod.CoreReloadModules)
+
+    @property
+    def stats(self):
+        """
+        Get module statistics from the core.
+        """
+        return self.rpc.call(MsfRpcMethod.CoreModuleStats)
+
+    def addmodulepath(self, path):
+        """
+        Add a search path for additional modules.
+
+        Mandatory Arguments:
+        - path : the path to search for modules.
+        """
+        return self.rpc.call(MsfRpcMethod.CoreAddModulePath, [path])
+
+    @property
+    def threads(self):
+        """
+        The current threads running in the core.
+        """
+        return self.rpc.call(MsfRpcMethod.CoreThreadList)
+
+    def kill(self, threadid):
+        """
+        Kill a thread running in the core.
+
+        Mandatory Arguments:
+        - threadid : the thread ID.
+        """
+        return self.rpc.call(MsfRpcMethod.CoreThreadKill, [threadid])
+
+
+class AsyncModuleMixin(object):
+    """
+    Overrides the RPC-backed methods of MsfModule and its subclasses with coroutines.
+    Option handling (module['RHOSTS'] = ..., runoptions, required, ...) is inherited unchanged.
+    """
+
+    async def execute(self, **kwargs):
+        """
+        Executes the module with its run options as parameters.
+
+        Optional Keyword Arguments:
+        - payload : the payload of an exploit module (this is mandatory if the module is an exploit).
+        """
+        runopts = await self._async_payload_runoptions(kwargs.get('payload'))
+        return await self.rpc.call(MsfRpcMethod.ModuleExecute, [self.moduletype, self.modulename, runopts])
+
+    async def check(self, **kwargs):
+        """
+        Executes the check module with its run options as parameters.
+        """
+        runopts = await self._async_payload_runoptions(kwargs.get('payload'))
+        return await self.rpc.call(MsfRpcMethod.ModuleCheck, [self.moduletype, self.modulename, runopts])
+
+    async def _async_payload_runoptions(self, payload):
+        payloads = None
+        if isinstance(self, ExploitModule) and payload is not None and \
+                not self.runoptions.get('DisablePayloadHandler'):
+            with span('module.validate_payload', **{'module.target': self.target}):
+                payloads = await self.targetpayloads(self.target)
+        return self._payload_runoptions(payload, payloads)
+
+    async def payload_generate(self, **kwargs):
+        if not isinstance(self, PayloadModule):
+            return None
+        runopts = self.runoptions.copy()
+        data = await self.rpc.call(MsfRpcMethod.ModuleExecute, [self.moduletype, self.modulename, runopts], True)
+        payload = decode(data)[str.encode('payload')]
+        if isinstance(payload, str):
+            return payload
+        try:
+            payload = decode(payload)
+        except Exception:
+            return payload
+        return payload
+
+
+class AsyncExploitModule(AsyncModuleMixin, ExploitModule):
+
+    @property
+    def evasion_payloads(self):
+        """
+        A list of compatible evasion payloads.
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleCompatibleEvasionPayloads, self.modulename)
+
+    async def targetpayloads(self, t=0):
+        """
+        Returns a list of compatible payloads for a given target ID.
+
+        Optional Keyword Arguments:
+        - t : the target ID (default: 0, e.g. 'Automatic')
+        """
+        payloads = self.rpc.module_cache.get('exploit', self.modulename, ('payloads', t))
+        if payloads is None:
+            res = await self.rpc.call(MsfRpcMethod.ModuleTargetCompatiblePayloads, [self.modulename, t])
+            payloads = res['payloads']
+            self.rpc.module_cache.put('exploit', self.modulename, ('payloads', t), payloads)
+        return list(payloads)
+
+    async def targetevasionpayloads(self, t=0):
+        """
+        Returns a list of compatible evasion payloads for a given target ID.
+
+        Optional Keyword Arguments:
+        - t : the target ID (default: 0, e.g. 'Automatic')
+        """
+        res = await self.rpc.call(MsfRpcMethod.ModuleTargetCompatibleEvasionPayloads, [self.modulename, t])
+        return res['payloads']
+
+
+class AsyncPostModule(AsyncModuleMixin, PostModule):
+
+    @property
+    def sessions(self):
+        """
+        A list of compatible shell/meterpreter sessions.
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleCompatibleSessions, [self.modulename])
+
+
+class AsyncEncoderModule(AsyncModuleMixin, EncoderModule):
+    pass
+
+
+class AsyncAuxiliaryModule(AsyncModuleMixin, AuxiliaryModule):
+    pass
+
+
+class AsyncPayloadModule(AsyncModuleMixin, PayloadModule):
+    pass
+
+
+class AsyncNopModule(AsyncModuleMixin, NopModule):
+    pass
+
+
+class AsyncModuleManager(MsfManager):
+
+    module_classes = {
+        'exploit': AsyncExploitModule,
+        'post': AsyncPostModule,
+        'encoder': AsyncEncoderModule,
+        'auxiliary': AsyncAuxiliaryModule,
+        'nop': AsyncNopModule,
+        'payload': AsyncPayloadModule,
+    }
+
+    def execute(self, modtype, modname, **kwargs):
+        """
+        Execute the module.
+
+        Mandatory Arguments:
+        - modtype : the module type (e.g. 'exploit')
+        - modname : the module name (e.g. 'exploits/windows/http/icecast_header')
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleExecute, [modtype, modname, kwargs])
+
+    def search(self, match):
+        """
+        Search the module.
+
+        Mandatory Arguments:
+        - match : the keyword to find (e.g. 'http')
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleSearch, [match])
+
+    def compatible_sessions(self, mname):
+        """
+        Find Compatible session for specific modules.
+
+        Mandatory Arguments:
+        - mname : the target module name
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleCompatibleSessions, [mname])
+
+    def check(self, mtype, mname, **kwargs):
+        """
+        Runs the check method of a module.
+
+        Mandatory Arguments:
+        - mtype : Module type
+        - mname : Module name
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleCheck, [mtype, mname, kwargs])
+
+    def running_stats(self):
+        """
+        Returns the currently running module stats in each state.
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleRunningStats, [])
+
+    def info_html(self, mtype, mname):
+        """
+        Returns detailed information about a module in HTML.
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleInfoHTML, [mtype, mname])
+
+    def results(self, uuid):
+        return self.rpc.call(MsfRpcMethod.ModuleResults, [uuid])
+
+    async def _modules(self, method):
+        return (await self.rpc.call(method))['modules']
+
+    @property
+    def exploits(self):
+        """
+        A list of exploit modules.
+        """
+        return self._modules(MsfRpcMethod.ModuleExploits)
+
+    @property
+    def evasion(self):
+        """
+        A list of evasion modules.
+        """
+        return self._modules(MsfRpcMethod.ModuleEvasion)
+
+    @property
+    def payloads(self):
+        """
+        A list of payload modules.
+        """
+        return self._modules(MsfRpcMethod.ModulePayloads)
+
+    @property
+    def auxiliary(self):
+        """
+        A list of auxiliary modules.
+        """
+        return self._modules(MsfRpcMethod.ModuleAuxiliary)
+
+    @property
+    def post(self):
+        """
+        A list of post modules.
+        """
+        return self._modules(MsfRpcMethod.ModulePost)
+
+    @property
+    def encodeformats(self):
+        """
+        A list of encoding formats.
+        """
+        return self.rpc.call(MsfRpcMethod.ModuleEncodeFormats)
+
+    @property
+    def encoders(self):
+        """
+        A list of encoder modules.
+        """
+        return self._modules(MsfRpcMethod.ModuleEncoders)
+
+    @property
+    def nops(self):
+        """
+        A list of nop modules.
+        """
+        return self._modules(MsfRpcMethod.ModuleNops)
+
+    @property
+    def platforms(self):
+        """
+        A list of platform names.
+        """
+        return self.rpc.call(MsfRpcMethod.ModulePlatforms)
+
+    async def use(self, mtype, mname):
+        """
+        Returns a module object. Module info and options come from the client's ModuleCache when
+        possible, otherwise they are fetched concurrently.
+
+        Mandatory Arguments:
+        - mtype : the module type (e.g. 'exploit')
+        - mname : the module name (e.g. 'exploits/windows/http/icecast_header')
+        """
+        cls = self.module_classes.get(mtype)
+        if cls is None:
+            raise MsfRpcError('Unknown module type %s not: exploit, post, encoder, auxiliary, nop, or payload' % mname)
+        with span('modules.use', **{'module.type': mtype, 'module.name': mname}) as s:
+            metadata = self.rpc.module_cache.get(mtype, mname, 'metadata')
+            s.set('module.cached', metadata is not None)
+            if metadata is None:
+                async with self.rpc.batch() as batch:
+                    batch.call(MsfRpcMethod.ModuleInfo, [mtype, mname])
+                    batch.call(MsfRpcMethod.ModuleOptions, [mtype, mname])
+                metadata = tuple(batch.results())
+                if not any(isinstance(r, dict) and r.get('error') for r in metadata):
+                    self.rpc.module_cache.put(mtype, mname, 'metadata', metadata)
+        info, options = metadata
+        # MsfModule adds keys to its options (e.g. ACTION), so hand it copies of the cached dicts
+        return cls(self.rpc, mname, info=dict(info), options=dict(options))
+
+
+class AsyncSessionOutputStream(SessionOutputStream):
+    """
+    SessionOutputStream for asyncio sessions: iterate it with async for.
+    """
+
+    def __iter__(self):
+        raise TypeError("use 'async for' with AsyncSessionOutputStream")
+
+    async def __aiter__(self):
+        while not self.finished and not self.expired:
+            data = await self.session.read()
+            self.feed(data)
+            if data:
+                yield data
+            if not self.finished:
+                await asyncio.sleep(self.wait)
+
+
+class AsyncMsfSession(MsfSession):
+
+    __slots__ = ()
+
+    def stop(self):
+        """
+        Stop a meterpreter or shell session.
+        """
+        return self.rpc.call(MsfRpcMethod.SessionStop, [self.sid])
+
+    @property
+    def modules(self):
+        """
+        A list of compatible session modules.
+        """
+        return self._modules()
+
+    async def _modules(self):
+        return (await self.rpc.call(MsfRpcMethod.SessionCompatibleModules, [self.sid]))['modules']
+
+    @property
+    def ring(self):
+        return AsyncSessionRing(self.rpc, self.sid)
+
+    def stream(self, end_strs=None, timeout=300, **kwargs):
+        """
+        Returns an AsyncSessionOutputStream over the session's output.
+
+        Optional Keyword Arguments:
+        - end_strs : strings which signify the output is complete (default: None)
+        - timeout : seconds to keep reading (default: 300)
+        - any other SessionOutputStream keyword argument
+        """
+        return AsyncSessionOutputStream(self, end_strs, timeout, **kwargs)
+
+    async def run_with_output(self, cmd, end_strs=None, timeout=310, timeout_exception=True):
+        """
+        Run a command and wait for the output.
+
+        Mandatory Arguments:
+        - cmd : command to run in the session.
+        - end_strs : a list of strings which signify you've gathered all the command's output, e.g., ['finished', 'done']
+
+        Optional Arguments:
+        - timeout : number of seconds to wait if end_strs aren't found. 300s is default MSF comm timeout.
+        - timeout_exception : If True, raise MsfError on timeout, else return the output gathered so far.
+        """
+        await self.write(cmd)
+        return await self.gather_output(cmd, end_strs, timeout, timeout_exception)
+
+    async def gather_output(self, cmd, end_strs, timeout, timeout_exception=True):
+        """
+        Wait for session command to get all output.
+        """
+        stream = self.stream(end_strs, timeout)
+        async for _ in stream:
+            pass
+        if not stream.finished and timeout_exception:
+            raise stream.timeout_error(cmd)
+        return stream.output
+
+
+class AsyncMeterpreterSession(AsyncMsfSession):
+
+    __slots__ = ()
+
+    async def read(self):
+        """
+        Read data from the meterpreter session. The data is also recorded in the session buffer.
+        """
+        buffer = self.rpc.session_buffer(self.sid)
+        async with buffer.lock:
+            data = (await self.rpc.call(MsfRpcMethod.SessionMeterpreterRead, [self.sid]))['data']
+            buffer.append(data)
+        return data
+
+    async def write(self, data):
+        """
+        Write data to the meterpreter session.
+
+        Mandatory Arguments:
+        - data : arbitrary data or commands
+        """
+        if not data.endswith('\n'):
+            data += '\n'
+        await self.rpc.call(MsfRpcMethod.SessionMeterpreterWrite, [self.sid, data])
+
+    async def runsingle(self, data):
+        """
+        Run a single meterpreter command
+
+        Mandatory Arguments:
+        - data : arbitrary data or command
+        """
+        await self.rpc.call(MsfRpcMethod.SessionMeterpreterRunSingle, [self.sid, data])
+        return await self.read()
+
+    async def runscript(self, path):
+        """
+        Run a meterpreter script
+
+        Mandatory Arguments:
+        - path : path to a meterpreter script on the msfrpcd host.
+        """
+        await self.rpc.call(MsfRpcMethod.SessionMeterpreterScript, [self.sid, path])
+        return await self.read()
+
+    @property
+    def sep(self):
+        """
+        The operating system path separator.
+        """
+        return self._sep()
+
+    async def _sep(self):
+        return (await self.rpc.call(MsfRpcMethod.SessionMeterpreterDirectorySeparator, [self.sid]))['separator']
+
+    def detach(self):
+        """
+        Detach the meterpreter session.
+        """
+        return self.rpc.call(MsfRpcMethod.SessionMeterpreterSessionDetach, [self.sid])
+
+    def kill(self):
+        """
+        Kill the meterpreter session.
+        """
+        return self.rpc.call(MsfRpcMethod.SessionMeterpreterSessionKill, [self.sid])
+
+    async def tabs(self, line):
+        """
+        Return a list of commands for a partial command line (tab completion).
+
+        Mandatory Arguments:
+        - line : a partial command line for completion.
+        """
+        return (await self.rpc.call(MsfRpcMethod.SessionMeterpreterTabs, [self.sid, line]))['tabs']
+
+
+class AsyncShellSession(AsyncMsfSession):
+
+    __slots__ = ()
+
+    async def read(self):
+        """
+        Read data from the shell session. The data is also recorded in the session buffer.
+        """
+        buffer = self.rpc.session_buffer(self.sid)
+        async with buffer.lock:
+            data = (await self.rpc.call(MsfRpcMethod.SessionShellRead, [self.sid]))['data']
+            buffer.append(data)
+        return data
+
+    async def write(self, data):
+        """
+        Write data to the shell session.
+
+        Mandatory Arguments:
+        - data : arbitrary data or commands
+        """
+        if not data.endswith('\n'):
+            data += '\n'
+        await self.rpc.call(MsfRpcMethod.SessionShellWrite, [self.sid, data])
+
+    async def upgrade(self, lhost, lport):
+        """
+        Upgrade the current shell session.
+        """
+        await self.rpc.call(MsfRpcMethod.SessionShellUpgrade, [self.sid, lhost, lport])
+        return await self.read()
+
+
+class AsyncSessionRing(object):
+
+    def __init__(self, rpc, token):
+        self.rpc = rpc
+        self.sid = token
+
+    def read(self, seq=None):
+        """
+        Reads the session ring.
+
+        Optional Keyword Arguments:
+        - seq : the sequence ID of the ring (default: 0)
+        """
+        if seq is not None:
+            return self.rpc.call(MsfRpcMethod.SessionRingRead, [self.sid, seq])
+        return self.rpc.call(MsfRpcMethod.SessionRingRead, [self.sid])
+
+    def put(self, line):
+        """
+        Add a command to the session history.
+
+        Mandatory Arguments:
+        - line : arbitrary data.
+        """
+        return self.rpc.call(MsfRpcMethod.SessionRingPut, [self.sid, line])
+
+    @property
+    def last(self):
+        """
+        Returns the last sequence ID in the session ring.
+        """
+        return self._last()
+
+    async def _last(self):
+        return int((await self.rpc.call(MsfRpcMethod.SessionRingLast, [self.sid]))['seq'])
+
+    def clear(self):
+        """
+        Clear the session ring.
+        """
+        return self.rpc.call(MsfRpcMethod.SessionRingClear, [self.sid])
+
+
+class AsyncSessionRegistry(SessionRegistry):
+
+    async def refresh(self):
+        """
+        Fetch session.list and update the registry with it.
+        """
+        if self.rpc.response_cache is not None:
+            self.rpc.response_cache.discard(MsfRpcMethod.SessionList)
+        return self.update(await self.rpc.call(MsfRpcMethod.SessionList))
+
+    async def get(self, sid):
+        """
+        Returns (id, record) for a session id or uuid, refreshing the registry when it is stale or
+        does not know the session yet. Raises KeyError for unknown sessions.
+        """
+        found = self.lookup(sid) if self.fresh else None
+        if found is None:
+            await self.refresh()
+            found = self.lookup(sid)
+        if found is None:
+            raise KeyError('Session ID (%s) does not exist' % sid)
+        return found
+
+    def start(self):
+        """
+        Refresh the registry every interval seconds from a task on the running loop, until stop().
+        """
+        if self._stop is None:
+            # Not part of the trace of whatever started it
+            self._stop = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.cancel()
+            self._stop = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except (MsfError, MsfRpcError, httpx.HTTPError):
+                # msfrpcd is unreachable or rejected the call: keep the last known sessions
+                pass
+            await asyncio.sleep(self.interval)
+
+
+class AsyncSessionManager(MsfManager):
+
+    @property
+    def list(self):
+        """
+        A list of active sessions.
+        """
+        return self._list()
+
+    async def _list(self):
+        registry = self.rpc.session_registry
+        registry.update(await self.rpc.call(MsfRpcMethod.SessionList))
+        return dict(registry.sessions)
+
+    async def session(self, sid):
+        """
+        Returns a session object for meterpreter or shell sessions.
+
+        Mandatory Arguments:
+        - sid : the session identifier or uuid
+        """
+        sid, record = await self.rpc.session_registry.get(sid)
+        if record['type'] == 'meterpreter':
+            return AsyncMeterpreterSession(sid, self.rpc, record)
+        elif record['type'] == 'shell':
+            return AsyncShellSession(sid, self.rpc, record)
+        raise NotImplementedError('Could not determine session type: %s' % record['type'])
+
+
+class AsyncMsfConsole(object):
+
+    def __init__(self, rpc, cid):
+        """
+        Wraps an existing msf console, use AsyncConsoleManager.console() to create one.
+
+        Mandatory Arguments:
+        - rpc : the msfrpc client object.
+        - cid : the console identifier.
+        """
+        self.rpc = rpc
+        self.cid = cid
+        self.busy = None
+        self.prompt = None
+
+    def _checked(self, result):
+        # msfrpcd answers console calls for an unknown console with a failure instead of an error
+        if result.get('result') == 'failure':
+            raise KeyError('Console ID (%s) does not exist' % self.cid)
+        return result
+
+    async def read(self):
+        """
+        Read data from the console. The busy flag and prompt it returns are kept in .busy and .prompt.
+        """
+        result = self._checked(await self.rpc.call(MsfRpcMethod.ConsoleRead, [self.cid]))
+        self.busy = result.get('busy')
+        self.prompt = result.get('prompt')
+        return result
+
+    async def write(self, command):
+        """
+        Write data to the console.
+        """
+        if not command.endswith('\n'):
+            command += '\n'
+        return self._checked(await self.rpc.call(MsfRpcMethod.ConsoleWrite, [self.cid, command]))
+
+    async def run_command(self, command, timeout=30, min_interval=0.01, max_interval=1.0, settle=1.0, end_strs=None):
+        """
+        Run a console command and collect its output until the console is idle again.
+
+        Busy state comes from the console.read responses themselves, so no console.list calls are
+        needed. Reads back off exponentially from min_interval to max_interval while nothing
+        arrives. msfrpcd may report the console idle before it has picked the command up, so an
+        idle console only ends the wait once it produced output, was seen busy, or settle seconds
+        passed, and only when the next read finds it still idle with nothing more to print: between
+        the lines of a multi-line command the console can look idle for a moment. Returns a dict with the accumulated 'data', the 'prompt', and whether the command
+        'finished' within the timeout.
+
+        Mandatory Arguments:
+        - command : the console command, or several separated by newlines
+
+        Optional Keyword Arguments:
+        - timeout : seconds to wait for the command (default: 30)
+        - min_interval / max_interval : the bounds of the wait between reads, in seconds
+        - settle : seconds after which an idle console without output counts as done (default: 1)
+        - end_strs : strings which signify the command is done even if the console is still busy
+        """
+        await self.write(command)
+        start = time.monotonic()
+        deadline = start + timeout
+        interval = min_interval
+        chunks = []
+        matcher = MultiPatternMatcher(end_strs) if end_strs else None
+        seen_busy = False
+        idle = False
+        while True:
+            result = await self.read()
+            if result['data']:
+                chunks.append(result['data'])
+                interval = min_interval
+                if matcher is not None and matcher.feed(result['data']) is not None:
+                    finished = True
+                    break
+            else:
+                interval = min(interval * 2, max_interval)
+            seen_busy = seen_busy or result['busy']
+            now = time.monotonic()
+            if result['busy'] or not (chunks or seen_busy or now - start >= settle):
+                idle = False
+            elif idle and not result['data']:
+                finished = True
+                break
+            else:
+                # Confirm with one more read straight away
+                idle = True
+                interval = min_interval
+            if now >= deadline:
+                finished = False
+                break
+            await asyncio.sleep(min(interval, deadline - now))
+        return {'data': ''.join(chunks), 'prompt': result.get('prompt', ''), 'finished': finished}
+
+    def sessionkill(self):
+        """
+        Kill all active meterpreter or shell sessions.
+        """
+        return self.rpc.call(MsfRpcMethod.ConsoleSessionKill, [self.cid])
+
+    def sessiondetach(self):
+        """
+        Detach the current meterpreter or shell session.
+        """
+        return self.rpc.call(MsfRpcMethod.ConsoleSessionDetach, [self.cid])
+
+    async def tabs(self, line):
+        """
+        Tab completion for console commands.
+
+        Mandatory Arguments:
+        - line : a partial command to be completed.
+        """
+        return (await self.rpc.call(MsfRpcMethod.ConsoleTabs, [self.cid, line]))['tabs']
+
+    def destroy(self):
+        """
+        Destroy the console.
+        """
+        return self.rpc.call(MsfRpcMethod.ConsoleDestroy, [self.cid])
+
+    async def is_busy(self):
+        """
+        Checks if the console is busy, using console.list since .read() clears the data buffer.
+        """
+        cons = (await self.rpc.call(MsfRpcMethod.ConsoleList))['consoles']
+        for c in cons:
+            if c['id'] == self.cid:
+                return c['busy']
+
+    async def run_module_with_output(self, mod, payload=None, run_as_job=False, timeout=301, end_strs=None):
+        """
+        Execute a module and wait for the returned data
+
+        The whole module script is sent in one write and output is collected by run_command, so
+        a run costs one write plus adaptively spaced reads.
+
+        Mandatory Arguments:
+        - mod : the MsfModule object
+
+        Optional Keyword Arguments:
+        - payload : the MsfModule object to be used as payload
+        - end_strs : strings which signify the module is done, e.g. ['Exploit completed'], so the
+                     wait can end before the console reports it is no longer busy
+        """
+        # Clears the data buffer and tells whether the console is busy in one call
+        if (await self.read())['busy']:
+            raise MsfError('Console {} is busy'.format(self.cid))
+        payloads = None
+        if mod.moduletype == 'exploit' and isinstance(payload, PayloadModule):
+            payloads = await mod.targetpayloads(mod.target)
+        options_str = MsfConsole.module_script(mod, payload, run_as_job, payloads)
+        return (await self.run_command(options_str, timeout, end_strs=end_strs))['data']
+
+
+class AsyncConsoleManager(MsfManager):
+
+    @property
+    def list(self):
+        """
+        A list of active consoles.
+        """
+        return self._list()
+
+    async def _list(self):
+        return (await self.rpc.call(MsfRpcMethod.ConsoleList))['consoles']
+
+    async def console(self, cid=None):
+        """
+        Connect to an active console otherwise create a new console.
+
+        Optional Keyword Arguments:
+        - cid : the console identifier.
+        """
+        if cid is None:
+            r = await self.rpc.call(MsfRpcMethod.ConsoleCreate)
+            if 'id' not in r:
+                raise MsfRpcError('Unable to create a new console.')
+            return AsyncMsfConsole(self.rpc, r['id'])
+        s = [i['id'] for i in await self.list]
+        if cid not in s:
+            raise KeyError('Console ID (%s) does not exist' % cid)
+        return AsyncMsfConsole(self.rpc, cid)
+
+    def destroy(self, cid):
+        """
+        Destroy an active console.
+
+        Mandatory Arguments:
+        - cid : the console identifier.
+        """
+        return self.rpc.call(MsfRpcMethod.ConsoleDestroy, [cid])
@@ -0,0 +1,12 @@
+import pytest
+
+from benchmarks.stub_server import StubMsfRpcServer
+
+
+@pytest.fixture
+def stub():
+    """A stub msfrpcd serving from a thread on a free local port."""
+    server = StubMsfRpcServer(sessions=2, modules=10, hosts=10, command_delay=0.0).serve_in_thread()
+    yield server
+    server.shutdown()
+    server.server_close()
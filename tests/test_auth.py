@@ -0,0 +1,85 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.stub_server import rpc_error
+from msfrpc import MsfAuthError, MsfRpcClient
+from msfrpc_async import AsyncMsfRpcClient
+
+
+def reject_every_token(*args):
+    return rpc_error('Invalid Authentication Token', code=401)
+
+
+def test_sync_client_logs_in_once_and_retries_once_after_the_token_expires(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        logins = stub.calls['auth.login']
+        stub.tokens.discard(client.token)
+        assert client.call('core.version')['version'] == '6.4.0-stub'
+        assert stub.calls['auth.login'] == logins + 1
+        assert stub.calls['core.version'] == 2
+        assert client.token in stub.tokens
+
+
+def test_sync_client_raises_when_the_new_token_is_rejected_too(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        logins = stub.calls['auth.login']
+        stub.methods['core.version'] = reject_every_token
+        with pytest.raises(MsfAuthError):
+            client.call('core.version')
+        assert stub.calls['auth.login'] == logins + 1
+        assert stub.calls['core.version'] == 2
+
+
+def test_sync_client_logs_in_once_for_concurrent_rejected_calls(stub):
+    stub.latency = 0.02
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port, response_cache=None) as client:
+        logins = stub.calls['auth.login']
+        stub.tokens.discard(client.token)
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda i: client.call('module.info', ['exploit', 'exploit/%d' % i]), range(8)))
+        assert not any('error' in r for r in results)
+        assert stub.calls['auth.login'] == logins + 1
+
+
+def test_async_client_logs_in_once_and_retries_once_after_the_token_expires(stub):
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            await client.login()
+            stub.tokens.discard(client.token)
+            assert (await client.call('core.version'))['version'] == '6.4.0-stub'
+            assert stub.calls['auth.login'] == 2
+            assert stub.calls['core.version'] == 2
+
+    asyncio.run(run())
+
+
+def test_async_client_raises_when_the_new_token_is_rejected_too(stub):
+    stub.methods['core.version'] = reject_every_token
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            await client.login()
+            with pytest.raises(MsfAuthError):
+                await client.call('core.version')
+            assert stub.calls['auth.login'] == 2
+            assert stub.calls['core.version'] == 2
+
+    asyncio.run(run())
+
+
+def test_async_client_logs_in_once_for_concurrent_rejected_calls(stub):
+    stub.latency = 0.02
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, response_cache=None) as client:
+            await client.login()
+            stub.tokens.discard(client.token)
+            results = await asyncio.gather(*(client.call('module.info', ['exploit', 'exploit/%d' % i])
+                                             for i in range(8)))
+            assert not any('error' in r for r in results)
+            assert stub.calls['auth.login'] == 2
+            assert stub.calls['module.info'] == 16
+
+    asyncio.run(run())
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+import requests
+
+from msfrpc import MsfRpcClient
+from msfrpc_async import AsyncMsfRpcClient
+
+
+def add_echo(stub):
+    """A method answering n after a delay that shrinks with n, so later calls finish first."""
+    lock = threading.Lock()
+    finished = []
+    in_flight = []
+    peak = []
+
+    def echo(n):
+        with lock:
+            in_flight.append(n)
+            peak.append(len(in_flight))
+        time.sleep((5 - n) * 0.02)
+        with lock:
+            in_flight.remove(n)
+            finished.append(n)
+        return {'n': n}
+
+    stub.methods['core.echo'] = echo
+    return finished, peak
+
+
+def add_slow(stub):
+    stub.methods['core.slow'] = lambda: time.sleep(0.5) or {'slow': True}
+
+
+def test_results_keep_submission_order(stub):
+    finished, _ = add_echo(stub)
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        with client.batch() as batch:
+            futures = [batch.call('core.echo', [n]) for n in range(5)]
+    assert finished != sorted(finished)
+    assert batch.results() == [{'n': n} for n in range(5)]
+    assert [f.result() for f in futures] == batch.results()
+
+
+def test_one_failed_call_keeps_the_other_results(stub):
+    add_echo(stub)
+    add_slow(stub)
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        with client.batch() as batch:
+            batch.call('core.echo', [1])
+            failed = batch.call('core.slow', timeout=0.1)
+            batch.call('no.such_method')
+            batch.call('core.echo', [2])
+    first, error, unknown, last = batch.results(return_exceptions=True)
+    assert isinstance(error, requests.Timeout) and failed.exception() is error
+    # msfrpcd errors are responses, not exceptions, like for client.call
+    assert unknown['error'] and 'no.such_method' in unknown['error_message']
+    assert (first, last) == ({'n': 1}, {'n': 2})
+    with pytest.raises(requests.Timeout):
+        batch.results()
+
+
+def test_an_exception_in_the_block_sends_nothing(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        with pytest.raises(ValueError):
+            with client.batch() as batch:
+                queued = batch.call('core.version')
+                raise ValueError('not now')
+    assert queued.cancelled()
+    assert 'core.version' not in stub.calls
+
+
+def test_async_batch_keeps_order_limits_concurrency_and_isolates_failures(stub):
+    finished, peak = add_echo(stub)
+    add_slow(stub)
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            async with client.batch() as batch:
+                for n in range(5):
+                    batch.call('core.echo', [n])
+            in_order = batch.results()
+            peak.clear()
+            async with client.batch(concurrency=2) as limited:
+                for n in range(5):
+                    limited.call('core.echo', [n])
+                limited.call('core.slow', timeout=0.1)
+            return in_order, limited.results(return_exceptions=True)
+
+    in_order, limited = asyncio.run(run())
+    assert in_order == [{'n': n} for n in range(5)]
+    assert finished[:5] != sorted(finished[:5])
+    assert limited[:5] == in_order
+    assert isinstance(limited[5], httpx.TimeoutException)
+    assert max(peak) <= 2
@@ -0,0 +1,34 @@
+import asyncio
+
+from msfrpc_async import AsyncMsfRpcClient
+from utils.cassette import Cassette
+from benchmarks.replay_server import ReplayMsfRpcServer
+
+CALLS = [
+    ('core.version', []),
+    ('module.info', ['exploit', 'windows/smb/ms17_010_eternalblue']),
+    ('session.list', []),
+]
+
+
+async def make_calls(port, **kwargs):
+    async with AsyncMsfRpcClient('msf', port=port, response_cache=None, **kwargs) as client:
+        return [await client.call(method, list(opts)) for method, opts in CALLS]
+
+
+def test_recorded_calls_replay_the_same_responses(stub, tmp_path):
+    path = str(tmp_path / 'engagement.cassette.gz')
+    cassette = Cassette(path)
+    recorded = asyncio.run(make_calls(stub.port, cassette=cassette))
+    cassette.close()
+    assert cassette.records == len(CALLS)
+    assert [record[1] for record in Cassette.read(path)] == [method for method, _ in CALLS]
+
+    server = ReplayMsfRpcServer(path, speed=0).serve_in_thread()
+    try:
+        replayed = asyncio.run(make_calls(server.port))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert replayed == recorded
+    assert server.stats['misses'] == {}
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import pytest
+
+from msfrpc import MsfError, MsfRpcClient
+from msfrpc_async import AsyncMsfRpcClient
+
+
+def script_reads(stub, replies, then_busy=False):
+    """Make the stub answer console reads with (data, busy) replies, then with no data."""
+    replies = iter(replies)
+
+    def read(cid):
+        data, busy = next(replies, ('', then_busy))
+        return {'data': data, 'prompt': 'msf6 > ', 'busy': busy}
+
+    stub.methods['console.read'] = read
+
+
+def record_writes(stub):
+    writes = []
+    write = stub.methods['console.write']
+
+    def recording(cid, data):
+        writes.append(data)
+        return write(cid, data)
+
+    stub.methods['console.write'] = recording
+    return writes
+
+
+def test_end_string_split_across_reads(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        console = client.consoles.console()
+        script_reads(stub, [('', True), ('[*] Exploit comp', True), ('leted\n', True), ('never read', True)])
+        result = console.run_command('exploit', timeout=5, end_strs=['Exploit completed'])
+    assert result == {'data': '[*] Exploit completed\n', 'prompt': 'msf6 > ', 'finished': True}
+    assert stub.calls['console.read'] == 3
+
+
+def test_timeout_returns_the_output_read_so_far(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        console = client.consoles.console()
+        script_reads(stub, [('partial ', True), ('output', True)], then_busy=True)
+        started = time.monotonic()
+        result = console.run_command('exploit', timeout=0.3)
+    assert time.monotonic() - started < 1.0
+    assert result['data'] == 'partial output' and not result['finished']
+
+
+def test_busy_flipping_between_commands_does_not_end_the_wait(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        console = client.consoles.console()
+        script_reads(stub, [
+            # Not picked up yet, then the first command runs and the console idles before the second
+            ('', False), ('', True), ('[*] first\n', True), ('[*] first done\n', False),
+            ('', True), ('[*] second done\n', False),
+        ])
+        result = console.run_command('first\nsecond', timeout=5, settle=5)
+    assert result['data'] == '[*] first\n[*] first done\n[*] second done\n'
+    assert result['finished']
+    # The last read only confirms the console stayed idle
+    assert stub.calls['console.read'] == 7
+
+
+def test_idle_console_without_output_is_done_after_settle(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        console = client.consoles.console()
+        script_reads(stub, [])
+        started = time.monotonic()
+        result = console.run_command('setg VERBOSE true', timeout=5, max_interval=0.02, settle=0.1)
+    assert time.monotonic() - started >= 0.1
+    assert result == {'data': '', 'prompt': 'msf6 > ', 'finished': True}
+
+
+def test_async_run_command_waits_out_busy_flips_and_times_out_with_partial_output(stub):
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            console = await client.consoles.console()
+            script_reads(stub, [('', True), ('[*] a\n', False), ('', True), ('[*] b\n', False)])
+            done = await console.run_command('a\nb', timeout=5)
+            script_reads(stub, [('partial', True)], then_busy=True)
+            return done, await console.run_command('c', timeout=0.2)
+
+    done, partial = asyncio.run(run())
+    assert done['data'] == '[*] a\n[*] b\n' and done['finished']
+    assert partial['data'] == 'partial' and not partial['finished']
+
+
+def test_run_module_refuses_a_busy_console(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        module = client.modules.use('auxiliary', client.modules.auxiliary[0])
+        console = client.consoles.console()
+        script_reads(stub, [('', True)])
+        with pytest.raises(MsfError, match='busy'):
+            console.run_module_with_output(module, timeout=5)
+    assert 'console.write' not in stub.calls
+
+
+def test_run_module_sends_one_write_and_finds_a_split_end_string(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        module = client.modules.use('auxiliary', client.modules.auxiliary[0])
+        console = client.consoles.console()
+        writes = record_writes(stub)
+        # The first read only clears what an earlier command left behind
+        script_reads(stub, [
+            ('stale output\n', False), ('', True),
+            ('[*] Auxiliary module execution comp', True), ('leted\n', True), ('never read', True),
+        ])
+        output = console.run_module_with_output(module, timeout=5, end_strs=['module execution completed'])
+    assert output == '[*] Auxiliary module execution completed\n'
+    assert writes == [console.module_script(module) + '\n']
+    assert stub.calls['console.read'] == 4
+
+
+def test_run_module_timeout_returns_the_output_read_so_far(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        module = client.modules.use('auxiliary', client.modules.auxiliary[0])
+        console = client.consoles.console()
+        script_reads(stub, [('', False), ('[*] Running ', True), ('module\n', True)], then_busy=True)
+        started = time.monotonic()
+        output = console.run_module_with_output(module, timeout=0.3, end_strs=['never'])
+    assert time.monotonic() - started < 1.0
+    assert output == '[*] Running module\n'
+
+
+def test_async_run_module_finds_a_split_end_string_and_refuses_a_busy_console(stub):
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            module = await client.modules.use('auxiliary', (await client.modules.auxiliary)[0])
+            console = await client.consoles.console()
+            script_reads(stub, [('', False), ('[*] do', True), ('ne here\n', True)], then_busy=True)
+            output = await console.run_module_with_output(module, timeout=5, end_strs=['done here'])
+            script_reads(stub, [('', True)])
+            with pytest.raises(MsfError, match='busy'):
+                await console.run_module_with_output(module, timeout=5)
+            return output
+
+    assert asyncio.run(run()) == '[*] done here\n'
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+
+from msfrpc import MsfError, MsfRpcClient, MsfRpcError
+from msfrpc_async import AsyncMsfRpcClient
+from utils.console_pool import AsyncConsolePool, ConsolePool
+from utils.tracing import Tracer, _current_span
+
+
+def test_partly_failed_fill_keeps_the_consoles_it_created(stub):
+    create = stub.methods['console.create']
+    creates = []
+
+    def flaky_create():
+        creates.append(1)
+        return {} if len(creates) == 2 else create()
+
+    stub.methods['console.create'] = flaky_create
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            pool = AsyncConsolePool(client, size=3)
+            with pytest.raises(MsfRpcError):
+                await pool.fill()
+            assert pool.total == 2
+            assert {console.cid for console, _ in pool._idle} == set(stub.consoles)
+            # The next fill only creates the missing console
+            stub.methods['console.create'] = create
+            await pool.fill()
+            assert pool.stats['idle'] == 3
+            assert len(stub.consoles) == 3
+
+    asyncio.run(run())
+
+
+def test_pool_grows_to_max_size_then_waits_for_a_release(stub):
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            pool = AsyncConsolePool(client, size=1, max_size=2)
+            await pool.fill()
+            assert len(stub.consoles) == 1
+            first = await pool.acquire()
+            second = await pool.acquire()
+            assert len(stub.consoles) == 2
+            with pytest.raises(MsfError):
+                await pool.acquire(timeout=0.1)
+            waiting = asyncio.ensure_future(pool.acquire(timeout=5))
+            await pool.release(first)
+            assert (await waiting).cid == first.cid
+            assert pool.stats['waits'] >= 1
+            assert len(stub.consoles) == 2
+            await pool.release(second)
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_extra_consoles_are_reaped_once_traffic_stops(stub):
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            pool = AsyncConsolePool(client, size=1, max_size=3, idle_timeout=0.5)
+            consoles = [await pool.acquire() for _ in range(3)]
+            await asyncio.gather(*(pool.release(console) for console in consoles))
+            assert pool.total == 3
+            # No more leases or releases, the timer alone shrinks the pool back
+            await asyncio.sleep(1.0)
+            assert pool.total == 1
+            assert len(stub.consoles) == 1
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_sync_pool_reaps_extra_consoles_once_traffic_stops(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        pool = ConsolePool(client, size=1, max_size=3, idle_timeout=0.5)
+        consoles = [pool.acquire() for _ in range(3)]
+        for console in consoles:
+            pool.release(console)
+        assert pool.total == 3
+        time.sleep(1.5)
+        assert pool.total == 1
+        assert len(stub.consoles) == 1
+        pool.close()
+
+
+def test_release_after_the_client_is_closed(stub):
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            pool = AsyncConsolePool(client, size=1)
+            console = await pool.take()
+        # As a release_later task finishing at shutdown does
+        await pool.release(console)
+        assert pool.recycled == 1
+
+    asyncio.run(run())
+
+
+def test_background_refill_is_not_traced_as_part_of_the_tool_call(stub, tmp_path):
+    tracer = Tracer(path=str(tmp_path / 'trace.jsonl'))
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            pool = AsyncConsolePool(client, size=1)
+            spans = []
+
+            async def fill():
+                spans.append(_current_span.get())
+
+            pool.fill = fill
+            with tracer.trace('console_create'):
+                await pool.take()
+            await asyncio.gather(*pool._tasks)
+            assert spans == [None]
+
+    asyncio.run(run())
+    tracer.close()
@@ -0,0 +1,87 @@
+import msgpack
+import pytest
+from pymetasploit3.utils import convert, decode
+
+from msfrpc import MsfRpcClient
+from utils.decoding import decode_response
+
+
+BINARY = bytes(range(128, 256)) + b'\x00MZ\x90'
+
+BODIES = {
+    'flat': {b'result': b'success', b'job_id': 3, b'uuid': b'abc'},
+    'nested': {b'modules': [b'exploit/a', b'exploit/b'], b'info': {b'name': b'x', b'targets': {0: b'Auto'},
+                                                                    b'refs': [[b'CVE', b'2017-0144']]}},
+    'str types': {'result': 'already text', 'list': ['a', b'b', 1.5, None, True, -7]},
+    'bytes keys': {b'\xc3\xa9t\xc3\xa9': b'summer', b'\xff': b'key is not utf-8'},
+    'invalid utf-8 values': {b'data': BINARY, b'list': [b'ok', BINARY], b'nested': {b'more': [BINARY, b'text']}},
+    'latin-1': {b'banner': 'caf\xe9'.encode('latin-1')},
+    'top-level bytes': BINARY,
+    'empty': {},
+}
+
+ENCODINGS = [('utf-8',), ('utf-8', 'latin-1'), ('ascii', 'utf-8')]
+ERRORS = ['strict', 'replace', 'ignore', 'surrogateescape', 'backslashreplace']
+
+
+def same(a, b):
+    """Equal, with the same types all the way down."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return len(a) == len(b) and all(k in b and same(v, b[k]) for k, v in a.items()) and \
+            [type(k) for k in a] == [type(k) for k in b]
+    if isinstance(a, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def outcome(fn):
+    try:
+        return 'ok', fn()
+    except Exception as e:
+        return 'raised', type(e)
+
+
+@pytest.mark.parametrize('body', BODIES.values(), ids=BODIES.keys())
+@pytest.mark.parametrize('encodings', ENCODINGS, ids='+'.join)
+@pytest.mark.parametrize('errors', ERRORS)
+def test_decode_response_matches_convert_of_decode(body, encodings, errors):
+    data = msgpack.packb(body, use_bin_type=True)
+    expected = outcome(lambda: convert(decode(data), encodings, errors))
+    actual = outcome(lambda: decode_response(data, encodings, errors))
+    assert expected[0] == actual[0]
+    if expected[0] == 'ok':
+        assert same(expected[1], actual[1]), (expected[1], actual[1])
+    else:
+        assert expected[1] is actual[1]
+
+
+def test_binary_fields_decoded_with_surrogateescape_give_back_their_bytes():
+    data = msgpack.packb({b'payload': BINARY, b'parts': [BINARY[:10], BINARY[10:]]}, use_bin_type=True)
+    result = decode_response(data, ('utf-8',), 'surrogateescape')
+    assert result['payload'].encode('utf-8', 'surrogateescape') == BINARY
+    assert b''.join(p.encode('utf-8', 'surrogateescape') for p in result['parts']) == BINARY
+
+
+def test_invalid_utf_8_in_a_strict_client_raises():
+    data = msgpack.packb({b'payload': BINARY}, use_bin_type=True)
+    with pytest.raises(UnicodeDecodeError):
+        decode_response(data)
+
+
+@pytest.mark.parametrize('fast_decode', [True, False])
+def test_clients_decode_the_same_way_and_leave_raw_bodies_as_bytes(stub, fast_decode):
+    stub.payload_size = 1000
+    opts = ['exploit', 'windows/smb/ms17_010_eternalblue']
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port, fast_decode=fast_decode,
+                      decode_error_handling='surrogateescape') as client:
+        info = client.call('module.info', opts)
+        assert same(info, convert(decode(client.call('module.info', opts, is_raw=True)), ['utf-8'], 'strict'))
+        opts = ['payload', 'windows/meterpreter/reverse_tcp', {}]
+        body = client.call('module.execute', opts, is_raw=True)
+        assert isinstance(body, bytes)
+        raw = msgpack.unpackb(body)[b'payload']
+        assert isinstance(raw, bytes) and raw.startswith(bytes(range(128, 256)))
+        payload = client.call('module.execute', opts)['payload']
+        assert len(payload.encode('utf-8', 'surrogateescape')) == 1000
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from msfrpc_async import AsyncMsfRpcClient
+from utils.module_cache import ModuleCache
+
+EXPLOIT = 'windows/smb/ms17_010_eternalblue'
+
+
+def test_least_recently_used_module_is_evicted():
+    cache = ModuleCache(maxsize=2)
+    cache.put('exploit', 'a', 'metadata', 1)
+    cache.put('exploit', 'b', 'metadata', 2)
+    assert cache.get('exploit', 'a', 'metadata') == 1
+    cache.put('exploit', 'c', 'metadata', 3)
+    assert cache.get('exploit', 'b', 'metadata') is None
+    assert cache.get('exploit', 'a', 'metadata') == 1
+    assert cache.stats['size'] == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = ModuleCache(ttl=0.05)
+    cache.put('exploit', 'a', 'metadata', 1)
+    time.sleep(0.06)
+    assert cache.get('exploit', 'a', 'metadata') is None
+    assert cache.stats['size'] == 0
+
+
+def test_error_responses_are_not_cached():
+    cache = ModuleCache()
+    cache.put('exploit', 'a', 'metadata', {'error': True, 'error_message': 'Invalid Module'})
+    assert cache.get('exploit', 'a', 'metadata') is None
+
+
+def test_export_and_load_round_trip():
+    cache = ModuleCache()
+    cache.put('exploit', 'a', 'metadata', ({'name': 'A'}, {'RHOSTS': {}}))
+    cache.put('exploit', 'a', ('payloads', 0), ['generic/shell_reverse_tcp'])
+    loaded = ModuleCache()
+    loaded.load(cache.export())
+    assert loaded.get('exploit', 'a', 'metadata') == ({'name': 'A'}, {'RHOSTS': {}})
+    # Only the info and options are persisted
+    assert loaded.get('exploit', 'a', ('payloads', 0)) is None
+
+
+def test_client_clears_the_cache_when_msfrpcd_reloads_modules(stub):
+    stub.methods['core.reload_modules'] = lambda: {'result': 'success'}
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            await client.modules.use('exploit', EXPLOIT)
+            await client.modules.use('exploit', EXPLOIT)
+            assert stub.calls['module.info'] == 1
+            await client.call('core.reload_modules')
+            assert client.module_cache.invalidations == 1
+            await client.modules.use('exploit', EXPLOIT)
+            assert stub.calls['module.info'] == 2
+
+    asyncio.run(run())
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from msfrpc_async import AsyncMsfRpcClient
+from utils import module_catalog
+from utils.module_catalog import ModuleCatalog, rank_name
+
+
+def test_build_caps_module_info_calls_in_flight(stub):
+    info = stub.methods['module.info']
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def slow_info(*args):
+        with lock:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.pop()
+        return info(*args)
+
+    stub.methods['module.info'] = slow_info
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, pool_size=20) as client:
+            catalog = ModuleCatalog(concurrency=2)
+            await catalog.build(client)
+            return catalog
+
+    catalog = asyncio.run(run())
+    assert catalog.stats['modules'] > 2
+    assert catalog.failed == 0
+    assert max(peak) <= 2
+
+
+def test_failed_snapshot_save_removes_its_temporary_file(tmp_path, monkeypatch):
+    path = tmp_path / 'modules.msgpack'
+
+    def fail(src, dst):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(os, 'replace', fail)
+    with pytest.raises(OSError):
+        ModuleCatalog().save(str(path))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_numeric_ranks_are_searchable_by_name(stub):
+    info = stub.methods['module.info']
+
+    def numeric_rank(mtype, mname):
+        result = dict(info(mtype, mname))
+        # msfrpcd versions differ in whether they send the rank's name or its number
+        result['rank'] = 600 if mname.endswith(('0', '2', '4', '6', '8')) else 'Great'
+        return result
+
+    stub.methods['module.info'] = numeric_rank
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            catalog = ModuleCatalog()
+            await catalog.build(client)
+            return catalog
+
+    catalog = asyncio.run(run())
+    excellent = catalog.search('rank:excellent')
+    great = catalog.search('rank:great')
+    assert excellent and great
+    assert len(excellent) + len(great) == catalog.stats['modules']
+    assert {m['rank'] for m in excellent} == {'excellent'}
+    assert catalog.search('rank:600') == []
+    assert [rank_name(r) for r in (0, '300', ' Normal ', 'excellent', 450)] == \
+        ['manual', 'normal', 'normal', 'excellent', '450']
+
+
+def test_snapshot_is_saved_and_loaded_off_the_event_loop(stub, tmp_path, monkeypatch):
+    threads = []
+    save = ModuleCatalog.save
+    load = ModuleCatalog.load
+
+    def record_save(self, *args):
+        threads.append(('save', threading.current_thread()))
+        return save(self, *args)
+
+    def record_load(self, *args):
+        threads.append(('load', threading.current_thread()))
+        time.sleep(0.05)
+        return load(self, *args)
+
+    monkeypatch.setattr(ModuleCatalog, 'save', record_save)
+    monkeypatch.setattr(ModuleCatalog, 'load', record_load)
+    path = str(tmp_path / 'modules.msgpack')
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            await ModuleCatalog(snapshot_path=path).build(client)
+        catalog = ModuleCatalog(snapshot_path=path)
+        monkeypatch.setattr(module_catalog, '_catalog', catalog)
+        monkeypatch.setattr(module_catalog, '_snapshot_load', None)
+        # Concurrent first callers share one load
+        found = await asyncio.gather(*(module_catalog.get_module_catalog() for _ in range(3)))
+        assert all(c is catalog and c.ready for c in found)
+
+    asyncio.run(run())
+    assert [name for name, _ in threads] == ['save', 'load']
+    assert all(thread is not threading.main_thread() for _, thread in threads)
@@ -0,0 +1,24 @@
+import asyncio
+
+from msfrpc import MsfRpcClient
+from msfrpc_async import AsyncMsfRpcClient
+
+EXPLOIT = 'windows/smb/ms17_010_eternalblue'
+
+
+def test_info_keys_do_not_shadow_module_methods(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        module = client.modules.use('exploit', EXPLOIT)
+        assert 'check' in module._info
+        assert callable(module.check)
+        assert module.name == module._info['name']
+
+
+def test_async_module_check_can_be_called(stub):
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            module = await client.modules.use('exploit', EXPLOIT)
+            module['RHOSTS'] = '10.0.0.1'
+            return await module.check()
+
+    assert isinstance(asyncio.run(run()), dict)
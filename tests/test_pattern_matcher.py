@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from utils.pattern_matcher import MultiPatternMatcher
+
+
+def feed_all(matcher, chunks):
+    for chunk in chunks:
+        match = matcher.feed(chunk)
+        if match is not None:
+            return match
+    return None
+
+
+def split(text, *cuts):
+    bounds = (0,) + cuts + (len(text),)
+    return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize('chunks', [
+    split('output\nEND_MARKER\n', 10),
+    split('output\nEND_MARKER\n', 9, 13),
+    split('output\nEND_MARKER\n', 8, 11, 14),
+    list('output\nEND_MARKER\n'),
+])
+def test_marker_split_across_chunks(chunks):
+    assert feed_all(MultiPatternMatcher(['END_MARKER']), chunks) == 'END_MARKER'
+
+
+def test_marker_longer_than_the_chunks():
+    marker = 'x' * 5 + 'MARKER' + 'y' * 20
+    matcher = MultiPatternMatcher([marker, 'zz'])
+    text = 'abc' + marker + 'def'
+    chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+    assert feed_all(matcher, chunks) == marker
+
+
+def test_overlapping_markers_and_prefixes():
+    # 'ab' is a prefix of 'abc', and 'bcd' overlaps 'abc'
+    matcher = MultiPatternMatcher(['abc', 'bcd', 'ab'])
+    assert matcher.feed('xa') is None
+    assert matcher.feed('b') == 'ab'
+    matcher = MultiPatternMatcher(['abce', 'bcd'])
+    assert feed_all(matcher, ['xab', 'cd']) == 'bcd'
+    # The failure links must not lose a marker that starts inside a longer partial one
+    matcher = MultiPatternMatcher(['aab'])
+    assert feed_all(matcher, ['a', 'a', 'a', 'b']) == 'aab'
+
+
+def test_a_match_is_kept_until_reset():
+    matcher = MultiPatternMatcher(['>'])
+    assert matcher.feed('msf6 >') == '>'
+    assert matcher.feed('more') == '>'
+    matcher.reset()
+    assert matcher.feed('more') is None
+
+
+@pytest.mark.parametrize('patterns', [[], [''], ['', '']])
+def test_empty_pattern_set_never_matches(patterns):
+    matcher = MultiPatternMatcher(patterns)
+    assert matcher.feed('anything at all') is None
+    assert matcher.feed('') is None
+
+
+def test_matches_a_naive_scan_of_the_whole_output():
+    rng = random.Random(1)
+    for _ in range(2000):
+        patterns = [''.join(rng.choice('ab') for _ in range(rng.randint(1, 6))) for _ in range(rng.randint(1, 4))]
+        text = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 40)))
+        cuts = sorted(rng.sample(range(len(text) + 1), min(rng.randint(0, 6), len(text) + 1)))
+        chunks = split(text, *cuts)
+        matcher = MultiPatternMatcher(patterns)
+        seen = ''
+        for chunk in chunks:
+            seen += chunk
+            match = matcher.feed(chunk)
+            if match is None:
+                assert not any(p in seen for p in patterns), (patterns, chunks)
+            else:
+                assert match in seen, (patterns, chunks)
+        assert (matcher.match is not None) == any(p in text for p in patterns), (patterns, chunks)
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from msfrpc_async import AsyncMsfRpcClient
+from utils.response_cache import ResponseCache
+
+
+def test_entries_expire_after_their_ttl():
+    cache = ResponseCache(ttls={'session.list': 0.05})
+    cache.put('session.list', b'', 'sessions', cache.generation)
+    assert cache.get('session.list', b'') == 'sessions'
+    time.sleep(0.06)
+    assert cache.get('session.list', b'') is None
+    assert cache.stats['methods']['session.list']['hits'] == 1
+
+
+def test_zero_ttl_disables_a_method():
+    cache = ResponseCache(ttls={'console.list': 0})
+    assert not cache.caches('console.list')
+    assert cache.caches('session.list')
+    assert not cache.caches('module.execute')
+
+
+def test_invalidation_drops_only_the_lists_a_call_changes():
+    cache = ResponseCache()
+    cache.put('session.list', b'', 'sessions', cache.generation)
+    cache.put('db.workspaces', b'', 'workspaces', cache.generation)
+    cache.invalidate('module.execute')
+    assert cache.get('session.list', b'') is None
+    assert cache.get('db.workspaces', b'') == 'workspaces'
+    assert cache.invalidations == 1
+    # Calls that change nothing cached leave the generation alone
+    generation = cache.generation
+    cache.invalidate('module.info')
+    assert cache.generation == generation
+
+
+def test_response_fetched_during_an_invalidating_call_is_not_stored():
+    cache = ResponseCache()
+    generation = cache.generation
+    cache.invalidate('console.create')
+    cache.put('console.list', b'', 'stale', generation)
+    assert cache.get('console.list', b'') is None
+
+
+def test_client_serves_lists_from_the_cache_until_a_call_changes_them(stub):
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, response_cache=ResponseCache()) as client:
+            first = await client.call('console.list')
+            assert await client.call('console.list') == first
+            assert stub.calls['console.list'] == 1
+            await client.call('console.create')
+            second = await client.call('console.list')
+            assert stub.calls['console.list'] == 2
+            assert len(second['consoles']) == len(first['consoles']) + 1
+
+    asyncio.run(run())
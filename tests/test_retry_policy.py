@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from msfrpc import MsfRpcMethod, MsfRpcUnavailableError
+from msfrpc_async import AsyncMsfRpcClient
+from utils.retry_policy import CircuitBreaker, RetryPolicy
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_opens_after_threshold_and_closes_after_trial():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one trial call at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_opens_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    open_breaker(breaker)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opens == 2
+
+
+def test_aborted_trial_releases_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    open_breaker(breaker)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_abort()
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_abort_leaves_closed_breaker_alone():
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_abort()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_failures == 0
+
+
+def test_cancelled_trial_call_lets_the_breaker_recover(stub):
+    policy = RetryPolicy(tries=1, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, retry_policy=policy, coalesce=False,
+                                     response_cache=None) as client:
+            await client.login()
+            open_breaker(policy.breaker)
+            with pytest.raises(MsfRpcUnavailableError):
+                await client.call(MsfRpcMethod.CoreVersion)
+            await asyncio.sleep(0.06)
+            # The trial call hangs on msfrpcd and is cancelled, as a tool timeout would
+            stub.latency = 0.5
+            trial = asyncio.ensure_future(client.call(MsfRpcMethod.SessionShellWrite, ['1', 'id\n']))
+            await asyncio.sleep(0.1)
+            assert policy.breaker.state == CircuitBreaker.HALF_OPEN
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            assert policy.breaker.state == CircuitBreaker.OPEN
+            stub.latency = 0.0
+            await asyncio.sleep(0.06)
+            assert 'version' in await client.call(MsfRpcMethod.CoreVersion)
+            assert policy.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(run())
+
+
+def test_counters_are_exact_under_concurrent_threads():
+    policy = RetryPolicy(tries=1)
+
+    def attempts():
+        for _ in range(10000):
+            policy.before_attempt('core.version')
+            policy.on_success()
+
+    threads = [threading.Thread(target=attempts) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert policy.stats['attempts'] == 80000
+
+
+def test_only_idempotent_calls_are_retried_once_sent():
+    policy = RetryPolicy(tries=3)
+    started = time.monotonic()
+    assert policy.on_failure('module.execute', True, 0, started) is None
+    assert policy.on_failure('session.shell_write', True, 0, started) is None
+    assert policy.on_failure('module.info', True, 0, started) is not None
+    # A call that never reached msfrpcd can always be sent again
+    assert policy.on_failure('module.execute', False, 0, started) is not None
+    assert policy.stats['not_retried'] == 2
+    assert policy.stats['retries'] == 2
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import random
+
+from msfrpc import MsfRpcClient
+from msfrpc_async import AsyncMsfRpcClient
+from utils.rpc_metrics import RpcMetrics
+
+
+def test_counters_add_up_per_method_and_in_total():
+    metrics = RpcMetrics()
+    metrics.observe('module.info', 0.002)
+    metrics.observe('module.info', 0.004, error=True)
+    metrics.observe('core.version', 0.010)
+    metrics.retried('module.info')
+    metrics.transferred('module.info', sent=100, received=2000)
+    metrics.transferred('module.info', received=500)
+    metrics.phase('module.info', 'encode', 0.001)
+    with metrics.measure('module.info', 'http'):
+        pass
+
+    stats = metrics.stats
+    assert stats['calls'] == 3 and stats['errors'] == 1
+    # Slowest methods, by total time, come first
+    assert list(stats['methods']) == ['core.version', 'module.info']
+    info = stats['methods']['module.info']
+    assert {k: info[k] for k in ('calls', 'errors', 'retries', 'bytes_sent', 'bytes_received')} == \
+        {'calls': 2, 'errors': 1, 'retries': 1, 'bytes_sent': 100, 'bytes_received': 2500}
+    assert info['total_ms'] == 6.0 and info['mean_ms'] == 3.0 and info['max_ms'] == 4.0
+    assert info['phases_ms']['encode'] == 1.0 and info['phases_ms']['http'] >= 0.0
+    assert info['phases_ms']['decode'] == 0.0
+
+    metrics.reset()
+    assert metrics.stats['calls'] == 0 and metrics.stats['methods'] == {}
+
+
+def test_percentiles_come_from_the_recent_window():
+    metrics = RpcMetrics(window=10)
+    samples = [ms / 1000 for ms in range(1, 101)]
+    random.Random(5).shuffle(samples)
+    for seconds in samples:
+        metrics.observe('core.version', seconds)
+    # Only the last ten calls count towards the percentiles
+    recent = sorted(samples[-10:])
+    version = metrics.stats['methods']['core.version']
+    assert version['p50_ms'] == round(recent[5] * 1000, 3)
+    assert version['p95_ms'] == version['p99_ms'] == round(recent[9] * 1000, 3)
+    assert version['max_ms'] == 100.0 and version['calls'] == 100
+
+    metrics = RpcMetrics()
+    for seconds in samples:
+        metrics.observe('core.version', seconds)
+    version = metrics.stats['methods']['core.version']
+    assert (version['p50_ms'], version['p95_ms'], version['p99_ms']) == (51.0, 96.0, 100.0)
+    assert version['mean_ms'] == 50.5
+
+
+def test_prometheus_histogram_is_cumulative_over_every_call():
+    metrics = RpcMetrics(window=2)
+    for seconds in (0.0005, 0.003, 0.003, 0.2, 400.0):
+        metrics.observe('core.version', seconds, error=seconds > 100)
+    lines = metrics.prometheus().splitlines()
+    buckets = {line.split('le="')[1].split('"')[0]: int(line.split()[-1])
+               for line in lines if line.startswith('msfrpc_call_duration_seconds_bucket')}
+    assert buckets['0.001'] == 1 and buckets['0.005'] == 3 and buckets['0.25'] == 4
+    assert buckets['300.0'] == 4 and buckets['+Inf'] == 5
+    assert 'msfrpc_call_duration_seconds_count{method="core.version"} 5' in lines
+    assert 'msfrpc_errors_total{method="core.version"} 1' in lines
+    assert 'msfrpc_calls_total{method="core.version"} 5' in lines
+
+
+def test_dump_writes_json_or_prometheus_by_extension(tmp_path):
+    metrics = RpcMetrics()
+    metrics.observe('core.version', 0.001)
+    metrics.dump(str(tmp_path / 'out' / 'metrics.json'))
+    metrics.dump(str(tmp_path / 'out' / 'metrics.prom'))
+    assert json.loads((tmp_path / 'out' / 'metrics.json').read_text())['calls'] == 1
+    assert (tmp_path / 'out' / 'metrics.prom').read_text().startswith('# HELP msfrpc_calls_total')
+    assert sorted(p.name for p in (tmp_path / 'out').iterdir()) == ['metrics.json', 'metrics.prom']
+
+
+def test_clients_record_calls_errors_bytes_and_phases(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        client.metrics.reset()
+        for _ in range(3):
+            client.call('core.version')
+        client.call('no.such_method')
+        stats = client.metrics.stats
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            await asyncio.gather(*(client.call('core.version') for _ in range(3)))
+            await client.call('no.such_method')
+            return client.metrics.stats
+
+    for stats in (stats, asyncio.run(run())):
+        version = stats['methods']['core.version']
+        assert version['calls'] == 3 and version['errors'] == 0
+        assert version['bytes_sent'] > 0 and version['bytes_received'] > 0
+        assert version['phases_ms']['http'] > 0 and version['phases_ms']['decode'] > 0
+        assert stats['methods']['no.such_method']['errors'] == 1
@@ -0,0 +1,30 @@
+from utils.session_buffer import SessionOutputBuffer
+
+
+def test_readers_resume_from_their_seq():
+    buffer = SessionOutputBuffer()
+    seq = buffer.append('uid=0(root)\n')
+    buffer.append('Linux target\n')
+    assert buffer.read(seq) == {'data': 'Linux target\n', 'seq': seq + 13}
+    # Another reader starting from 0 still gets everything
+    assert buffer.read(0)['data'] == 'uid=0(root)\nLinux target\n'
+
+
+def test_seq_inside_a_chunk():
+    buffer = SessionOutputBuffer()
+    buffer.append('abc')
+    buffer.append('def')
+    assert buffer.read(4)['data'] == 'ef'
+    assert buffer.read(100) == {'data': '', 'seq': 6}
+
+
+def test_output_beyond_maxsize_is_reported_dropped():
+    buffer = SessionOutputBuffer(maxsize=8)
+    buffer.append('0123')
+    buffer.append('4567')
+    buffer.append('89ab')
+    assert buffer.first == 4
+    result = buffer.read(1)
+    assert result['dropped'] == 3
+    assert result['data'] == '456789ab'
+    assert 'dropped' not in buffer.read()
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+from msfrpc import MsfError, MsfRpcClient
+from msfrpc_async import AsyncMsfRpcClient
+
+
+def script_reads(stub, chunks, method='session.meterpreter_read'):
+    """Make the stub answer session reads with chunks, then with no data."""
+    replies = iter(chunks)
+    stub.methods[method] = lambda sid: {'data': next(replies, '')}
+
+
+def test_end_string_split_across_reads(stub):
+    script_reads(stub, ['out', 'put\nEND', '', 'MARK', 'ER\n', 'never read'])
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        session = client.sessions.session('1')
+        output = session.run_with_output('sysinfo', end_strs=['ENDMARKER'], timeout=5)
+    assert output == 'output\nENDMARKER\n'
+    assert stub.calls['session.meterpreter_read'] == 5
+
+
+def test_timeout_returns_the_output_read_so_far(stub):
+    script_reads(stub, ['partial ', 'output'])
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        session = client.sessions.session('1')
+        started = time.monotonic()
+        output = session.run_with_output('sysinfo', end_strs=['never'], timeout=0.3, timeout_exception=False)
+        assert time.monotonic() - started < 1.0
+        assert output == 'partial output'
+        script_reads(stub, ['partial'])
+        with pytest.raises(MsfError, match='partial'):
+            session.run_with_output('sysinfo', end_strs=['never'], timeout=0.2)
+
+
+def test_empty_reads_back_off_and_output_resets_the_wait(stub):
+    script_reads(stub, [''] * 5 + ['done'])
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        stream = client.sessions.session('1').stream(['done'], timeout=5, min_interval=0.01, max_interval=0.04)
+        waits = []
+        for _ in range(5):
+            stream.feed(stream.session.read())
+            waits.append(stream.interval)
+        assert waits == [0.02, 0.04, 0.04, 0.04, 0.04]
+        assert list(stream) == ['done']
+        assert stream.interval == 0.01 and stream.finished
+
+
+def test_async_stream_finds_a_split_end_string_and_times_out_with_partial_output(stub):
+    script_reads(stub, ['abc EN', 'D tail', 'never read'])
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            session = await client.sessions.session('1')
+            assert await session.run_with_output('x', end_strs=['END'], timeout=5) == 'abc END tail'
+            script_reads(stub, ['partial'])
+            return await session.run_with_output('x', end_strs=['never'], timeout=0.2, timeout_exception=False)
+
+    assert asyncio.run(run()) == 'partial'
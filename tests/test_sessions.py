@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from msfrpc import MeterpreterSession, MsfRpcClient
+from msfrpc_async import AsyncMsfRpcClient, AsyncShellSession
+
+
+def test_session_record_fields_are_readable_as_attributes(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        session = client.sessions.session('1')
+    assert isinstance(session, MeterpreterSession)
+    assert session.type == 'meterpreter'
+    assert session.tunnel_peer == '10.0.0.2:49152'
+    assert session.info['type'] == session.type
+    assert session.sid == '1'
+    # Methods and properties win over record fields of the same name
+    assert callable(session.stop)
+    assert not hasattr(session, 'no_such_field')
+    with pytest.raises(AttributeError):
+        session.no_such_field
+
+
+def test_registry_follows_sessions_through_open_change_and_close(stub):
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        registry = client.session_registry
+        seen = []
+        registry.subscribe(seen.append)
+        # Sessions already open at the first refresh were not opened now
+        assert registry.refresh() == []
+        assert set(registry.sessions) == {'1', '2'}
+        first_uuid = registry.sessions['1']['uuid']
+        assert registry.lookup(first_uuid) == ('1', registry.sessions['1'])
+
+        sid = stub.open_session('shell')
+        opened = registry.refresh()
+        assert [(e['event'], e['id'], e['type']) for e in opened] == [('opened', str(sid), 'shell')]
+        assert opened[0]['uuid'] == stub.sessions[sid]['uuid']
+        assert registry.lookup(opened[0]['uuid'])[0] == str(sid)
+
+        # A changed record is picked up without an event, and the uuid index follows it
+        stub.sessions[1] = dict(stub.sessions[1], info='root @ changed', uuid='newuuid1')
+        assert registry.refresh() == []
+        assert registry.lookup('1')[1]['info'] == 'root @ changed'
+        assert registry.lookup('newuuid1')[0] == '1'
+        assert registry.lookup(first_uuid) is None
+
+        closed_uuid = stub.sessions[2]['uuid']
+        client.call('session.stop', ['2'])
+        closed = registry.refresh()
+        assert [(e['event'], e['id'], e['uuid']) for e in closed] == [('closed', '2', closed_uuid)]
+        assert registry.lookup('2') is None and registry.lookup(closed_uuid) is None
+        with pytest.raises(KeyError):
+            client.sessions.session(closed_uuid)
+
+        assert seen == opened + closed
+        assert registry.since(opened[0]['seq']) == closed
+        assert registry.stats['sessions'] == 2 and registry.stats['events'] == 2
+
+
+def test_async_registry_finds_new_sessions_by_uuid(stub):
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            assert set(await client.sessions.list) == {'1', '2'}
+            sid = stub.open_session('shell')
+            # Not known yet: the lookup refreshes the registry
+            session = await client.sessions.session(stub.sessions[sid]['uuid'])
+            assert isinstance(session, AsyncShellSession)
+            assert session.sid == str(sid) and session.type == 'shell'
+            assert [e['event'] for e in client.session_registry.since()] == ['opened']
+            stub.sessions.pop(sid)
+            await client.session_registry.refresh()
+            with pytest.raises(KeyError):
+                await client.sessions.session(str(sid))
+            assert [e['event'] for e in client.session_registry.since()] == ['opened', 'closed']
+
+    asyncio.run(run())
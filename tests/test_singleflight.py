@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from msfrpc import MsfRpcClient
+from msfrpc_async import AsyncMsfRpcClient
+from utils.singleflight import AsyncSingleflight, Singleflight
+
+
+EXPLOIT = ['exploit', 'windows/smb/ms17_010_eternalblue']
+
+
+def test_concurrent_identical_calls_share_one_call():
+    flight = Singleflight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'response'
+
+    with ThreadPoolExecutor(8) as pool:
+        leader = pool.submit(flight.do, 'key', fetch)
+        started.wait(5)
+        followers = [pool.submit(flight.do, 'key', fetch) for _ in range(7)]
+        while flight.shared < 7:
+            time.sleep(0.001)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+    assert results == ['response'] * 8
+    assert calls == [1]
+    assert flight.stats == {'calls': 8, 'shared': 7, 'in_flight': 0}
+
+
+def test_a_failure_reaches_every_waiter():
+    flight = Singleflight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        raise ConnectionError('msfrpcd went away')
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(flight.do, 'key', fetch)
+        started.wait(5)
+        followers = [pool.submit(flight.do, 'key', fetch) for _ in range(3)]
+        while flight.shared < 3:
+            time.sleep(0.001)
+        release.set()
+        for future in [leader] + followers:
+            with pytest.raises(ConnectionError):
+                future.result()
+    # The failed call is not remembered
+    assert flight.do('key', lambda: 'retried') == 'retried'
+
+
+def test_async_calls_share_one_call_and_its_failure():
+    async def run():
+        flight = AsyncSingleflight()
+        calls = []
+
+        async def fetch(result):
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        results = await asyncio.gather(*(flight.do('ok', lambda: fetch('response')) for _ in range(10)))
+        assert results == ['response'] * 10
+        assert len(calls) == 1
+        results = await asyncio.gather(*(flight.do('bad', lambda: fetch(ConnectionError())) for _ in range(5)),
+                                       return_exceptions=True)
+        assert all(isinstance(r, ConnectionError) for r in results)
+        assert len(calls) == 2
+        assert flight.stats['in_flight'] == 0
+
+    asyncio.run(run())
+
+
+def test_cancelling_one_waiter_does_not_cancel_the_shared_call():
+    async def run():
+        flight = AsyncSingleflight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return 'response'
+
+        # The caller that started the call is the one cancelled
+        first = asyncio.ensure_future(flight.do('key', fetch))
+        await asyncio.sleep(0)
+        others = [asyncio.ensure_future(flight.do('key', fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await asyncio.gather(*others) == ['response'] * 3
+        assert first.cancelled()
+        assert flight.stats == {'calls': 4, 'shared': 3, 'in_flight': 0}
+
+    asyncio.run(run())
+
+
+def test_async_client_sends_concurrent_identical_reads_once(stub):
+    stub.latency = 0.1
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, response_cache=None) as client:
+            await client.login()
+            results = await asyncio.gather(*(client.call('module.info', EXPLOIT) for _ in range(10)))
+            assert all(r == results[0] for r in results)
+            # Each caller gets its own copy
+            assert len({id(r) for r in results}) == 10
+            assert stub.calls['module.info'] == 1
+            assert client.singleflight.stats['shared'] == 9
+
+    asyncio.run(run())
+
+
+def test_sync_client_sends_concurrent_identical_reads_once(stub):
+    stub.latency = 0.1
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port, response_cache=None) as client:
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: client.call('module.info', EXPLOIT), range(8)))
+    assert all(r == results[0] for r in results)
+    assert stub.calls['module.info'] == 1
+
+
+@pytest.mark.parametrize('method, args', [
+    ('core.setg', ['LHOST', '10.0.0.1']),
+    ('db.set_workspace', ['default']),
+])
+def test_writes_are_never_coalesced(stub, method, args):
+    stub.latency = 0.05
+    stub.methods.setdefault(method, lambda *a: {'result': 'success'})
+    assert method not in Singleflight.coalescible
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, response_cache=None) as client:
+            await client.login()
+            await asyncio.gather(*(client.call(method, args) for _ in range(5)))
+            assert client.singleflight.stats['calls'] == 0
+
+    asyncio.run(run())
+    assert stub.calls[method] == 5
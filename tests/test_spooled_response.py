@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import os
+
+import msgpack
+import pytest
+
+from benchmarks.stub_server import rpc_error
+from tools import exploits
+from utils import msf_utils
+from utils.decoding import Blob, SpooledResponse
+
+
+def spool(tmp_path, obj, **kwargs):
+    path = tmp_path / 'body.msgpack'
+    path.write_bytes(msgpack.packb(obj, use_bin_type=True))
+    return SpooledResponse(str(path), **kwargs)
+
+
+def test_small_bodies_decode_in_one_pass(tmp_path):
+    body = {b'result': b'success', 'nested': {b'list': [1, b'two', {b'x': None}]}, b'bin': b'\xff\xfe'}
+    with spool(tmp_path, body) as response:
+        assert response.result == {'result': 'success', 'nested': {'list': [1, 'two', {'x': None}]},
+                                   'bin': b'\xff\xfe'}
+
+
+@pytest.mark.parametrize('threshold', [0, 4, 16, 65536])
+def test_fields_over_the_threshold_stay_in_the_file(tmp_path, threshold):
+    large = bytes(range(256)) * 4
+    body = {'outer': {'inner': [b'tiny', large, 'short text', 'x' * 100]}, 'count': 70000, 'ratio': 0.5,
+            'flags': [True, False, None, -3]}
+    with spool(tmp_path, body, spill_threshold=threshold) as response:
+        inner = response.result['outer']['inner']
+        for value, original in zip(inner, body['outer']['inner']):
+            raw = original if isinstance(original, bytes) else original.encode()
+            if len(raw) > threshold:
+                assert isinstance(value, Blob)
+                assert value.read() == raw
+                assert value.text == isinstance(original, str)
+            else:
+                assert not isinstance(value, Blob)
+                assert value == (original.decode() if original == b'tiny' else original)
+        # Keys, numbers and constants are always loaded
+        assert response.result['count'] == 70000
+        assert response.result['ratio'] == 0.5
+        assert response.result['flags'] == [True, False, None, -3]
+
+
+def test_blob_reads_ranges_and_saves_a_copy(tmp_path):
+    payload = os.urandom(300000)
+    with spool(tmp_path, {'payload': payload}, spill_threshold=1024) as response:
+        blob = response.result['payload']
+        assert len(blob) == len(payload)
+        assert blob.read(10, 5) == payload[10:15]
+        assert blob.read(len(payload) - 3, 100) == payload[-3:]
+        assert b''.join(blob.chunks(65536)) == payload
+        digest = blob.save(str(tmp_path / 'payload.bin'))
+    assert digest == hashlib.sha256(payload).hexdigest()
+    assert (tmp_path / 'payload.bin').read_bytes() == payload
+
+
+def test_closing_deletes_the_spooled_file(tmp_path):
+    response = spool(tmp_path, {'payload': b'x' * 100}, spill_threshold=10)
+    assert os.path.exists(response.path)
+    response.close()
+    assert not os.path.exists(response.path)
+    assert response.result['payload'].read() == b''
+    response.close()
+
+
+def test_an_exception_inside_the_block_still_deletes_the_file(tmp_path):
+    with pytest.raises(RuntimeError):
+        with spool(tmp_path, {'payload': b'x' * 100}, spill_threshold=10) as response:
+            raise RuntimeError
+    assert not os.path.exists(response.path)
+
+
+def test_truncated_body_raises_and_deletes_the_file(tmp_path):
+    path = tmp_path / 'body.msgpack'
+    path.write_bytes(msgpack.packb({'payload': b'x' * 100}, use_bin_type=True)[:-10])
+    with pytest.raises(ValueError):
+        SpooledResponse(str(path), spill_threshold=10)
+    assert not path.exists()
+
+
+def generate(stub, tmp_path, monkeypatch, **kwargs):
+    monkeypatch.setenv('MSF_RPC_PORT', str(stub.port))
+    monkeypatch.setattr(exploits, 'PAYLOAD_DIR', str(tmp_path / 'payloads'))
+
+    async def run():
+        try:
+            return await exploits.generate_payload(None, 'windows/meterpreter/reverse_tcp', **kwargs)
+        finally:
+            await msf_utils.disconnect_async()
+
+    return asyncio.run(run())
+
+
+def test_generate_payload_writes_the_payload_to_a_file(stub, tmp_path, monkeypatch):
+    stub.payload_size = 5000
+    result = generate(stub, tmp_path, monkeypatch, format='exe', preview_bytes=4)
+    assert result['success'] and result['size'] == 5000
+    assert os.path.dirname(result['path']) == str(tmp_path / 'payloads')
+    assert result['path'].endswith('.exe')
+
+
+def test_generate_payload_reports_the_error_msfrpcd_sent(stub, tmp_path, monkeypatch):
+    stub.methods['module.execute'] = lambda *args: rpc_error('Invalid format: nope', 'Msf::OptionValidateError')
+    result = generate(stub, tmp_path, monkeypatch, format='nope')
+    assert result == {"error": "Msf::OptionValidateError: Invalid format: nope"}
+
+
+@pytest.mark.parametrize('format', ['../../etc/cron.d/x', 'exe/../x', '', '.bashrc', 'exe\x00'])
+def test_generate_payload_rejects_formats_that_are_not_format_names(stub, tmp_path, monkeypatch, format):
+    result = generate(stub, tmp_path, monkeypatch, format=format)
+    assert result['error'].startswith('Invalid payload format')
+    assert 'module.execute' not in stub.calls
+    assert not (tmp_path / 'payloads').exists()
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+import stat
+
+from msfrpc_async import AsyncMsfRpcClient
+from utils.token_manager import TokenManager
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def write_state(path, current, tokens):
+    path.write_text(json.dumps({'current': current, 'tokens': tokens}))
+
+
+def test_token_file_is_private_on_every_write(tmp_path):
+    path = tmp_path / 'token.json'
+    manager = TokenManager(str(path))
+    manager.added('MCPfirst')
+    assert mode(path) == 0o600
+    # A file left readable by an older version or by hand is replaced by a private one
+    os.chmod(path, 0o644)
+    manager.added('MCPsecond')
+    assert mode(path) == 0o600
+    assert json.loads(path.read_text()) == {'current': 'MCPsecond', 'tokens': ['MCPfirst', 'MCPsecond']}
+    assert os.listdir(tmp_path) == ['token.json']
+
+
+def test_start_reuses_the_current_token_and_sweeps_the_stale_ones(stub, tmp_path):
+    path = tmp_path / 'token.json'
+    write_state(path, 'MCPcurrent', ['MCPold', 'MCPgone', 'MCPcurrent'])
+    stub.tokens.update(['MCPold', 'MCPcurrent', 'someone-elses'])
+    manager = TokenManager(str(path))
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, token_manager=manager) as client:
+            stats = await manager.start(client)
+            assert client.token == 'MCPcurrent'
+            return stats
+
+    stats = asyncio.run(run())
+    assert 'auth.login' not in stub.calls
+    # MCPgone is no longer in msfrpcd, so only MCPold is removed from it
+    assert stub.calls['auth.token_remove'] == 1
+    assert 'MCPold' not in stub.tokens and 'someone-elses' in stub.tokens
+    assert manager.tracked == ['MCPcurrent']
+    assert stats['removed_tokens'] == 1 and stats['tracked_tokens'] == 1
+    assert json.loads(path.read_text()) == {'current': 'MCPcurrent', 'tokens': ['MCPcurrent']}
+
+
+def test_start_logs_in_again_when_the_saved_token_was_revoked(stub, tmp_path):
+    path = tmp_path / 'token.json'
+    write_state(path, 'MCPrevoked', ['MCPrevoked'])
+    manager = TokenManager(str(path))
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, token_manager=manager) as client:
+            await manager.start(client)
+            return client.token
+
+    token = asyncio.run(run())
+    assert token != 'MCPrevoked' and token.startswith('MCP') and token in stub.tokens
+    assert manager.tracked == [token]
+    assert mode(path) == 0o600
+
+
+def test_shutdown_revokes_every_token_but_the_one_saved_for_reuse(stub, tmp_path):
+    path = tmp_path / 'token.json'
+    manager = TokenManager(str(path))
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, token_manager=manager) as client:
+            await client.login()
+            first = client.token
+            stub.tokens.discard(first)
+            await client.call('core.version')
+            stub.tokens.add(first)
+            assert manager.tracked == [first, client.token]
+            await manager.shutdown(client)
+            return first, client.token
+
+    first, kept = asyncio.run(run())
+    assert first not in stub.tokens and kept in stub.tokens
+    assert json.loads(path.read_text()) == {'current': kept, 'tokens': [kept]}
+
+
+def test_shutdown_without_a_token_file_revokes_the_current_token_too(stub):
+    manager = TokenManager(None)
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port, token_manager=manager) as client:
+            await client.login()
+            token = client.token
+            await manager.shutdown(client)
+            assert client.token is None
+            return token
+
+    token = asyncio.run(run())
+    assert token not in stub.tokens
+    assert manager.tracked == [] and manager.removed == 1
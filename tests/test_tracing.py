@@ -0,0 +1,164 @@
+import asyncio
+import json
+
+import pytest
+
+from msfrpc import MsfRpcClient
+from msfrpc_async import AsyncMsfRpcClient
+from utils import msf_utils
+from utils.tracing import Tracer, record_span, span
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_spans_nest_under_the_span_they_start_in(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer(str(path))
+    with tracer.trace('run_exploit', **{'mcp.tool': 'run_exploit'}):
+        with span('build_script', lines=4) as step:
+            record_span('module.options', 0.01)
+            step.set('payload', 'generic/shell_reverse_tcp')
+        record_span('console.write', 0.002, error=True)
+        # A trace started inside another is a child of it, not a second trace
+        with tracer.trace('nested'):
+            pass
+    # Outside a trace, spans do nothing
+    with span('untraced') as untraced:
+        untraced.set('ignored', True)
+    record_span('core.version', 0.001)
+    tracer.close()
+
+    spans = {s['name']: s for s in read_lines(path)}
+    # Spans are written in the order they ended, the root last
+    assert list(spans) == ['module.options', 'build_script', 'console.write', 'nested', 'run_exploit']
+    root = spans['run_exploit']
+    assert root['parent_id'] is None and root['attributes'] == {'mcp.tool': 'run_exploit'}
+    assert {s['trace_id'] for s in spans.values()} == {root['trace_id']}
+    assert spans['build_script']['parent_id'] == root['span_id']
+    assert spans['module.options']['parent_id'] == spans['build_script']['span_id']
+    assert spans['nested']['parent_id'] == root['span_id']
+    assert spans['build_script']['attributes'] == {'lines': 4, 'payload': 'generic/shell_reverse_tcp'}
+    assert spans['module.options']['kind'] == 'client' and spans['module.options']['duration_ms'] == 10.0
+    assert spans['console.write']['error'] == 'error response' and root['error'] is None
+    assert tracer.stats['traces'] == 1 and tracer.stats['spans'] == 5
+
+
+def test_an_exception_marks_the_span_it_leaves(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer(str(path))
+    with pytest.raises(ValueError):
+        with tracer.trace('tool'):
+            with span('step'):
+                raise ValueError('bad option')
+    tracer.close()
+    errors = {s['name']: s['error'] for s in read_lines(path)}
+    assert errors == {'step': 'ValueError: bad option', 'tool': 'ValueError: bad option'}
+
+
+def test_concurrent_tool_calls_get_separate_traces(stub, tmp_path, monkeypatch):
+    path = tmp_path / 'traces.jsonl'
+    monkeypatch.setattr(msf_utils, '_tracer', Tracer(str(path)))
+
+    async def run():
+        async with AsyncMsfRpcClient('msf', port=stub.port) as client:
+            await client.login()
+            monkeypatch.setattr(msf_utils, 'get_client', lambda asynchronous=False: client)
+
+            @msf_utils.ensure_connected
+            async def first_tool(ctx):
+                with span('step'):
+                    await asyncio.sleep(0.02)
+                    await client.call('core.version')
+                await client.call('job.list')
+                return {'jobs': 0}
+
+            @msf_utils.ensure_connected
+            async def second_tool(ctx):
+                await client.call('session.list')
+                await asyncio.sleep(0.01)
+                await client.call('core.version')
+                return {'error': 'no such session'}
+
+            await asyncio.gather(first_tool(None), second_tool(None), first_tool(None))
+
+    asyncio.run(run())
+    msf_utils._tracer.close()
+
+    traces = {}
+    for s in read_lines(path):
+        traces.setdefault(s['trace_id'], []).append(s)
+    assert len(traces) == 3
+    shapes = []
+    for spans in traces.values():
+        by_id = {s['span_id']: s for s in spans}
+        root = spans[-1]
+        for s in spans[:-1]:
+            assert s['parent_id'] in by_id
+        shapes.append((root['name'], sorted(s['name'] for s in spans[:-1]), root['error']))
+    assert sorted(shapes) == [
+        ('first_tool', ['core.version', 'job.list', 'step'], None),
+        ('first_tool', ['core.version', 'job.list', 'step'], None),
+        ('second_tool', ['core.version', 'session.list'], 'no such session'),
+    ]
+
+
+def test_batch_calls_on_worker_threads_join_the_trace(stub, tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer(str(path))
+    with MsfRpcClient('msf', server='127.0.0.1', port=stub.port) as client:
+        with tracer.trace('tool') as root:
+            with client.batch() as batch:
+                batch.call('core.version')
+                batch.call('job.list')
+    tracer.close()
+    spans = read_lines(path)
+    assert sorted(s['name'] for s in spans[:-1]) == ['core.version', 'job.list']
+    assert all(s['parent_id'] == root.span_id for s in spans[:-1])
+
+
+def test_otlp_writes_one_export_request_per_trace(tmp_path):
+    path = tmp_path / 'traces.otlp.jsonl'
+    tracer = Tracer(str(path), format='otlp', service='msf-test')
+    for _ in range(2):
+        with tracer.trace('tool', flag=True, count=3, ratio=0.5, target='x'):
+            record_span('core.version', 0.001, error='Invalid Authentication Token')
+    tracer.close()
+
+    requests = read_lines(path)
+    assert len(requests) == 2
+    resource = requests[0]['resourceSpans'][0]
+    assert resource['resource']['attributes'] == [{'key': 'service.name', 'value': {'stringValue': 'msf-test'}}]
+    rpc, root = resource['scopeSpans'][0]['spans']
+    assert 'parentSpanId' not in root and rpc['parentSpanId'] == root['spanId']
+    assert rpc['traceId'] == root['traceId'] != requests[1]['resourceSpans'][0]['scopeSpans'][0]['spans'][0]['traceId']
+    assert (root['kind'], rpc['kind']) == (1, 3)
+    assert root['status'] == {} and rpc['status'] == {'code': 2, 'message': 'Invalid Authentication Token'}
+    assert int(rpc['endTimeUnixNano']) - int(rpc['startTimeUnixNano']) == 1000000
+    assert root['attributes'] == [
+        {'key': 'flag', 'value': {'boolValue': True}},
+        {'key': 'count', 'value': {'intValue': '3'}},
+        {'key': 'ratio', 'value': {'doubleValue': 0.5}},
+        {'key': 'target', 'value': {'stringValue': 'x'}},
+    ]
+
+
+def test_disabled_or_unsampled_tracers_write_nothing(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    for tracer in (Tracer(None), Tracer(str(path), sample_rate=0.0)):
+        assert not tracer.enabled
+        with tracer.trace('tool') as root:
+            with span('step'):
+                pass
+        root.fail('ignored')
+    sampled = Tracer(str(path), sample_rate=0.5)
+    for _ in range(200):
+        with sampled.trace('tool'):
+            pass
+    sampled.close()
+    assert 0 < sampled.stats['traces'] < 200
+    assert sampled.stats['traces'] + sampled.stats['unsampled'] == 200
+    assert len(read_lines(path)) == sampled.stats['traces']
+    with pytest.raises(ValueError):
+        Tracer(str(path), format='zipkin')
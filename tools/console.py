@@ -1,30 +1,36 @@
 # tools/console.py
-from typing import Dict, Optional
-from pymetasploit3.msfrpc import MsfRpcError
+from typing import Dict, Optional, Union
+from msfrpc import MsfRpcError
+from msfrpc_async import AsyncMsfConsole
 from mcp.server.fastmcp import Context
-from utils.msf_utils import get_client, ensure_connected
+from utils.msf_utils import get_client, get_console_pool, ensure_connected
+
+# Console calls go straight to the console: msfrpcd answers them with a failure for an unknown
+# console id, which AsyncMsfConsole raises as KeyError, so no console.list lookup is needed.
+# FastMCP parses an id sent as the string "2" as JSON, so ids are accepted as ints and used as strings.
 
 
 @ensure_connected
 async def create_console(ctx: Context) -> Dict:
     """Create a new Metasploit console."""
     await ctx.debug("Creating new console")
-    client = get_client()
     try:
-        console_id = client.consoles.console().cid
+        # A console from the pool is ready at once; the pool creates its replacement in the background
+        console_id = (await get_console_pool().take()).cid
         await ctx.debug(f"Created console with ID: {console_id}")
         return {"success": True, "console_id": console_id, "message": f"Console {console_id} created"}
-    except MsfRpcError as e:
+    except (KeyError, MsfRpcError) as e:
         await ctx.error(f"Failed to create console: {str(e)}")
         return {"error": str(e)}
 
 @ensure_connected
-async def destroy_console(ctx: Context, console_id: str) -> Dict:
+async def destroy_console(ctx: Context, console_id: Union[int, str]) -> Dict:
     """Destroy a specific Metasploit console."""
+    console_id = str(console_id)
     await ctx.debug(f"Destroying console with ID: {console_id}")
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
-        result = client.consoles.destroy(console_id)
+        result = await client.consoles.destroy(console_id)
         await ctx.debug(f"Successfully destroyed console {console_id}")
         return {"success": True, "message": f"Console {console_id} destroyed"}
     except MsfRpcError as e:
@@ -35,9 +41,9 @@ async def destroy_console(ctx: Context, console_id: str) -> Dict:
 async def list_consoles(ctx: Context) -> Dict:
     """List all active Metasploit consoles."""
     await ctx.debug("Listing all consoles")
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
-        consoles = client.consoles.list
+        consoles = await client.consoles.list
         await ctx.debug(f"Found {len(consoles)} active consoles")
         return {"consoles": consoles}
     except MsfRpcError as e:
@@ -45,67 +51,82 @@ async def list_consoles(ctx: Context) -> Dict:
         return {"error": str(e)}
 
 @ensure_connected
-async def console_write(ctx: Context, console_id: str, command: str) -> Dict:
+async def console_write(ctx: Context, console_id: Union[int, str], command: str) -> Dict:
     """Write a command to a specific Metasploit console."""
+    console_id = str(console_id)
     await ctx.debug(f"Writing command to console {console_id}: {command}")
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
-        console = client.consoles.console(console_id)
-        console.write(command)
+        await AsyncMsfConsole(client, console_id).write(command)
         await ctx.debug(f"Successfully wrote command to console {console_id}")
         return {"success": True, "message": f"Command sent to console {console_id}"}
-    except MsfRpcError as e:
+    except (KeyError, MsfRpcError) as e:
         await ctx.error(f"Failed to write to console {console_id}: {str(e)}")
         return {"error": str(e)}
 
 @ensure_connected
-async def console_read(ctx: Context, console_id: str) -> Dict:
+async def console_read(ctx: Context, console_id: Union[int, str]) -> Dict:
     """Read output from a specific Metasploit console."""
+    console_id = str(console_id)
     await ctx.debug(f"Reading output from console {console_id}")
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
-        console = client.consoles.console(console_id)
-        data = console.read()
+        data = await AsyncMsfConsole(client, console_id).read()
         await ctx.debug(f"Read data from console {console_id}: busy={data['busy']}")
         return {
             "data": data['data'],
             "busy": data['busy'],
             "prompt": data.get('prompt', '')
         }
-    except MsfRpcError as e:
+    except (KeyError, MsfRpcError) as e:
         await ctx.error(f"Failed to read from console {console_id}: {str(e)}")
         return {"error": str(e)}
 
 @ensure_connected
-async def run_console_command(ctx: Context, console_id: str, command: str, timeout: Optional[int] = 30) -> Dict:
-    """Run a command in a console and get the output."""
-    await ctx.debug(f"Running command in console {console_id} with timeout {timeout}s: {command}")
-    client = get_client()
+async def run_console_command(ctx: Context, command: str, console_id: Optional[Union[int, str]] = None, timeout: Optional[int] = 30) -> Dict:
+    """Run a command in a console and get the output.
+
+    Without console_id the command runs in a console leased from the pool, which is reset and
+    handed to the next command afterwards.
+    """
+    if console_id is None:
+        pool = get_console_pool()
+        try:
+            pooled = await pool.acquire()
+            console_id = pooled.cid
+            try:
+                result = await _run_command(ctx, pooled, command, timeout)
+            except BaseException:
+                pool.release_later(pooled, recycle=True)
+                raise
+            # A console still running a timed out command is replaced rather than reset
+            pool.release_later(pooled, recycle=not result['success'])
+            return result
+        except (KeyError, MsfRpcError) as e:
+            await ctx.error(f"Failed to run command in console {console_id}: {str(e)}")
+            return {"error": str(e)}
     try:
-        console = client.consoles.console(console_id)
-        console.write(command)
-        
-        # Wait for command to complete
-        import time
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            data = console.read()
-            if not data['busy']:
-                await ctx.debug(f"Command completed successfully in console {console_id}")
-                return {
-                    "success": True,
-                    "data": data['data'],
-                    "prompt": data.get('prompt', '')
-                }
-            time.sleep(1)
-        
-        await ctx.warning(f"Command timed out after {timeout} seconds in console {console_id}")
+        return await _run_command(ctx, AsyncMsfConsole(get_client(asynchronous=True), str(console_id)), command, timeout)
+    except (KeyError, MsfRpcError) as e:
+        await ctx.error(f"Failed to run command in console {console_id}: {str(e)}")
+        return {"error": str(e)}
+
+async def _run_command(ctx: Context, console: AsyncMsfConsole, command: str, timeout: Optional[int]) -> Dict:
+    console_id = console.cid
+    await ctx.debug(f"Running command in console {console_id} with timeout {timeout}s: {command}")
+    # Polls with adaptive waits and keeps every chunk read, not just the last one
+    result = await console.run_command(command, timeout)
+    if result['finished']:
+        await ctx.debug(f"Command completed successfully in console {console_id}")
         return {
-            "success": False,
-            "error": f"Command timed out after {timeout} seconds",
-            "partial_data": data['data']
+            "success": True,
+            "data": result['data'],
+            "prompt": result['prompt']
         }
-    except MsfRpcError as e:
-        await ctx.error(f"Failed to run command in console {console_id}: {str(e)}")
-        return {"error": str(e)} 
\ No newline at end of file
+
+    await ctx.warning(f"Command timed out after {timeout} seconds in console {console_id}")
+    return {
+        "success": False,
+        "error": f"Command timed out after {timeout} seconds",
+        "partial_data": result['data']
+    }
@@ -1,15 +1,15 @@
 # tools/database.py
 from typing import Dict, List, Optional
-from pymetasploit3.msfrpc import MsfRpcError
+from msfrpc import MsfRpcError
 from mcp.server.fastmcp import Context
 from utils.msf_utils import get_client, ensure_connected
 
 @ensure_connected
 async def list_workspaces(ctx: Context) -> Dict:
     """List all Metasploit workspaces."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
-        workspaces = client.db.workspaces.list
+        workspaces = await client.db.workspaces.list
         return {"workspaces": workspaces}
     except MsfRpcError as e:
         return {"error": str(e)}
@@ -17,9 +17,9 @@ async def list_workspaces(ctx: Context) -> Dict:
 @ensure_connected
 async def create_workspace(ctx: Context, name: str) -> Dict:
     """Create a new Metasploit workspace."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
-        client.db.workspaces.add(name)
+        await client.db.workspaces.add(name)
         return {"success": True, "message": f"Workspace {name} created"}
     except MsfRpcError as e:
         return {"error": str(e)}
@@ -27,9 +27,9 @@ async def create_workspace(ctx: Context, name: str) -> Dict:
 @ensure_connected
 async def delete_workspace(ctx: Context, name: str) -> Dict:
     """Delete a specific Metasploit workspace."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
-        client.db.workspaces.remove(name)
+        await client.db.workspaces.remove(name)
         return {"success": True, "message": f"Workspace {name} deleted"}
     except MsfRpcError as e:
         return {"error": str(e)}
@@ -37,26 +37,26 @@ async def delete_workspace(ctx: Context, name: str) -> Dict:
 @ensure_connected
 async def current_workspace(ctx: Context, name: Optional[str] = None) -> Dict:
     """Get or set the current Metasploit workspace."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
         if name:
-            client.db.workspaces.set(name)
+            await client.db.workspaces.set(name)
             return {"success": True, "message": f"Switched to workspace {name}"}
         else:
-            return {"workspace": client.db.workspace}
+            return {"workspace": await client.db.workspace}
     except MsfRpcError as e:
         return {"error": str(e)}
 
 @ensure_connected
 async def list_hosts(ctx: Context, workspace: Optional[str] = None) -> Dict:
     """List hosts in the current or specified workspace."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
         if workspace:
-            ws = client.db.workspaces.workspace(workspace)
+            ws = await client.db.workspaces.workspace(workspace)
         else:
-            ws = client.db.workspaces.workspace()
-        return {"hosts": ws.hosts.list}
+            ws = await client.db.workspaces.workspace()
+        return {"hosts": await ws.hosts.list}
     except MsfRpcError as e:
         return {"error": str(e)}
 
@@ -69,12 +69,12 @@ async def list_services(
     protocol: Optional[str] = None
 ) -> Dict:
     """List services in the current or specified workspace."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
         if workspace:
-            ws = client.db.workspaces.workspace(workspace)
+            ws = await client.db.workspaces.workspace(workspace)
         else:
-            ws = client.db.workspaces.workspace()
+            ws = await client.db.workspaces.workspace()
         
         # Build search criteria
         criteria = {}
@@ -85,7 +85,7 @@ async def list_services(
         if protocol:
             criteria['proto'] = protocol
             
-        return {"services": ws.services.find(**criteria)}
+        return {"services": await ws.services.find(**criteria)}
     except MsfRpcError as e:
         return {"error": str(e)}
 
@@ -96,18 +96,18 @@ async def list_vulns(
     addresses: Optional[List[str]] = None
 ) -> Dict:
     """List vulnerabilities in the current or specified workspace."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
         if workspace:
-            ws = client.db.workspaces.workspace(workspace)
+            ws = await client.db.workspaces.workspace(workspace)
         else:
-            ws = client.db.workspaces.workspace()
+            ws = await client.db.workspaces.workspace()
             
         criteria = {}
         if addresses:
             criteria['addresses'] = addresses
             
-        return {"vulns": ws.vulns.find(**criteria)}
+        return {"vulns": await ws.vulns.find(**criteria)}
     except MsfRpcError as e:
         return {"error": str(e)}
 
@@ -118,14 +118,14 @@ async def import_scan(
     workspace: Optional[str] = None
 ) -> Dict:
     """Import scan results into the database."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
         if workspace:
-            ws = client.db.workspaces.workspace(workspace)
+            ws = await client.db.workspaces.workspace(workspace)
         else:
-            ws = client.db.workspaces.workspace()
+            ws = await client.db.workspaces.workspace()
             
-        ws.importdata(data)
+        await ws.importdata(data)
         return {"success": True, "message": "Data imported successfully"}
     except MsfRpcError as e:
         return {"error": str(e)} 
\ No newline at end of file
@@ -0,0 +1,39 @@
+# tools/diagnostics.py
+from typing import Dict
+from mcp.server.fastmcp import Context
+from utils.msf_utils import (get_cassette, get_client, get_console_pool, get_loop_monitor, get_module_cache,
+                             get_response_cache, get_retry_policy, get_rpc_metrics, get_token_manager, get_tracer)
+
+async def rpc_stats(ctx: Context, format: str = 'json', reset: bool = False) -> Dict:
+    """Per-method RPC call metrics and event loop lag, plus the state of the retry policy, caches and pools.
+
+    Does not call msfrpcd, so it also answers while msfrpcd is down. format='prometheus' returns
+    the call metrics in the Prometheus text format instead. reset clears the call metrics and the
+    event loop lag samples after reading them.
+    """
+    metrics = get_rpc_metrics()
+    if format == 'prometheus':
+        result = {"prometheus": metrics.prometheus()}
+    elif format == 'json':
+        client = get_client(asynchronous=True)
+        response_cache = get_response_cache()
+        cassette = get_cassette()
+        result = {
+            "rpc": metrics.stats,
+            "event_loop": get_loop_monitor().stats,
+            "retry": get_retry_policy().stats,
+            "singleflight": client.singleflight.stats if client.singleflight is not None else None,
+            "response_cache": response_cache.stats if response_cache is not None else None,
+            "module_cache": get_module_cache().stats,
+            "session_registry": client.session_registry.stats,
+            "console_pool": get_console_pool().stats,
+            "tokens": get_token_manager().stats,
+            "tracing": get_tracer().stats,
+            "cassette": cassette.stats if cassette is not None else None,
+        }
+    else:
+        return {"error": f"Unknown format {format!r}, expected 'json' or 'prometheus'"}
+    if reset:
+        metrics.reset()
+        get_loop_monitor().reset()
+    return result
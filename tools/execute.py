@@ -16,14 +16,14 @@ async def execute_module(ctx: Context, module_type: str, module_name: str, optio
     Returns:
         A dictionary containing the execution result.
     """
-    client = get_client()
-    module = client.modules.use(module_type, module_name)
+    client = get_client(asynchronous=True)
+    module = await client.modules.use(module_type, module_name)
     
     if options:
         for key, value in options.items():
             module[key] = value
     
-    result = module.execute()
+    result = await module.execute()
     return {
         "job_id": result.get("job_id"),
         "uuid": result.get("uuid"),
@@ -42,8 +42,8 @@ async def get_options(ctx: Context, module_type: str, module_name: str) -> Dict:
     Returns:
         A dictionary of module options.
     """
-    client = get_client()
-    module = client.modules.use(module_type, module_name)
+    client = get_client(asynchronous=True)
+    module = await client.modules.use(module_type, module_name)
     return module.options
 
 @ensure_connected
@@ -60,7 +60,7 @@ async def set_option(ctx: Context, module_type: str, module_name: str, option_na
     Returns:
         A dictionary indicating success.
     """
-    client = get_client()
-    module = client.modules.use(module_type, module_name)
+    client = get_client(asynchronous=True)
+    module = await client.modules.use(module_type, module_name)
     module[option_name] = option_value
     return {"status": "success", "message": f"Option {option_name} set to {option_value}"}
\ No newline at end of file
@@ -1,9 +1,27 @@
 # tools/exploits.py
+import asyncio
+import base64
+import os
+import re
+import uuid
 from typing import Dict, List, Any, Optional
-from pymetasploit3.msfrpc import MsfRpcError
+from msfrpc import MsfRpcError, MsfRpcMethod
 from mcp.server.fastmcp import Context
+from utils.decoding import Blob
 from utils.msf_utils import get_client, ensure_connected
 
+# Generated payloads are written here and returned by path rather than inline
+PAYLOAD_DIR = os.path.expanduser(os.environ.get('MSF_PAYLOAD_DIR', '~/.cache/metasploit-mcp-server/payloads'))
+
+# msfvenom format names, e.g. 'exe', 'elf-so', 'psh-cmd'; the format also becomes the file extension
+PAYLOAD_FORMAT = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]*')
+
+def _text(value: Any) -> str:
+    """A field of a spooled response as text, reading it from the spooled file if it was left there."""
+    if isinstance(value, Blob):
+        return bytes(value.read()).decode('utf-8', 'replace')
+    return str(value)
+
 @ensure_connected
 async def execute_module(
     ctx: Context,
@@ -15,10 +33,10 @@ async def execute_module(
     run_as_job: Optional[bool] = False
 ) -> Dict:
     """Execute a Metasploit module with the specified options."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
         # Get the module
-        module = client.modules.use(module_type, module_name)
+        module = await client.modules.use(module_type, module_name)
 
         # Set module options
         for option, value in options.items():
@@ -28,18 +46,18 @@ async def execute_module(
 
         # Handle Payload and Payload Options for exploit modules
         if module_type == 'exploit' and payload:
-            payload_module = client.modules.use('payload', payload) # Create PayloadModule object
+            payload_module = await client.modules.use('payload', payload) # Create PayloadModule object
 
             if payload_options:
                 for option, value in payload_options.items():
                     payload_module[option] = value # Set payload options on PayloadModule
 
             # Execute the exploit, passing the PayloadModule object
-            result = module.execute(payload=payload_module)
+            result = await module.execute(payload=payload_module)
 
         # For non-exploit modules or exploits without specific payloads
         else:
-            result = module.execute()
+            result = await module.execute()
 
         if run_as_job: # Check if run_as_job was requested
             job_id = result.get('job_id')
@@ -67,17 +85,17 @@ async def execute_module(
 @ensure_connected
 async def check_exploit(ctx: Context, module_name: str, options: Dict[str, Any]) -> Dict:
     """Check if a target is vulnerable to a specific exploit."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
         # Get the module
-        module = client.modules.use('exploit', module_name)
+        module = await client.modules.use('exploit', module_name)
         
         # Set module options
         for option, value in options.items():
             module[option] = value
         
         # Check if target is vulnerable
-        result = module.check()
+        result = await module.check()
         
         return {
             "success": True,
@@ -91,26 +109,68 @@ async def check_exploit(ctx: Context, module_name: str, options: Dict[str, Any])
 @ensure_connected
 async def list_compatible_payloads(ctx: Context, module_name: str) -> Dict:
     """List payloads compatible with a specific exploit."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
         # Get the exploit module
-        module = client.modules.use('exploit', module_name)
+        module = await client.modules.use('exploit', module_name)
         
         return {
             "success": True,
-            "payloads": module.payloads
+            "payloads": await module.payloads
         }
             
     except MsfRpcError as e:
         return {"error": str(e)}
 
+@ensure_connected
+async def generate_payload(
+    ctx: Context,
+    payload: str,
+    options: Optional[Dict[str, Any]] = None,
+    format: str = 'raw',
+    preview_bytes: int = 0
+) -> Dict:
+    """Generate a payload into a file and return its path, size and sha256 instead of its bytes.
+
+    The response is streamed to disk, so large payloads never sit in memory. preview_bytes returns
+    that many leading bytes of the payload, base64 encoded.
+    """
+    if not PAYLOAD_FORMAT.fullmatch(format):
+        return {"error": f"Invalid payload format: {format!r}"}
+    client = get_client(asynchronous=True)
+    try:
+        module = await client.modules.use('payload', payload)
+        for option, value in (options or {}).items():
+            module[option] = value
+        runopts = module.runoptions.copy()
+        runopts['Format'] = format
+        # A threshold of 0 leaves every field in the spooled file, so the payload is never decoded
+        response = await client.call_spooled(MsfRpcMethod.ModuleExecute, ['payload', payload, runopts], spill_threshold=0)
+        with response:
+            result = response.result if isinstance(response.result, dict) else {}
+            data = result.get('payload')
+            if not isinstance(data, Blob):
+                if result.get('error'):
+                    return {"error": f"{_text(result.get('error_class'))}: {_text(result.get('error_message'))}"}
+                return {"error": "No payload generated"}
+            os.makedirs(PAYLOAD_DIR, exist_ok=True)
+            path = os.path.join(PAYLOAD_DIR, f"{payload.replace('/', '_')}-{uuid.uuid4().hex[:8]}.{format}")
+            sha256 = await asyncio.to_thread(data.save, path)
+            preview = data.read(0, preview_bytes) if preview_bytes > 0 else b''
+        result = {"success": True, "path": path, "size": len(data), "sha256": sha256, "format": format}
+        if preview:
+            result["preview_base64"] = base64.b64encode(preview).decode('ascii')
+        return result
+    except (KeyError, MsfRpcError, OSError) as e:
+        return {"error": str(e)}
+
 @ensure_connected
 async def get_module_options(ctx: Context, module_type: str, module_name: str) -> Dict:
     """Get available options for a specific module."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
         # Get the module
-        module = client.modules.use(module_type, module_name)
+        module = await client.modules.use(module_type, module_name)
         
         # Get module options
         options = module.options
@@ -1,25 +1,26 @@
 # tools/jobs.py
-from typing import Dict
-from pymetasploit3.msfrpc import MsfRpcError
+from typing import Dict, Union
+from msfrpc import MsfRpcError
 from mcp.server.fastmcp import Context
 from utils.msf_utils import get_client, ensure_connected
 
 @ensure_connected
 async def list_jobs(ctx: Context) -> Dict:
     """List all active Metasploit jobs."""
-    client = get_client()
+    client = get_client(asynchronous=True)
     try:
-        jobs = client.jobs.list
+        jobs = await client.jobs.list
         return {"jobs": jobs}
     except MsfRpcError as e:
         return {"error": str(e)}
 
 @ensure_connected
-async def job_info(ctx: Context, job_id: str) -> Dict:
+async def job_info(ctx: Context, job_id: Union[int, str]) -> Dict:
     """Get information about a specific job."""
-    client = get_client()
+    job_id = str(job_id)
+    client = get_client(asynchronous=True)
     try:
-        jobs = client.jobs.list
+        jobs = await client.jobs.list
         if job_id in jobs:
             return {"job_id": job_id, "info": jobs[job_id]}
         else:
@@ -28,11 +29,12 @@ async def job_info(ctx: Context, job_id: str) -> Dict:
         return {"error": str(e)}
 
 @ensure_connected
-async def stop_job(ctx: Context, job_id: str) -> Dict:
+async def stop_job(ctx: Context, job_id: Union[int, str]) -> Dict:
     """Stop a specific job."""
-    client = get_client()
+    job_id = str(job_id)
+    client = get_client(asynchronous=True)
     try:
-        result = client.jobs.stop(job_id)
+        result = await client.jobs.stop(job_id)
         return {"success": True, "message": f"Job {job_id} stopped"}
     except MsfRpcError as e:
         return {"error": str(e)} 
\ No newline at end of file
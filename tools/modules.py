@@ -1,8 +1,10 @@
 # tools/modules.py
 from typing import Dict, List, Optional
-from pymetasploit3.msfrpc import MsfRpcError
+from msfrpc import MsfRpcError, MsfRpcMethod
+from msfrpc_async import AsyncExploitModule
 from mcp.server.fastmcp import Context
 from utils.msf_utils import get_client, ensure_connected
+from utils.module_catalog import get_module_catalog, LIST_METHODS
 
 @ensure_connected
 async def list_modules(ctx: Context, type: Optional[str] = None) -> List[str]:
@@ -15,31 +17,41 @@ async def list_modules(ctx: Context, type: Optional[str] = None) -> List[str]:
     Returns:
         A list of module names.
     """
-    client = get_client()
+    client = get_client(asynchronous=True)
+    if type and type not in LIST_METHODS:
+        raise ValueError(f"Invalid module type: {type}")
+
+    # Serve from the local catalog once built, refreshing it in the background when stale
+    catalog = await get_module_catalog()
+    if catalog.stale(client):
+        catalog.build_in_background(client)
+    if catalog.ready:
+        return catalog.list(type)
+
     if type:
         if type == 'exploit':
-            return client.modules.exploits
+            return await client.modules.exploits
         elif type == 'auxiliary':
-            return client.modules.auxiliary
+            return await client.modules.auxiliary
         elif type == 'post':
-            return client.modules.post
+            return await client.modules.post
         elif type == 'payload':
-            return client.modules.payloads
+            return await client.modules.payloads
         elif type == 'encoder':
-            return client.modules.encoders
+            return await client.modules.encoders
         elif type == 'nop':
-            return client.modules.nops
+            return await client.modules.nops
         else:
             raise ValueError(f"Invalid module type: {type}")
     
-    # If no type specified, return all modules
+    # If no type specified, fetch every module list in one concurrent batch
+    async with client.batch() as batch:
+        for method in (MsfRpcMethod.ModuleExploits, MsfRpcMethod.ModuleAuxiliary, MsfRpcMethod.ModulePost,
+                       MsfRpcMethod.ModulePayloads, MsfRpcMethod.ModuleEncoders, MsfRpcMethod.ModuleNops):
+            batch.call(method)
     modules = []
-    modules.extend(client.modules.exploits)
-    modules.extend(client.modules.auxiliary)
-    modules.extend(client.modules.post)
-    modules.extend(client.modules.payloads)
-    modules.extend(client.modules.encoders)
-    modules.extend(client.modules.nops)
+    for result in batch.results():
+        modules.extend(result['modules'])
     return modules
 
 @ensure_connected
@@ -54,8 +66,10 @@ async def module_info(ctx: Context, module_type: str, module_name: str) -> Dict:
     Returns:
         A dictionary containing module information.
     """
-    client = get_client()
-    module = client.modules.use(module_type, module_name)
+    client = get_client(asynchronous=True)
+    module = await client.modules.use(module_type, module_name)
+    # Only exploits have payloads, and reading the property starts the RPC, so check the class first
+    payloads = await module.payloads if isinstance(module, AsyncExploitModule) else None
     return {
         "name": module.modulename,
         "type": module.moduletype,
@@ -63,7 +77,7 @@ async def module_info(ctx: Context, module_type: str, module_name: str) -> Dict:
         "options": module.options,
         "references": module.references,
         "targets": module.targets if hasattr(module, "targets") else None,
-        "payloads": module.payloads if hasattr(module, "payloads") else None
+        "payloads": payloads
     }
 
 @ensure_connected
@@ -77,6 +91,12 @@ async def search_modules(ctx: Context, query: str) -> List[Dict]:
     Returns:
         A list of matching modules.
     """
-    client = get_client()
-    modules = client.modules.search(query)
+    client = get_client(asynchronous=True)
+    catalog = await get_module_catalog()
+    if catalog.stale(client):
+        catalog.build_in_background(client)
+    if catalog.ready:
+        return catalog.search(query)
+    # Until the catalog is built, let msfrpcd search
+    modules = await client.modules.search(query)
     return modules
\ No newline at end of file
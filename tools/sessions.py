@@ -1,65 +1,86 @@
 # tools/sessions.py
-from typing import Dict, List, Optional
-from pymetasploit3.msfrpc import MsfRpcError
+from typing import Dict, List, Optional, Union
+from msfrpc import MsfRpcError
 from mcp.server.fastmcp import Context
 from utils.msf_utils import get_client, ensure_connected
 
+async def _read_buffered(client, session, seq: Optional[int]) -> Dict:
+    """Drain the session into its client-side buffer and return the buffered output from seq on."""
+    buffer = client.session_buffer(session.sid)
+    if seq is None:
+        seq = buffer.last
+    await session.read()
+    return buffer.read(seq)
+
 @ensure_connected
 async def list_sessions(ctx: Context) -> Dict:
     """List all active Metasploit sessions."""
-    client = get_client()
-    return client.sessions.list
+    client = get_client(asynchronous=True)
+    return await client.sessions.list
 
 @ensure_connected
-async def session_shell_read(ctx: Context, session_id: str) -> Dict:
-    """Read output from a shell session."""
-    client = get_client()
+async def session_shell_read(ctx: Context, session_id: Union[int, str], seq: Optional[int] = None) -> Dict:
+    """Read output from a shell session.
+
+    Without seq this returns the output that arrived since the previous read. Passing the seq
+    a read returned resumes from there, so concurrent readers and retried calls lose nothing.
+    """
+    session_id = str(session_id)
+    client = get_client(asynchronous=True)
     try:
-        session = client.sessions.session(session_id)
-        return {"data": session.read()}
+        session = await client.sessions.session(session_id)
+        return await _read_buffered(client, session, seq)
     except (KeyError, MsfRpcError) as e:
         return {"error": str(e)}
 
 @ensure_connected
-async def session_shell_write(ctx: Context, session_id: str, command: str) -> Dict:
+async def session_shell_write(ctx: Context, session_id: Union[int, str], command: str) -> Dict:
     """Send a command to a shell session."""
-    client = get_client()
+    session_id = str(session_id)
+    client = get_client(asynchronous=True)
     try:
-        session = client.sessions.session(session_id)
-        session.write(command)
+        session = await client.sessions.session(session_id)
+        await session.write(command)
         return {"success": True, "message": f"Command sent to session {session_id}"}
     except (KeyError, MsfRpcError) as e:
         return {"error": str(e)}
 
 @ensure_connected
-async def session_meterpreter_read(ctx: Context, session_id: str) -> Dict:
-    """Read output from a meterpreter session."""
-    client = get_client()
+async def session_meterpreter_read(ctx: Context, session_id: Union[int, str], seq: Optional[int] = None) -> Dict:
+    """Read output from a meterpreter session.
+
+    Without seq this returns the output that arrived since the previous read. Passing the seq
+    a read returned resumes from there, so concurrent readers and retried calls lose nothing.
+    """
+    session_id = str(session_id)
+    client = get_client(asynchronous=True)
     try:
-        session = client.sessions.session(session_id)
-        return {"data": session.read()}
+        session = await client.sessions.session(session_id)
+        return await _read_buffered(client, session, seq)
     except (KeyError, MsfRpcError) as e:
         return {"error": str(e)}
 
 @ensure_connected
-async def session_meterpreter_write(ctx: Context, session_id: str, command: str) -> Dict:
+async def session_meterpreter_write(ctx: Context, session_id: Union[int, str], command: str) -> Dict:
     """Send a command to a meterpreter session."""
-    client = get_client()
+    session_id = str(session_id)
+    client = get_client(asynchronous=True)
     try:
-        session = client.sessions.session(session_id)
-        session.write(command)
+        session = await client.sessions.session(session_id)
+        await session.write(command)
         return {"success": True, "message": f"Command sent to session {session_id}"}
     except (KeyError, MsfRpcError) as e:
         return {"error": str(e)}
 
 @ensure_connected
-async def session_run_with_output(ctx: Context, session_id: str, command: str, end_strings: List[str], timeout: Optional[int] = 310) -> Dict:
+async def session_run_with_output(ctx: Context, session_id: Union[int, str], command: str, end_strings: List[str], timeout: Optional[int] = 310) -> Dict:
     """Run a command in a session and wait for complete output."""
-    client = get_client()
+    session_id = str(session_id)
+    client = get_client(asynchronous=True)
     try:
-        session = client.sessions.session(session_id)
+        session = await client.sessions.session(session_id)
         if hasattr(session, "run_with_output"):
-            output = session.run_with_output(command, end_strings, timeout)
+            output = await session.run_with_output(command, end_strings, timeout)
             return {"success": True, "output": output}
         else:
             return {"error": "Session type does not support run_with_output"}
@@ -67,12 +88,13 @@ async def session_run_with_output(ctx: Context, session_id: str, command: str, e
         return {"error": str(e)}
 
 @ensure_connected
-async def stop_session(ctx: Context, session_id: str) -> Dict:
+async def stop_session(ctx: Context, session_id: Union[int, str]) -> Dict:
     """Terminate a specific session."""
-    client = get_client()
+    session_id = str(session_id)
+    client = get_client(asynchronous=True)
     try:
-        session = client.sessions.session(session_id)
-        session.stop()
+        session = await client.sessions.session(session_id)
+        await session.stop()
         return {"success": True, "message": f"Session {session_id} terminated"}
     except (KeyError, MsfRpcError) as e:
         return {"error": str(e)}
\ No newline at end of file
@@ -0,0 +1,126 @@
+# utils/cassette.py
+"""Recording of msfrpcd calls and responses, for replaying them offline."""
+import gzip
+import os
+import threading
+import time
+
+import msgpack
+
+
+class Cassette(object):
+
+    version = 1
+
+    # Calls carrying credentials or tokens are not recorded; a replay server answers them itself
+    unrecorded = frozenset((
+        'auth.login',
+        'auth.logout',
+        'auth.token_list',
+        'auth.token_add',
+        'auth.token_generate',
+        'auth.token_remove',
+    ))
+
+    def __init__(self, path):
+        """
+        Records the calls clients send to msfrpcd, with msfrpcd's responses as they came over the
+        wire and their timing, so they can be served back offline (see benchmarks/replay_server.py).
+
+        A cassette is a msgpack stream: a header map, then one [offset, method, args, status,
+        seconds, body] array per call. offset is when the call was sent, in seconds since the
+        recording started; args are the packed arguments without the token; seconds is the round
+        trip and body the undecoded response. Paths ending in .gz are gzip-compressed, which is
+        only complete once the cassette is closed.
+
+        The file is replaced when the first call is recorded, and readable by its owner only:
+        it holds whatever msfrpcd answered, session output included.
+
+        Mandatory Arguments:
+        - path : the cassette file
+        """
+        self.path = path
+        self.records = 0
+        self.bytes = 0
+        self._started = time.monotonic()
+        self._file = None
+        self._raw = None
+        self._opened = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(opts):
+        """
+        The packed arguments a call is matched on when it is replayed.
+        """
+        return msgpack.packb(list(opts), use_bin_type=True)
+
+    def record(self, method, opts, status, body, seconds):
+        """
+        Append a call that has just returned.
+
+        Mandatory Arguments:
+        - method : the RPC method name
+        - opts : the method arguments, without the token
+        - status : the HTTP status of the response
+        - body : the response body
+        - seconds : how long the call took
+        """
+        if method in self.unrecorded:
+            return
+        offset = time.monotonic() - seconds - self._started
+        record = msgpack.packb([round(offset, 6), method, self.key(opts), status, round(seconds, 6), body],
+                               use_bin_type=True)
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = self._open()
+                self._file.write(record)
+                if not self.path.endswith('.gz'):
+                    self._file.flush()
+                self.records += 1
+                self.bytes += len(body)
+            except OSError:
+                # Losing a record must never fail the call it describes
+                pass
+
+    def _open(self):
+        # The first open starts the cassette; later ones, after close(), add to it
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if self._opened else os.O_TRUNC)
+        if not self._opened:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._raw = os.fdopen(os.open(self.path, flags, 0o600), 'wb')
+        f = gzip.GzipFile(fileobj=self._raw, mode='wb', mtime=0) if self.path.endswith('.gz') else self._raw
+        if not self._opened:
+            f.write(msgpack.packb({'cassette': self.version, 'created': time.time()}, use_bin_type=True))
+            self._opened = True
+        return f
+
+    @classmethod
+    def read(cls, path):
+        """
+        Yield the (offset, method, args, status, seconds, body) records of a cassette, args still packed.
+        """
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            unpacker = msgpack.Unpacker(f, raw=False, max_buffer_size=0)
+            header = next(unpacker, None)
+            if not isinstance(header, dict) or header.get('cassette') != cls.version:
+                raise ValueError('%s is not a version %d cassette' % (path, cls.version))
+            for offset, method, args, status, seconds, body in unpacker:
+                yield offset, method, args, status, seconds, body
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._raw.close()
+                self._file = None
+
+    @property
+    def stats(self):
+        return {
+            'path': self.path,
+            'records': self.records,
+            'bytes': self.bytes,
+        }
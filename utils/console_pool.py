@@ -0,0 +1,495 @@
+# utils/console_pool.py
+"""Pools of consoles created ahead of time, for running console commands without waiting for console.create."""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+import requests
+
+from msfrpc import MsfConsole, MsfError, MsfRpcError
+from msfrpc_async import AsyncConsoleManager
+
+
+class ConsolePool(object):
+
+    def __init__(self, rpc, size=2, max_size=8, idle_timeout=300.0, max_uses=50, reset_command='back'):
+        """
+        Keeps size consoles created and drained ahead of time, so running a console command does
+        not wait for console.create, which is one of msfrpcd's slowest calls. lease() hands out an
+        idle console, creating one while fewer than max_size exist and waiting for a release
+        otherwise. Released consoles are reset with reset_command and drained, or destroyed if
+        they are still busy, the command failed, or they served max_uses leases. Consoles beyond
+        size that stay idle for idle_timeout seconds are destroyed, by a timer that runs while the
+        pool holds more than size, so it shrinks back after a burst even if no lease follows.
+
+            with pool.lease() as console:
+                console.write('version')
+
+        Mandatory Arguments:
+        - rpc : the msfrpc client object.
+
+        Optional Keyword Arguments:
+        - size : the number of consoles kept ready (default: 2)
+        - max_size : the most consoles the pool creates (default: 8)
+        - idle_timeout : seconds before an extra idle console is destroyed (default: 300)
+        - max_uses : leases after which a console is replaced (default: 50)
+        - reset_command : run on released consoles to leave any module context (default: back)
+        """
+        self.rpc = rpc
+        self.size = size
+        self.max_size = max(size, max_size)
+        self.idle_timeout = idle_timeout
+        self.max_uses = max_uses
+        self.reset_command = reset_command
+        self.created = 0
+        self.destroyed = 0
+        self.recycled = 0
+        self.leases = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self._idle = deque()
+        self._leased = set()
+        self._uses = {}
+        self._pending = 0
+        self._reaper = None
+        self._cond = threading.Condition()
+
+    def _new_console(self):
+        return MsfConsole(self.rpc)
+
+    def _drain(self, console, tries=50, interval=0.05):
+        # A new console prints its banner and a reset one its prompt: read until it is quiet
+        for _ in range(tries):
+            result = console.read()
+            if not result.get('busy') and not result.get('data'):
+                return True
+            time.sleep(interval)
+        return False
+
+    def _create(self):
+        try:
+            console = self._new_console()
+            self._drain(console)
+        except BaseException:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._pending -= 1
+            self.created += 1
+            self._uses[console.cid] = 0
+        return console
+
+    def _destroy(self, console):
+        try:
+            console.destroy()
+        except (MsfError, MsfRpcError, requests.exceptions.RequestException):
+            pass
+        with self._cond:
+            self._uses.pop(console.cid, None)
+            self.destroyed += 1
+            self._cond.notify()
+
+    @property
+    def total(self):
+        return len(self._idle) + len(self._leased) + self._pending
+
+    def fill(self):
+        """
+        Create consoles until size are ready or being created.
+        """
+        while True:
+            with self._cond:
+                if self.total >= self.size:
+                    return
+                self._pending += 1
+            console = self._create()
+            with self._cond:
+                self._idle.append((console, time.monotonic()))
+                self._cond.notify()
+
+    def acquire(self, timeout=None):
+        """
+        Lease an idle console, see lease(). Raises MsfError if none is free within timeout seconds.
+        """
+        start = time.monotonic()
+        console = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    console = self._idle.pop()[0]
+                    break
+                if self.total < self.max_size:
+                    self._pending += 1
+                    break
+                remaining = None if timeout is None else timeout - (time.monotonic() - start)
+                if remaining is not None and remaining <= 0:
+                    raise MsfError('No console free in the pool after %ss' % timeout)
+                self._cond.wait(remaining)
+        if console is None:
+            console = self._create()
+        with self._cond:
+            self._record_lease(console, time.monotonic() - start)
+        return console
+
+    def _record_lease(self, console, waited):
+        self._leased.add(console.cid)
+        self._uses[console.cid] = self._uses.get(console.cid, 0) + 1
+        self.leases += 1
+        if waited > 0.001:
+            self.waits += 1
+        self.wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+
+    def release(self, console, recycle=False):
+        """
+        Return a leased console to the pool.
+
+        Optional Keyword Arguments:
+        - recycle : destroy the console instead, e.g. after a failed command (default: False)
+        """
+        with self._cond:
+            self._leased.discard(console.cid)
+            self._pending += 1
+        try:
+            if not recycle and self._uses.get(console.cid, 0) < self.max_uses:
+                if self.reset_command:
+                    console.write(self.reset_command)
+                recycle = not self._drain(console)
+            else:
+                recycle = True
+        except (MsfError, MsfRpcError, KeyError, requests.exceptions.RequestException):
+            recycle = True
+        with self._cond:
+            self._pending -= 1
+            if recycle:
+                self.recycled += 1
+        if recycle:
+            self._destroy(console)
+        else:
+            with self._cond:
+                self._idle.append((console, time.monotonic()))
+                self._cond.notify()
+        self.reap()
+        self._schedule_reap()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """
+        Lease an idle console for the duration of a with block. The console is recycled if the
+        block raises.
+
+        Optional Keyword Arguments:
+        - timeout : seconds to wait for a free console, None waits indefinitely (default: None)
+        """
+        console = self.acquire(timeout)
+        try:
+            yield console
+        except BaseException:
+            self.release(console, recycle=True)
+            raise
+        self.release(console)
+
+    def take(self):
+        """
+        Remove an idle console from the pool and hand it over for good, e.g. to a user who asked
+        for a new console. The caller destroys it.
+        """
+        console = self.acquire()
+        with self._cond:
+            self._leased.discard(console.cid)
+            self._uses.pop(console.cid, None)
+            self._cond.notify()
+        # Replace it in the background
+        self.rpc.executor.submit(self.fill)
+        return console
+
+    def reap(self):
+        """
+        Destroy idle consoles beyond size that have been idle for idle_timeout seconds.
+        """
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            # Least recently released first: the pool hands out the most recently released
+            while len(self._idle) and self.total > self.size and now - self._idle[0][1] >= self.idle_timeout:
+                expired.append(self._idle.popleft()[0])
+        for console in expired:
+            self._destroy(console)
+
+    def _schedule_reap(self):
+        # Reap from a timer while there are extra idle consoles, as no release may come to do it
+        with self._cond:
+            if self._reaper is not None or not self._idle or self.total <= self.size:
+                return
+            self._reaper = threading.Thread(target=self._reap_when_idle, name='msf-console-reaper', daemon=True)
+        self._reaper.start()
+
+    def _reap_when_idle(self):
+        while True:
+            with self._cond:
+                if not self._idle or self.total <= self.size:
+                    self._reaper = None
+                    return
+                wait = self._idle[0][1] + self.idle_timeout - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.reap()
+
+    def close(self):
+        """
+        Destroy every idle console. Leased consoles are destroyed when they are released.
+        """
+        with self._cond:
+            idle, self._idle = [c for c, _ in self._idle], deque()
+            self.max_uses = 0
+        for console in idle:
+            self._destroy(console)
+
+    @property
+    def stats(self):
+        """
+        Pool occupancy and lease wait times.
+        """
+        with self._cond:
+            return self._stats()
+
+    def _stats(self):
+        return {
+            'size': self.size,
+            'max_size': self.max_size,
+            'idle': len(self._idle),
+            'leased': len(self._leased),
+            'created': self.created,
+            'destroyed': self.destroyed,
+            'recycled': self.recycled,
+            'leases': self.leases,
+            'waits': self.waits,
+            'avg_wait': self.wait_time / self.leases if self.leases else 0.0,
+            'max_wait': self.max_wait_time,
+        }
+
+
+class AsyncConsolePool(ConsolePool):
+
+    def __init__(self, rpc, size=2, max_size=8, idle_timeout=300.0, max_uses=50, reset_command='back'):
+        """
+        ConsolePool for the asyncio client, see ConsolePool. Consoles are created concurrently
+        and a console taken out of the pool is replaced by a background task.
+
+            async with pool.lease() as console:
+                result = await console.run_command('version')
+        """
+        super().__init__(rpc, size, max_size, idle_timeout, max_uses, reset_command)
+        self._cond = asyncio.Condition()
+        self._tasks = set()
+
+    def _background(self, coro):
+        # In a fresh context, or the task's RPCs would be traced as part of the tool call that
+        # started it. The loop only keeps weak references to tasks
+        task = asyncio.get_running_loop().create_task(coro, context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _new_console(self):
+        return await AsyncConsoleManager(self.rpc).console()
+
+    async def _drain(self, console, tries=50, interval=0.05):
+        for _ in range(tries):
+            result = await console.read()
+            if not result.get('busy') and not result.get('data'):
+                return True
+            await asyncio.sleep(interval)
+        return False
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify()
+
+    async def _create(self):
+        try:
+            console = await self._new_console()
+            await self._drain(console)
+        except BaseException:
+            self._pending -= 1
+            await self._notify()
+            raise
+        self._pending -= 1
+        self.created += 1
+        self._uses[console.cid] = 0
+        return console
+
+    async def _destroy(self, console):
+        try:
+            await console.destroy()
+        except (MsfError, MsfRpcError, httpx.HTTPError, RuntimeError):
+            # RuntimeError: the client was closed at shutdown, which leaves the console to msfrpcd
+            pass
+        self._uses.pop(console.cid, None)
+        self.destroyed += 1
+        await self._notify()
+
+    async def fill(self):
+        """
+        Create consoles until size are ready or being created.
+        """
+        missing = self.size - self.total
+        if missing <= 0:
+            return
+        self._pending += missing
+        consoles = await asyncio.gather(*[self._create() for _ in range(missing)], return_exceptions=True)
+        error = None
+        for console in consoles:
+            if isinstance(console, BaseException):
+                error = error or console
+            else:
+                # Keep the consoles that were created even if others failed, or they would leak on msfrpcd
+                self._idle.append((console, time.monotonic()))
+        await self._notify()
+        if error is not None:
+            raise error
+
+    async def acquire(self, timeout=None):
+        """
+        Lease an idle console, see lease(). Raises MsfError if none is free within timeout seconds.
+        """
+        start = time.monotonic()
+        console = None
+        async with self._cond:
+            while True:
+                if self._idle:
+                    console = self._idle.pop()[0]
+                    break
+                if self.total < self.max_size:
+                    self._pending += 1
+                    break
+                remaining = None if timeout is None else timeout - (time.monotonic() - start)
+                if remaining is not None and remaining <= 0:
+                    raise MsfError('No console free in the pool after %ss' % timeout)
+                try:
+                    await asyncio.wait_for(self._cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        if console is None:
+            console = await self._create()
+        self._record_lease(console, time.monotonic() - start)
+        return console
+
+    async def release(self, console, recycle=False):
+        """
+        Return a leased console to the pool.
+
+        Optional Keyword Arguments:
+        - recycle : destroy the console instead, e.g. after a failed command (default: False)
+        """
+        self._leased.discard(console.cid)
+        self._pending += 1
+        try:
+            if not recycle and self._uses.get(console.cid, 0) < self.max_uses:
+                if self.reset_command:
+                    await console.write(self.reset_command)
+                recycle = not await self._drain(console)
+            else:
+                recycle = True
+        except (MsfError, MsfRpcError, KeyError, httpx.HTTPError, RuntimeError):
+            recycle = True
+        self._pending -= 1
+        if recycle:
+            self.recycled += 1
+            await self._destroy(console)
+        else:
+            self._idle.append((console, time.monotonic()))
+            await self._notify()
+        await self.reap()
+        self._schedule_reap()
+
+    def release_later(self, console, recycle=False):
+        """
+        Release a console from a background task, so the caller does not wait for its reset.
+        """
+        self._background(self.release(console, recycle))
+
+    @asynccontextmanager
+    async def lease(self, timeout=None):
+        """
+        Lease an idle console for the duration of an async with block. The console is recycled
+        if the block raises.
+
+        Optional Keyword Arguments:
+        - timeout : seconds to wait for a free console, None waits indefinitely (default: None)
+        """
+        console = await self.acquire(timeout)
+        try:
+            yield console
+        except BaseException:
+            await self.release(console, recycle=True)
+            raise
+        await self.release(console)
+
+    async def take(self):
+        """
+        Remove an idle console from the pool and hand it over for good, e.g. to a user who asked
+        for a new console. The caller destroys it.
+        """
+        console = await self.acquire()
+        self._leased.discard(console.cid)
+        self._uses.pop(console.cid, None)
+        await self._notify()
+        # Replace it in the background
+        self._background(self._refill())
+        return console
+
+    async def _refill(self):
+        try:
+            await self.fill()
+        except (MsfError, MsfRpcError, httpx.HTTPError, RuntimeError):
+            # The next lease creates its console itself
+            pass
+
+    async def reap(self):
+        """
+        Destroy idle consoles beyond size that have been idle for idle_timeout seconds.
+        """
+        now = time.monotonic()
+        expired = []
+        while len(self._idle) and self.total > self.size and now - self._idle[0][1] >= self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        for console in expired:
+            await self._destroy(console)
+
+    def _schedule_reap(self):
+        if self._reaper is None and self._idle and self.total > self.size:
+            self._reaper = self._background(self._reap_when_idle())
+
+    async def _reap_when_idle(self):
+        try:
+            while self._idle and self.total > self.size:
+                await asyncio.sleep(max(0.0, self._idle[0][1] + self.idle_timeout - time.monotonic()))
+                await self.reap()
+        finally:
+            self._reaper = None
+
+    async def close(self):
+        """
+        Destroy every idle console. Leased consoles are destroyed when they are released.
+        """
+        if self._reaper is not None:
+            self._reaper.cancel()
+        idle, self._idle = [c for c, _ in self._idle], deque()
+        self.max_uses = 0
+        for console in idle:
+            await self._destroy(console)
+
+    @property
+    def stats(self):
+        """
+        Pool occupancy and lease wait times.
+        """
+        return self._stats()
@@ -0,0 +1,279 @@
+# utils/decoding.py
+"""Single-pass decoding of msfrpcd responses, and responses spooled to a file instead of memory."""
+import hashlib
+import mmap
+import os
+import struct
+
+import msgpack
+from pymetasploit3.utils import try_convert
+
+
+def decode_response(data, encodings=('utf-8',), decode_error_handling='strict'):
+    """
+    Unpack an msfrpcd response with its byte strings decoded, like
+    convert(decode(data), encodings, decode_error_handling) but in a single pass: msfrpcd sends
+    most strings as msgpack binaries, and they are decoded as each map and array is unpacked
+    instead of by walking the finished response again. A container holding a string that is not
+    valid in the first encoding falls back to try_convert for its strings.
+
+    Mandatory Arguments:
+    - data : the msgpack response body
+
+    Optional Keyword Arguments:
+    - encodings : the encodings to try, in order (default: utf-8)
+    - decode_error_handling : the error handler used with the last encoding (default: strict)
+    """
+    encoding = encodings[0]
+
+    def text(value):
+        if value.__class__ is not bytes:
+            return value
+        try:
+            return value.decode(encoding)
+        except UnicodeDecodeError:
+            return try_convert(value, encodings, decode_error_handling)[0]
+
+    def pairs_hook(pairs):
+        try:
+            return {(k.decode(encoding) if k.__class__ is bytes else k): (v.decode(encoding) if v.__class__ is bytes else v)
+                    for k, v in pairs}
+        except UnicodeDecodeError:
+            return {text(k): text(v) for k, v in pairs}
+
+    def list_hook(items):
+        try:
+            return [v.decode(encoding) if v.__class__ is bytes else v for v in items]
+        except UnicodeDecodeError:
+            return [text(v) for v in items]
+
+    return text(msgpack.unpackb(data, strict_map_key=False, object_pairs_hook=pairs_hook, list_hook=list_hook))
+
+
+class Blob(object):
+
+    __slots__ = ('response', 'offset', 'length', 'text')
+
+    def __init__(self, response, offset, length, text=False):
+        """
+        A large string or binary field of a SpooledResponse, left in the spooled body instead of
+        being loaded into memory. It stays readable until the response is closed.
+
+        Mandatory Arguments:
+        - response : the SpooledResponse holding the body
+        - offset : where the field's bytes start in the body
+        - length : the field's size in bytes
+
+        Optional Keyword Arguments:
+        - text : whether msgpack marked the field as a string rather than binary (default: False)
+        """
+        self.response = response
+        self.offset = offset
+        self.length = length
+        self.text = text
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return '<Blob %d bytes at %d of %s>' % (self.length, self.offset, self.response.path)
+
+    def read(self, start=0, size=None):
+        """
+        The bytes of the field from start on, size of them or all the rest.
+        """
+        start = min(max(start, 0), self.length)
+        end = self.length if size is None else min(self.length, start + size)
+        return self.response.buffer[self.offset + start:self.offset + end]
+
+    def chunks(self, size=1048576):
+        """
+        The bytes of the field in pieces of at most size bytes.
+        """
+        for start in range(0, self.length, size):
+            yield self.read(start, size)
+
+    def save(self, path):
+        """
+        Copy the field to its own file and return its sha256 hex digest.
+        """
+        digest = hashlib.sha256()
+        with open(path, 'wb') as f:
+            for chunk in self.chunks():
+                digest.update(chunk)
+                f.write(chunk)
+        return digest.hexdigest()
+
+
+class SpooledResponse(object):
+
+    def __init__(self, path, encodings=('utf-8',), decode_error_handling='strict', spill_threshold=65536):
+        """
+        A response body spooled to a file and decoded from a memory map of it. String and binary
+        fields larger than spill_threshold bytes are left in the file as Blob objects, so only the
+        small fields are loaded. Other binary fields are decoded to str when they are valid in the
+        encodings and kept as bytes otherwise. The file is deleted by close().
+
+            with client.call_spooled(MsfRpcMethod.ModuleExecute, ['payload', name, opts]) as response:
+                response.result['payload'].save('payload.exe')
+
+        Mandatory Arguments:
+        - path : the spooled msgpack body
+
+        Optional Keyword Arguments:
+        - encodings : the encodings to try on binary fields, in order (default: utf-8)
+        - decode_error_handling : the error handler for invalid string fields (default: strict)
+        - spill_threshold : the size in bytes above which fields stay in the file (default: 65536)
+        """
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.spill_threshold = spill_threshold
+        self._file = open(path, 'rb')
+        self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        try:
+            self.result = self._decode(encodings, decode_error_handling)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the memory map and delete the spooled body. Blobs are unreadable afterwards.
+        """
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.buffer = b''
+        if not self._file.closed:
+            self._file.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _decode(self, encodings, handling):
+        def text(value):
+            if value.__class__ is not bytes:
+                return value
+            for encoding in encodings:
+                try:
+                    return value.decode(encoding)
+                except UnicodeDecodeError:
+                    pass
+            return value
+
+        try:
+            # Without a field over the threshold the whole body unpacks in C
+            return text(msgpack.unpackb(self.buffer, strict_map_key=False, unicode_errors=handling,
+                                        max_bin_len=self.spill_threshold, max_str_len=self.spill_threshold,
+                                        object_pairs_hook=lambda pairs: {text(k): text(v) for k, v in pairs},
+                                        list_hook=lambda items: [text(v) for v in items]))
+        except ValueError as e:
+            if 'exceeds max' not in str(e):
+                raise
+        return _SpoolWalker(self, encodings, handling).value()
+
+
+class _SpoolWalker(object):
+
+    def __init__(self, response, encodings, handling):
+        """
+        Decodes a spooled msgpack body field by field, leaving large fields in the file.
+        """
+        self.response = response
+        self.buffer = response.buffer
+        self.encodings = encodings
+        self.handling = handling
+        self.pos = 0
+
+    def _take(self, fmt, size):
+        value = struct.unpack_from(fmt, self.buffer, self.pos)[0]
+        self.pos += size
+        return value
+
+    def _raw(self, length, text, spill=True):
+        start = self.pos
+        self.pos += length
+        if self.pos > self.response.size:
+            raise ValueError('Truncated msgpack body in %s' % self.response.path)
+        if spill and length > self.response.spill_threshold:
+            return Blob(self.response, start, length, text)
+        data = self.buffer[start:self.pos]
+        if text:
+            return data.decode('utf-8', self.handling)
+        try:
+            return data.decode(self.encodings[0])
+        except UnicodeDecodeError:
+            for encoding in self.encodings[1:]:
+                try:
+                    return data.decode(encoding)
+                except UnicodeDecodeError:
+                    pass
+            return data
+
+    def value(self, spill=True):
+        b = self.buffer[self.pos]
+        self.pos += 1
+        if b <= 0x7f:
+            return b
+        if b >= 0xe0:
+            return b - 0x100
+        if b <= 0x8f:
+            return self._map(b & 0x0f)
+        if b <= 0x9f:
+            return [self.value() for _ in range(b & 0x0f)]
+        if b <= 0xbf:
+            return self._raw(b & 0x1f, True, spill)
+        if b == 0xc0:
+            return None
+        if b == 0xc2:
+            return False
+        if b == 0xc3:
+            return True
+        if 0xc4 <= b <= 0xc6:
+            return self._raw(self._take(*_LENGTHS[b - 0xc4]), False, spill)
+        if 0xc7 <= b <= 0xc9:
+            length = self._take(*_LENGTHS[b - 0xc7])
+            code = self._take('>b', 1)
+            return msgpack.ExtType(code, bytes(self._raw_bytes(length)))
+        if b in _SCALARS:
+            return self._take(*_SCALARS[b])
+        if 0xd4 <= b <= 0xd8:
+            code = self._take('>b', 1)
+            return msgpack.ExtType(code, bytes(self._raw_bytes(1 << (b - 0xd4))))
+        if 0xd9 <= b <= 0xdb:
+            return self._raw(self._take(*_LENGTHS[b - 0xd9]), True, spill)
+        if b == 0xdc or b == 0xdd:
+            return [self.value() for _ in range(self._take(*_LENGTHS[b - 0xdb]))]
+        if b == 0xde or b == 0xdf:
+            return self._map(self._take(*_LENGTHS[b - 0xdd]))
+        raise ValueError('Invalid msgpack byte 0x%02x at %d of %s' % (b, self.pos - 1, self.response.path))
+
+    def _raw_bytes(self, length):
+        start = self.pos
+        self.pos += length
+        return self.buffer[start:self.pos]
+
+    def _map(self, size):
+        result = {}
+        for _ in range(size):
+            # Keys are always loaded, so fields can be looked up by name
+            key = self.value(spill=False)
+            result[key] = self.value()
+        return result
+
+
+# msgpack length prefixes of 8, 16 and 32 bits
+_LENGTHS = [('>B', 1), ('>H', 2), ('>I', 4)]
+
+# msgpack numbers: format byte -> (struct format, size)
+_SCALARS = {
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8),
+}
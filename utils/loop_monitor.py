@@ -0,0 +1,69 @@
+# utils/loop_monitor.py
+"""Event loop lag of the MCP server: how late a task wakes up when the loop is busy."""
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class LoopLagMonitor:
+    """Sleeps interval seconds at a time and records how much later than asked it woke up.
+
+    Anything that holds the event loop (decoding a large response, a blocking call, too many ready
+    tasks) delays every tool call and RPC by as much, so the lag is the latency the server adds
+    on its own under load. Percentiles are over the last window samples.
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 1024):
+        self.interval = interval
+        self.samples = 0
+        self.max = 0.0
+        self._recent = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start sampling on the running event loop."""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            asked = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - asked - self.interval)
+            self.samples += 1
+            self.max = max(self.max, lag)
+            self._recent.append(lag)
+
+    def reset(self) -> None:
+        self.samples = 0
+        self.max = 0.0
+        self._recent.clear()
+
+    @property
+    def stats(self) -> Dict:
+        recent = sorted(self._recent)
+
+        def percentile(q: float) -> float:
+            if not recent:
+                return 0.0
+            return round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 3)
+
+        return {
+            'running': self._task is not None,
+            'interval_ms': round(self.interval * 1000, 3),
+            'samples': self.samples,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(self.max * 1000, 3),
+        }
@@ -0,0 +1,115 @@
+# utils/module_cache.py
+"""LRU cache of module info and options, shared by the MSF clients."""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ModuleCache(object):
+
+    invalidated_by = ('core.reload_modules', 'core.add_module_path')
+
+    def __init__(self, maxsize=512, ttl=3600):
+        """
+        A bounded LRU cache of module metadata keyed by (mtype, mname). Module info and options
+        only change when msfrpcd reloads modules, so clients clear it after core.reload_modules
+        and core.add_module_path, and entries also expire after ttl seconds.
+
+        Optional Keyword Arguments:
+        - maxsize : the number of modules to keep, 0 disables the cache (default: 512)
+        - ttl : seconds an entry stays valid (default: 3600)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, mtype, mname, field):
+        """
+        Returns a cached value for the module, or None.
+
+        Mandatory Arguments:
+        - mtype : the module type
+        - mname : the module name
+        - field : what is cached, e.g. 'metadata' or ('payloads', target)
+        """
+        key = (mtype, mname)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None or field not in entry[1]:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1][field]
+
+    def put(self, mtype, mname, field, value):
+        """
+        Cache a value for the module. msfrpcd error responses are not cached.
+        """
+        if self.maxsize <= 0 or (isinstance(value, dict) and value.get('error')):
+            return
+        key = (mtype, mname)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = (time.monotonic() + self.ttl, {})
+            entry[1][field] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, mtype):
+        """
+        Drop the cached modules of one type, e.g. when msfrpcd reports a different count for it.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == mtype]:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Drop every cached module.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def export(self):
+        """
+        Returns the cached module info and options as [mtype, mname, info, options] lists, least
+        recently used first, for persisting them across restarts.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [[mtype, mname] + list(fields['metadata'])
+                    for (mtype, mname), (expires, fields) in self._entries.items()
+                    if expires >= now and 'metadata' in fields]
+
+    def load(self, entries):
+        """
+        Cache module info and options exported by export(). Loaded entries get a fresh ttl.
+        """
+        for mtype, mname, info, options in entries:
+            self.put(mtype, mname, 'metadata', (info, options))
+
+    @property
+    def stats(self):
+        """
+        Cache size and hit/miss counters.
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,467 @@
+# utils/module_catalog.py
+"""Local, indexed catalog of Metasploit modules searched in-process instead of via module.search."""
+import asyncio
+import bisect
+import contextvars
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Set
+
+import msgpack
+
+from msfrpc import MsfRpcMethod
+from utils.module_cache import ModuleCache
+from utils.msf_utils import get_module_cache
+
+logger = logging.getLogger(__name__)
+
+# module.* list RPC for each module type
+LIST_METHODS = {
+    'exploit': MsfRpcMethod.ModuleExploits,
+    'auxiliary': MsfRpcMethod.ModuleAuxiliary,
+    'post': MsfRpcMethod.ModulePost,
+    'payload': MsfRpcMethod.ModulePayloads,
+    'encoder': MsfRpcMethod.ModuleEncoders,
+    'nop': MsfRpcMethod.ModuleNops,
+}
+
+# core.module_stats count for each module type
+STATS_KEYS = {
+    'exploit': 'exploits',
+    'auxiliary': 'auxiliary',
+    'post': 'post',
+    'payload': 'payloads',
+    'encoder': 'encoders',
+    'nop': 'nops',
+}
+
+# Bumped whenever the snapshot layout changes, so older snapshots are ignored
+SNAPSHOT_FORMAT = 2
+
+# Indexed fields. Free keywords match 'text', which holds every token of a module.
+FIELDS = ('text', 'name', 'ref', 'platform', 'rank', 'type', 'author')
+
+# search keywords, as in msfconsole: keyword -> (field, prefix added to the value)
+KEYWORDS = {
+    'name': ('name', ''),
+    'path': ('name', ''),
+    'type': ('type', ''),
+    'platform': ('platform', ''),
+    'rank': ('rank', ''),
+    'author': ('author', ''),
+    'ref': ('ref', ''),
+    'cve': ('ref', 'cve-'),
+    'edb': ('ref', 'edb-'),
+    'bid': ('ref', 'bid-'),
+    'msb': ('ref', 'msb-'),
+    'osvdb': ('ref', 'osvdb-'),
+}
+
+# Metasploit's module ranks, which module.info can send as these numbers instead of their names
+RANKS = {0: 'manual', 100: 'low', 200: 'average', 300: 'normal', 400: 'good', 500: 'great', 600: 'excellent'}
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens of a string."""
+    return _TOKEN.findall(str(text).lower())
+
+
+def rank_name(rank) -> str:
+    """The lowercase name of a module rank given by name or by number."""
+    rank = str(rank).strip().lower()
+    return RANKS.get(int(rank), rank) if rank.isdigit() else rank
+
+
+def default_snapshot_path() -> Optional[str]:
+    """Snapshot file from MSF_MODULE_SNAPSHOT, by default in the user cache directory. Empty disables it."""
+    default = os.path.join(os.path.expanduser('~'), '.cache', 'metasploit-mcp-server', 'modules.msgpack')
+    path = os.environ.get('MSF_MODULE_SNAPSHOT', default)
+    return os.path.expanduser(path) if path else None
+
+
+def make_record(mtype: str, mname: str, info: Dict) -> Dict:
+    """Reduce a module.info response to the fields the catalog indexes and returns."""
+    references = []
+    for ref in info.get('references') or []:
+        if isinstance(ref, (list, tuple)) and len(ref) == 2 and str(ref[0]).upper() != 'URL':
+            references.append(f"{ref[0]}-{ref[1]}".lower())
+    return {
+        'type': mtype,
+        'name': info.get('name', mname),
+        'fullname': f"{mtype}/{mname}",
+        'path': mname,
+        'rank': rank_name(info.get('rank', '')),
+        'disclosuredate': info.get('disclosuredate', ''),
+        'platforms': [str(p).split('::')[-1].lower() for p in info.get('platform') or []],
+        'references': references,
+        'authors': list(info.get('authors') or []),
+        'description': info.get('description', ''),
+    }
+
+
+class ModuleCatalog:
+    """In-memory module catalog with token indexes per field and prefix matching.
+
+    The catalog is built once from the module.* list RPCs plus module.info for every module,
+    then refreshed incrementally: only modules that appeared since the last build are fetched.
+    With a snapshot_path it is saved after each build together with the module info and options
+    cache, keyed by core.version and core.module_stats, so a restarted server loads it from disk.
+    At most concurrency module.info calls are in flight at once, so a build does not take every
+    connection of the client's pool, nor flood msfrpcd, while tools are being called.
+    """
+
+    def __init__(self, batch_size: int = 100, refresh_interval: float = 3600,
+                 snapshot_path: Optional[str] = None, concurrency: int = 4):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.refresh_interval = refresh_interval
+        self.snapshot_path = snapshot_path
+        self.key: Optional[Dict] = None
+        self.loaded_from: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.names: Dict[str, List[str]] = {}
+        self.records: Dict[str, Dict] = {}
+        self.built_at: Optional[float] = None
+        self.build_seconds: Optional[float] = None
+        self.failed: int = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.last_query_seconds = 0.0
+        self._index: Dict[str, Dict[str, Set[str]]] = {field: {} for field in FIELDS}
+        self._sorted: Dict[str, List[str]] = {}
+        self._invalidations_seen: Optional[int] = None
+        self._saved_modules: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether the catalog has been built at least once."""
+        return self.built_at is not None
+
+    def stale(self, client) -> bool:
+        """Whether msfrpcd reloaded modules, or refresh_interval passed, since the last build."""
+        if not self.ready:
+            return True
+        if self._invalidations_seen != client.module_cache.invalidations:
+            return True
+        return time.time() - self.built_at > self.refresh_interval
+
+    async def build(self, client, full: bool = False) -> Dict:
+        """Fetch the module lists and the info of every module not catalogued yet.
+
+        Only module types whose core.module_stats count changed since the last build are listed
+        again; modules that disappeared from them are dropped. A different core.version, or
+        full=True (e.g. after msfrpcd reloaded its modules), fetches the info of every module again.
+        Returns the catalog stats.
+        """
+        start = time.perf_counter()
+        async with client.batch() as batch:
+            batch.call(MsfRpcMethod.CoreVersion)
+            batch.call(MsfRpcMethod.CoreModuleStats)
+        version, counts = batch.results()
+        key = {
+            'version': version.get('version'),
+            'stats': {mtype: counts.get(STATS_KEYS[mtype]) for mtype in LIST_METHODS},
+        }
+        if self.key is not None and self.key['version'] != key['version']:
+            logger.info("Metasploit version changed from %s to %s, rebuilding the module catalog",
+                        self.key['version'], key['version'])
+            client.module_cache.clear()
+            full = True
+        if full or self.key is None:
+            mtypes = list(LIST_METHODS)
+        else:
+            mtypes = [mtype for mtype in LIST_METHODS
+                      if mtype not in self.names or self.key['stats'].get(mtype) != key['stats'][mtype]]
+        invalidations = client.module_cache.invalidations
+
+        names = dict(self.names)
+        if mtypes:
+            async with client.batch() as batch:
+                for mtype in mtypes:
+                    batch.call(LIST_METHODS[mtype])
+            for mtype, result in zip(mtypes, batch.results()):
+                names[mtype] = sorted(result.get('modules', []))
+                if not full and self.key is not None:
+                    client.module_cache.discard(mtype)
+
+        wanted = {f"{mtype}/{mname}": (mtype, mname) for mtype in mtypes for mname in names[mtype]}
+        for fullname in [f for f, r in self.records.items() if r['type'] in mtypes and f not in wanted]:
+            self._remove(fullname)
+        missing = [wanted[f] for f in wanted if full or f not in self.records]
+        self.failed = 0
+        for i in range(0, len(missing), self.batch_size):
+            chunk = missing[i:i + self.batch_size]
+            async with client.batch(self.concurrency) as batch:
+                for mtype, mname in chunk:
+                    batch.call(MsfRpcMethod.ModuleInfo, [mtype, mname])
+            for (mtype, mname), info in zip(chunk, batch.results(return_exceptions=True)):
+                if isinstance(info, Exception) or not isinstance(info, dict) or info.get('error'):
+                    self.failed += 1
+                    continue
+                self._add(make_record(mtype, mname, info))
+
+        self.names = names
+        self.key = key
+        self.built_at = time.time()
+        self.build_seconds = time.perf_counter() - start
+        self._invalidations_seen = invalidations
+        logger.info("Module catalog built: %d modules, %d types listed, %d fetched, %d failed in %.2fs",
+                    len(self.records), len(mtypes), len(missing), self.failed, self.build_seconds)
+        if self.snapshot_path and (mtypes or missing or self._saved_modules != client.module_cache.stats['size']):
+            try:
+                # Packing and writing a large catalog takes long enough to stall other tool calls
+                await asyncio.to_thread(self.save, self.snapshot_path, client.module_cache)
+            except OSError as e:
+                logger.warning("Could not save the module catalog snapshot to %s: %s", self.snapshot_path, e)
+        return self.stats
+
+    async def refresh(self, client) -> Dict:
+        """Bring a stale catalog up to date: a full rebuild after a module reload, else incremental."""
+        full = self._invalidations_seen is not None and self._invalidations_seen != client.module_cache.invalidations
+        return await self.build(client, full=full)
+
+    def build_in_background(self, client) -> asyncio.Task:
+        """Start a refresh unless one is already running, and return its task."""
+        if self._task is None or self._task.done():
+            # Not part of the trace of the tool call that started it
+            self._task = asyncio.get_running_loop().create_task(self._background_refresh(client),
+                                                                 context=contextvars.Context())
+        return self._task
+
+    async def _background_refresh(self, client) -> None:
+        try:
+            await self.refresh(client)
+        except Exception:
+            logger.exception("Module catalog build failed")
+
+    def save(self, path: str, module_cache: Optional[ModuleCache] = None) -> None:
+        """Write the catalog, and the cached module info and options, to a snapshot file."""
+        snapshot = {
+            'format': SNAPSHOT_FORMAT,
+            'key': self.key,
+            'built_at': self.built_at,
+            'names': self.names,
+            'records': list(self.records.values()),
+            'index': {field: {token: list(fullnames) for token, fullnames in index.items()}
+                      for field, index in self._index.items()},
+            'modules': module_cache.export() if module_cache is not None else [],
+        }
+        data = msgpack.packb(snapshot, use_bin_type=True)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            # A full disk or a failed rename would otherwise leave the partial file behind
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._saved_modules = len(snapshot['modules'])
+
+    def load(self, path: str, module_cache: Optional[ModuleCache] = None) -> bool:
+        """Load a snapshot written by save(). Returns False if there is none or it is unusable.
+
+        The catalog is then ready but stale: the next refresh checks core.version and
+        core.module_stats and only fetches what changed.
+        """
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb') as f:
+                snapshot = msgpack.unpackb(f.read(), raw=False, strict_map_key=False)
+            if snapshot.get('format') != SNAPSHOT_FORMAT:
+                logger.info("Ignoring module catalog snapshot %s with format %s", path, snapshot.get('format'))
+                return False
+            records = snapshot['records']
+            key, names, built_at = snapshot['key'], snapshot['names'], snapshot['built_at']
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("Ignoring unreadable module catalog snapshot %s: %s", path, e)
+            return False
+
+        self.records = {record['fullname']: record for record in records}
+        self._sorted = {}
+        index = snapshot.get('index')
+        if index is not None and set(index) == set(FIELDS):
+            # The precomputed index saves tokenizing every record again
+            self._index = {field: {token: set(fullnames) for token, fullnames in index[field].items()}
+                           for field in FIELDS}
+        else:
+            self._index = {field: {} for field in FIELDS}
+            for record in records:
+                self._add(record)
+        self.key = key
+        self.names = names
+        self.built_at = built_at
+        self._invalidations_seen = None
+        if module_cache is not None:
+            module_cache.load(snapshot.get('modules', []))
+        self._saved_modules = len(snapshot.get('modules', []))
+        self.loaded_from = path
+        self.load_seconds = time.perf_counter() - start
+        logger.info("Module catalog loaded from %s: %d modules in %.1fms",
+                    path, len(self.records), self.load_seconds * 1000)
+        return True
+
+    def _add(self, record: Dict) -> None:
+        fullname = record['fullname']
+        if fullname in self.records:
+            self._remove(fullname)
+        self.records[fullname] = record
+        for field, tokens in self._record_tokens(record).items():
+            index = self._index[field]
+            for token in tokens:
+                if token not in index:
+                    index[token] = set()
+                    self._sorted.pop(field, None)
+                index[token].add(fullname)
+
+    def _remove(self, fullname: str) -> None:
+        record = self.records.pop(fullname)
+        for field, tokens in self._record_tokens(record).items():
+            index = self._index[field]
+            for token in tokens:
+                index[token].discard(fullname)
+                if not index[token]:
+                    del index[token]
+                    self._sorted.pop(field, None)
+
+    @staticmethod
+    def _record_tokens(record: Dict) -> Dict[str, Set[str]]:
+        name = set(tokenize(record['path']))
+        refs = set(record['references'])
+        for ref in record['references']:
+            refs.update(tokenize(ref))
+        authors = set()
+        for author in record['authors']:
+            authors.update(tokenize(author))
+        tokens = {
+            'name': name,
+            'ref': refs,
+            'platform': set(record['platforms']),
+            'rank': {record['rank']} if record['rank'] else set(),
+            'type': {record['type']},
+            'author': authors,
+        }
+        text = set(tokenize(record['name'])) | set(tokenize(record['description']))
+        for field_tokens in tokens.values():
+            text |= field_tokens
+        tokens['text'] = text
+        return tokens
+
+    def _match(self, field: str, term: str) -> Set[str]:
+        """Modules with a token in field that starts with term."""
+        keys = self._sorted.get(field)
+        if keys is None:
+            keys = self._sorted[field] = sorted(self._index[field])
+        index = self._index[field]
+        matches = set()
+        i = bisect.bisect_left(keys, term)
+        while i < len(keys) and keys[i].startswith(term):
+            matches |= index[keys[i]]
+            i += 1
+        return matches
+
+    def _term_matches(self, field: str, value: str) -> Set[str]:
+        value = value.lower()
+        if field == 'ref' or '-' in value:
+            # Whole reference ids such as cve-2017-0144 or ms17-010
+            exact = self._match('ref', value)
+            if exact or field == 'ref':
+                return exact
+        result = None
+        for token in tokenize(value):
+            matches = self._match(field, token)
+            result = matches if result is None else result & matches
+        return result or set()
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict]:
+        """Search the catalog.
+
+        Free keywords match names, titles, descriptions, references, platforms and authors by prefix.
+        Keywords like msfconsole's are supported: type:, name:, platform:, rank:, author:, ref:, cve:, edb:.
+        All terms must match.
+        """
+        start = time.perf_counter()
+        result: Optional[Set[str]] = None
+        for term in query.split():
+            key, sep, value = term.partition(':')
+            if sep and key.lower() in KEYWORDS and value:
+                field, prefix = KEYWORDS[key.lower()]
+                matches = self._term_matches(field, prefix + value)
+            else:
+                matches = self._term_matches('text', term)
+            result = matches if result is None else result & matches
+            if not result:
+                break
+        fullnames = sorted(result or ())
+        if limit is not None:
+            fullnames = fullnames[:limit]
+        found = [self._search_result(self.records[f]) for f in fullnames]
+        self.last_query_seconds = time.perf_counter() - start
+        self.query_seconds += self.last_query_seconds
+        self.queries += 1
+        return found
+
+    @staticmethod
+    def _search_result(record: Dict) -> Dict:
+        """The record in the shape module.search returns."""
+        return {
+            'type': record['type'],
+            'name': record['name'],
+            'fullname': record['fullname'],
+            'rank': record['rank'],
+            'disclosuredate': record['disclosuredate'],
+        }
+
+    def list(self, mtype: Optional[str] = None) -> List[str]:
+        """Module names of one type, or of every type in LIST_METHODS order."""
+        if mtype is not None:
+            return list(self.names.get(mtype, []))
+        return [mname for t in LIST_METHODS for mname in self.names.get(t, [])]
+
+    @property
+    def stats(self) -> Dict:
+        """Catalog size, build time and query latency."""
+        return {
+            'modules': len(self.records),
+            'failed': self.failed,
+            'built_at': self.built_at,
+            'build_seconds': self.build_seconds,
+            'loaded_from': self.loaded_from,
+            'load_ms': self.load_seconds * 1000 if self.load_seconds is not None else None,
+            'queries': self.queries,
+            'last_query_ms': self.last_query_seconds * 1000,
+            'avg_query_ms': self.query_seconds * 1000 / self.queries if self.queries else 0.0,
+        }
+
+
+_catalog = ModuleCatalog(snapshot_path=default_snapshot_path(),
+                         concurrency=int(os.environ.get('MSF_MODULE_CATALOG_CONCURRENCY', '4')))
+_snapshot_load: Optional[asyncio.Future] = None
+
+
+async def _load_snapshot() -> None:
+    if _catalog.snapshot_path:
+        await asyncio.to_thread(_catalog.load, _catalog.snapshot_path, get_module_cache())
+
+
+async def get_module_catalog() -> ModuleCatalog:
+    """Get the process-wide module catalog, loading the on-disk snapshot on first use.
+
+    The snapshot is read in a worker thread, and concurrent first callers wait for the same load.
+    """
+    global _snapshot_load
+    if _snapshot_load is None:
+        _snapshot_load = asyncio.ensure_future(_load_snapshot())
+    await asyncio.shield(_snapshot_load)
+    return _catalog
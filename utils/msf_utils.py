@@ -1,19 +1,92 @@
 # utils/msf_utils.py
 import os
+import asyncio
 import functools
-from typing import Callable, Dict, Any, TypeVar, Optional
-from pymetasploit3.msfrpc import MsfRpcClient, MsfRpcError
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Any, TypeVar, Optional, Union
+import httpx
+from msfrpc import MsfRpcClient, MsfRpcError, MsfError
+from msfrpc_async import AsyncMsfRpcClient
 from mcp.server.fastmcp import Context
+from utils.cassette import Cassette
+from utils.console_pool import AsyncConsolePool
+from utils.module_cache import ModuleCache
+from utils.response_cache import ResponseCache
+from utils.retry_policy import CircuitBreaker, RetryPolicy
+from utils.rpc_metrics import RpcMetrics
+from utils.tracing import Tracer
+from utils.token_manager import TokenManager, default_token_path
+from utils.loop_monitor import LoopLagMonitor
 
-# Global client instance
+logger = logging.getLogger(__name__)
+
+# Global client instances
 _msf_client = None
+_msf_async_client = None
+
+# Module metadata cache shared by every client, so it survives reconnects
+_module_cache = ModuleCache(
+    maxsize=int(os.environ.get('MSF_MODULE_CACHE_SIZE', '512')),
+    ttl=float(os.environ.get('MSF_MODULE_CACHE_TTL', '3600'))
+)
+
+# Short-lived cache of the session, job, console and workspace lists, shared by every client
+_response_cache = ResponseCache() if os.environ.get('MSF_RPC_RESPONSE_CACHE', 'true').lower() == 'true' else None
+
+# Consoles created ahead of time for console commands, see get_console_pool()
+_console_pool = None
+
+# Tracks the permanent tokens the clients add to msfrpcd, so they are reused and cleaned up
+_token_manager = TokenManager(default_token_path())
+
+# Retry policy and circuit breaker shared by every client, so both stop calling a down msfrpcd
+_retry_policy = RetryPolicy(
+    tries=int(os.environ.get('MSF_RPC_RETRIES', '3')),
+    deadline=float(os.environ.get('MSF_RPC_RETRY_DEADLINE', '10')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('MSF_RPC_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.environ.get('MSF_RPC_BREAKER_RESET', '30'))
+    )
+)
+
+# Per-method call metrics of every client, reported every MSF_RPC_METRICS_INTERVAL seconds
+_rpc_metrics = RpcMetrics()
+
+# Traces of tool calls and the RPCs they make, written to MSF_TRACE_FILE when it is set
+_tracer = Tracer(
+    path=os.path.expanduser(os.environ.get('MSF_TRACE_FILE', '')) or None,
+    sample_rate=float(os.environ.get('MSF_TRACE_SAMPLE_RATE', '1')),
+    format=os.environ.get('MSF_TRACE_FORMAT', 'jsonl')
+)
+
+# Every call and response of the clients, recorded to MSF_RPC_CASSETTE when it is set, for replaying offline
+_cassette_path = os.path.expanduser(os.environ.get('MSF_RPC_CASSETTE', ''))
+_cassette = Cassette(_cassette_path) if _cassette_path else None
+
+# How late the event loop runs tasks, sampled every MSF_LOOP_LAG_INTERVAL seconds while the server runs
+_loop_monitor = LoopLagMonitor(interval=float(os.environ.get('MSF_LOOP_LAG_INTERVAL', '0.1')))
+
+# MCP connections in the lifespan; the shared clients start with the first and stop with the last
+_lifespan_users = 0
+_lifespan_lock = asyncio.Lock()
+_reporter: Optional[asyncio.Task] = None
 
 # Type variable for ensure_connected decorator
 T = TypeVar('T')
 
-def get_client() -> MsfRpcClient:
-    """Get the shared MSF client instance."""
-    global _msf_client
+def get_client(asynchronous: bool = False) -> Union[MsfRpcClient, AsyncMsfRpcClient]:
+    """Get the shared MSF client instance.
+
+    With asynchronous=True this returns the shared AsyncMsfRpcClient, which the MCP tools
+    use so that concurrent tool calls do not block the event loop on RPC round trips.
+    """
+    global _msf_client, _msf_async_client
+    if asynchronous:
+        if _msf_async_client is None:
+            _msf_async_client = connect(asynchronous=True)
+        return _msf_async_client
     if _msf_client is None:
         _msf_client = connect()
     return _msf_client
@@ -23,10 +96,16 @@ def connect(
     port: int = None, 
     username: str = None, 
     password: str = None, 
-    ssl: bool = None
-) -> MsfRpcClient:
-    """Connect to MSF RPC server using environment variables or provided parameters."""
-    global _msf_client
+    ssl: bool = None,
+    pool_size: int = None,
+    timeout: float = None,
+    asynchronous: bool = False
+) -> Union[MsfRpcClient, AsyncMsfRpcClient]:
+    """Connect to MSF RPC server using environment variables or provided parameters.
+
+    The asyncio client does no I/O here; it logs in on its first call.
+    """
+    global _msf_client, _msf_async_client
     
     # Use provided parameters or fall back to environment variables
     host = host or os.environ.get('MSF_RPC_HOST', '127.0.0.1')
@@ -34,21 +113,174 @@ def connect(
     username = username or os.environ.get('MSF_RPC_USERNAME', 'msf')
     password = password or os.environ.get('MSF_RPC_PASSWORD', 'msf')
     ssl = ssl if ssl is not None else os.environ.get('MSF_RPC_SSL', 'false').lower() == 'true'
+    pool_size = pool_size or int(os.environ.get('MSF_RPC_POOL_SIZE', '10'))
+    timeout = timeout or float(os.environ.get('MSF_RPC_TIMEOUT', '300'))
     
-    _msf_client = MsfRpcClient(
+    client_cls = AsyncMsfRpcClient if asynchronous else MsfRpcClient
+    client = client_cls(
         password,
         username=username,
         server=host,
         port=port,
-        ssl=ssl
+        ssl=ssl,
+        pool_size=pool_size,
+        timeout=timeout,
+        module_cache=_module_cache,
+        session_buffer_size=int(os.environ.get('MSF_SESSION_BUFFER_SIZE', '1048576')),
+        auth_check_interval=float(os.environ.get('MSF_RPC_AUTH_CHECK_INTERVAL', '300')),
+        token_manager=_token_manager,
+        retry_policy=_retry_policy,
+        metrics=_rpc_metrics,
+        cassette=_cassette,
+        response_cache=_response_cache,
+        session_refresh_interval=float(os.environ.get('MSF_SESSION_REFRESH_INTERVAL', '2'))
     )
-    return _msf_client
+    if asynchronous:
+        _msf_async_client = client
+    else:
+        _msf_client = client
+    return client
+
+def get_module_cache() -> ModuleCache:
+    """Get the module metadata cache shared by the MSF clients."""
+    return _module_cache
+
+def get_console_pool() -> AsyncConsolePool:
+    """Get the pool of ready consoles on the shared asyncio client."""
+    global _console_pool
+    if _console_pool is None:
+        _console_pool = AsyncConsolePool(
+            get_client(asynchronous=True),
+            size=int(os.environ.get('MSF_CONSOLE_POOL_SIZE', '2')),
+            max_size=int(os.environ.get('MSF_CONSOLE_POOL_MAX', '8')),
+            idle_timeout=float(os.environ.get('MSF_CONSOLE_POOL_IDLE_TIMEOUT', '300'))
+        )
+    return _console_pool
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get the list response cache shared by the MSF clients, None when it is disabled."""
+    return _response_cache
+
+def get_retry_policy() -> RetryPolicy:
+    """Get the retry policy and circuit breaker shared by the MSF clients."""
+    return _retry_policy
+
+def get_rpc_metrics() -> RpcMetrics:
+    """Get the per-method call metrics shared by the MSF clients."""
+    return _rpc_metrics
+
+def get_tracer() -> Tracer:
+    """Get the tracer of tool calls."""
+    return _tracer
+
+def get_cassette() -> Optional[Cassette]:
+    """Get the cassette the MSF clients record their calls in, None when not recording."""
+    return _cassette
+
+def get_loop_monitor() -> LoopLagMonitor:
+    """Get the event loop lag monitor of the server."""
+    return _loop_monitor
+
+def get_token_manager() -> TokenManager:
+    """Get the manager of the permanent tokens added to msfrpcd."""
+    return _token_manager
+
+def _log_session_event(event: Dict) -> None:
+    logger.info("Session %s (%s) %s", event['id'], event['type'], event['event'])
+
+async def _report_metrics(path: Optional[str]) -> None:
+    """Log a one-line JSON summary of the RPC metrics, and dump them all to path if given."""
+    stats = _rpc_metrics.stats
+    summary = {method: {key: m[key] for key in ('calls', 'errors', 'retries', 'p50_ms', 'p95_ms', 'p99_ms')}
+               for method, m in stats['methods'].items()}
+    logger.info("rpc_metrics %s", json.dumps({'calls': stats['calls'], 'errors': stats['errors'], 'methods': summary}))
+    if path:
+        try:
+            await asyncio.to_thread(_rpc_metrics.dump, path)
+        except OSError as e:
+            logger.warning("Could not write the RPC metrics to %s: %s", path, e)
+
+async def _report_metrics_every(interval: float, path: Optional[str]) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        await _report_metrics(path)
+
+@asynccontextmanager
+async def lifespan(server):
+    """MCP server lifespan: reuse and sweep msfrpcd tokens at startup, remove ours at shutdown.
+
+    Every MCP connection enters the lifespan (over SSE there can be several at once), but the
+    shared clients and pools start with the first connection and stop when the last one ends.
+    """
+    global _lifespan_users
+    async with _lifespan_lock:
+        _lifespan_users += 1
+        if _lifespan_users == 1:
+            await _startup()
+    try:
+        yield {}
+    finally:
+        async with _lifespan_lock:
+            _lifespan_users -= 1
+            if _lifespan_users == 0:
+                await _shutdown()
+
+async def _startup() -> None:
+    """Authenticate, create the console pool and start the background tasks.
+
+    The session registry is refreshed in the background while the server runs, so session tools
+    find their session without listing them all first. RPC metrics are logged, and written to
+    MSF_RPC_METRICS_FILE, every MSF_RPC_METRICS_INTERVAL seconds and once more at shutdown.
+    """
+    global _reporter
+    client = get_client(asynchronous=True)
+    try:
+        await _token_manager.start(client)
+    except (MsfError, MsfRpcError, httpx.HTTPError) as e:
+        # msfrpcd may come up later; tools log in on first use
+        logger.warning("Could not authenticate to msfrpcd at startup: %s", e)
+    client.session_registry.subscribe(_log_session_event)
+    if client.session_registry.interval > 0:
+        client.session_registry.start()
+    try:
+        await get_console_pool().fill()
+    except (MsfError, MsfRpcError, httpx.HTTPError) as e:
+        logger.warning("Could not create the console pool at startup: %s", e)
+    metrics_interval = float(os.environ.get('MSF_RPC_METRICS_INTERVAL', '60'))
+    if metrics_interval > 0:
+        _reporter = asyncio.create_task(_report_metrics_every(metrics_interval, _metrics_path()))
+    _loop_monitor.start()
+
+async def _shutdown() -> None:
+    """Destroy the pooled consoles, remove our tokens and disconnect. The trace file and the cassette are closed last."""
+    global _reporter, _console_pool
+    await _loop_monitor.stop()
+    if _reporter is not None:
+        _reporter.cancel()
+        _reporter = None
+    await _report_metrics(_metrics_path())
+    client = get_client(asynchronous=True)
+    try:
+        await get_console_pool().close()
+        await _token_manager.shutdown(client)
+    except (MsfError, MsfRpcError, httpx.HTTPError) as e:
+        logger.warning("Could not remove msfrpcd tokens at shutdown: %s", e)
+    # A later connection starts again with a new client and pool
+    _console_pool = None
+    await disconnect_async()
+    _tracer.close()
+    if _cassette is not None:
+        _cassette.close()
+
+def _metrics_path() -> Optional[str]:
+    return os.path.expanduser(os.environ.get('MSF_RPC_METRICS_FILE', '')) or None
 
 def disconnect() -> None:
     """Disconnect from MSF RPC server."""
     global _msf_client
     if _msf_client:
-        # No explicit disconnect method in MsfRpcClient, so we just delete the reference
+        # Release the pooled keep-alive connections before dropping the reference
+        _msf_client.close()
         _msf_client = None
 
 def reconnect() -> MsfRpcClient:
@@ -56,22 +288,46 @@ def reconnect() -> MsfRpcClient:
     disconnect()
     return connect()
 
+async def disconnect_async() -> None:
+    """Disconnect the asyncio client from MSF RPC server."""
+    global _msf_async_client
+    if _msf_async_client:
+        await _msf_async_client.aclose()
+        _msf_async_client = None
+
+async def reconnect_async() -> AsyncMsfRpcClient:
+    """Log the asyncio client in again.
+
+    The client object is kept: concurrent tool calls and background tasks share it, so closing
+    it would break their in-flight requests.
+    """
+    client = get_client(asynchronous=True)
+    client.token = None
+    await client.login()
+    return client
+
 def ensure_connected(func: Callable[..., T]) -> Callable[..., T]:
-    """Decorator to ensure the MSF client is connected before calling the function."""
+    """Decorator to ensure the MSF client is authenticated before calling the function.
+
+    The client keeps one token for the life of the process: it logs in on first use, checks the
+    token at most once per MSF_RPC_AUTH_CHECK_INTERVAL seconds of inactivity, and logs in again
+    (retrying the call once) only when msfrpcd rejects it.
+
+    Each call is also the root span of a trace, whose children are the RPCs and steps it makes.
+    """
     @functools.wraps(func)
     async def wrapper(ctx: Context, *args, **kwargs) -> T:
-        try:
-            # Try to access the client to check if it's connected
-            client = get_client()
-            client.auth.token  # Will fail if not authenticated
-            return await func(ctx, *args, **kwargs)
-        except (AttributeError, MsfRpcError):
-            # If not connected or token expired, try to reconnect
+        with _tracer.trace(func.__name__, **{'mcp.tool': func.__name__}) as span:
+            client = get_client(asynchronous=True)
             try:
-                reconnect()
-                return await func(ctx, *args, **kwargs)
-            except MsfRpcError as e:
+                await client.ensure_auth()
+            except (MsfError, MsfRpcError, httpx.HTTPError) as e:
+                span.fail(e)
                 return {"error": f"Failed to connect to Metasploit RPC server: {str(e)}"}
+            result = await func(ctx, *args, **kwargs)
+            if isinstance(result, dict) and "error" in result:
+                span.fail(result["error"])
+            return result
     return wrapper
 
 # In mcp_server.py, use the helper:
@@ -0,0 +1,83 @@
+# utils/pattern_matcher.py
+"""Incremental search for end strings in output that arrives in chunks."""
+from collections import deque
+
+
+class MultiPatternMatcher(object):
+
+    def __init__(self, patterns):
+        """
+        Finds the first of several strings in text that arrives in chunks, such as the end strings
+        of session or console output, without scanning earlier output again. An Aho-Corasick
+        automaton carries the partial match across chunk boundaries; it only walks the first and
+        last len(longest pattern) - 1 characters of each chunk, and matches lying wholly inside a
+        chunk are found with str's own search, so feeding n characters costs O(n).
+
+        Mandatory Arguments:
+        - patterns : the strings to look for
+        """
+        self.patterns = [p for p in patterns if p]
+        self.maxlen = max((len(p) for p in self.patterns), default=0)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]
+        for pattern in self.patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                    self._goto[state][ch] = nxt
+                state = nxt
+            if self._out[state] is None:
+                self._out[state] = pattern
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                if self._out[nxt] is None:
+                    self._out[nxt] = self._out[self._fail[nxt]]
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the text fed so far.
+        """
+        self.state = 0
+        self.match = None
+
+    def _scan(self, state, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state] is not None:
+                return state, out[state]
+        return state, None
+
+    def feed(self, data):
+        """
+        Scan the next chunk of text. Returns the pattern found so far, or None.
+        """
+        if self.match is not None or not self.patterns or not data:
+            return self.match
+        overlap = self.maxlen - 1
+        # Matches that started in earlier chunks end within the first overlap characters
+        state, match = self._scan(self.state, data[:overlap])
+        if match is None and len(data) > overlap:
+            match = next((p for p in self.patterns if p in data), None)
+            if match is None:
+                # The automaton state only depends on the last overlap characters
+                state, match = self._scan(0, data[-overlap:]) if overlap else (0, None)
+        self.state = state
+        self.match = match
+        return match
@@ -0,0 +1,145 @@
+# utils/response_cache.py
+"""Short-lived cache of the list responses the managers fetch repeatedly."""
+import threading
+import time
+
+
+class ResponseCache(object):
+
+    # Seconds each list response stays valid
+    default_ttls = {
+        'session.list': 1.0,
+        'job.list': 1.0,
+        'console.list': 0.5,
+        'db.workspaces': 5.0,
+        'db.current_workspace': 5.0,
+        'plugin.loaded': 5.0,
+    }
+
+    # The cached methods whose responses a call can change. Console commands and session
+    # commands can open sessions and start or stop jobs, so they drop those lists as well.
+    invalidated_by = {
+        'console.create': ('console.list',),
+        'console.destroy': ('console.list',),
+        'console.read': ('console.list',),
+        'console.write': ('console.list', 'session.list', 'job.list', 'db.workspaces', 'db.current_workspace',
+                          'plugin.loaded'),
+        'console.session_kill': ('console.list', 'session.list'),
+        'console.session_detach': ('console.list', 'session.list'),
+        'module.execute': ('session.list', 'job.list'),
+        'job.stop': ('job.list', 'session.list'),
+        'session.stop': ('session.list', 'job.list'),
+        'session.shell_upgrade': ('session.list', 'job.list'),
+        'session.shell_write': ('session.list', 'job.list'),
+        'session.meterpreter_write': ('session.list', 'job.list'),
+        'session.meterpreter_run_single': ('session.list', 'job.list'),
+        'session.meterpreter_script': ('session.list', 'job.list'),
+        'session.meterpreter_session_detach': ('session.list',),
+        'session.meterpreter_session_kill': ('session.list',),
+        'db.add_workspace': ('db.workspaces',),
+        'db.del_workspace': ('db.workspaces', 'db.current_workspace'),
+        'db.set_workspace': ('db.current_workspace',),
+        'db.connect': ('db.workspaces', 'db.current_workspace'),
+        'db.disconnect': ('db.workspaces', 'db.current_workspace'),
+        'plugin.load': ('plugin.loaded',),
+        'plugin.unload': ('plugin.loaded',),
+    }
+
+    def __init__(self, ttls=None):
+        """
+        Caches the responses of the list calls the managers make several times per operation,
+        e.g. console.list on every poll of MsfConsole.is_busy, for a short per-method ttl. Calls
+        that change what a list returns drop its entries (see invalidated_by), and a response
+        fetched while such a call ran is not stored.
+
+        Optional Keyword Arguments:
+        - ttls : seconds to cache each method's responses for, merged over default_ttls;
+                 a ttl of 0 disables caching that method
+        """
+        self.ttls = dict(self.default_ttls)
+        self.ttls.update(ttls or {})
+        self.invalidations = 0
+        self._generation = 0
+        self._entries = {}
+        self._counters = dict((method, [0, 0]) for method in self.ttls)
+        self._lock = threading.Lock()
+
+    def caches(self, method):
+        return self.ttls.get(method, 0) > 0
+
+    @property
+    def generation(self):
+        """
+        Changes whenever entries are invalidated; pass the value read before fetching to put().
+        """
+        return self._generation
+
+    def get(self, method, key):
+        """
+        Returns the cached response for the call, or None.
+
+        Mandatory Arguments:
+        - method : the RPC method
+        - key : the encoded call arguments
+        """
+        with self._lock:
+            entry = self._entries.get((method, key))
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[(method, key)]
+                entry = None
+            self._counters[method][entry is None] += 1
+            return None if entry is None else entry[1]
+
+    def put(self, method, key, response, generation):
+        """
+        Cache a response unless entries were invalidated since generation was read.
+        """
+        with self._lock:
+            if generation == self._generation:
+                self._entries[(method, key)] = (time.monotonic() + self.ttls[method], response)
+
+    def invalidate(self, method):
+        """
+        Drop the entries a call to method may have made stale.
+        """
+        stale = self.invalidated_by.get(method)
+        if not stale:
+            return
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for key in [k for k in self._entries if k[0] in stale]:
+                del self._entries[key]
+
+    def discard(self, method):
+        """
+        Drop the cached responses of method, so its next call reaches msfrpcd.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in [k for k in self._entries if k[0] == method]:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Drop every cached response.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        """
+        Cache size, invalidations and per-method hit/miss counters and hit rates.
+        """
+        with self._lock:
+            methods = {}
+            for method, (hits, misses) in self._counters.items():
+                methods[method] = {
+                    'ttl': self.ttls[method],
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': hits / (hits + misses) if hits + misses else None,
+                }
+            return {'size': len(self._entries), 'invalidations': self.invalidations, 'methods': methods}
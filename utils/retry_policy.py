@@ -0,0 +1,273 @@
+# utils/retry_policy.py
+"""Retries of failed msfrpcd requests, and the circuit breaker that stops them while msfrpcd is down."""
+import random
+import threading
+import time
+
+
+class CircuitBreaker(object):
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Stops calls to msfrpcd while it is unreachable. After failure_threshold consecutive
+        transport failures the breaker opens and calls fail at once; after reset_timeout seconds
+        one trial call is let through (half open), which closes the breaker if it succeeds and
+        opens it again if it fails.
+
+        Optional Keyword Arguments:
+        - failure_threshold : consecutive failures that open the breaker (default: 5)
+        - reset_timeout : seconds the breaker stays open before a trial call (default: 30)
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.opens = 0
+        self.rejected = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Whether a call may go out now.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.HALF_OPEN:
+                if self._trial:
+                    self.rejected += 1
+                    return False
+                self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+    def record_abort(self):
+        """
+        A call ended without a response or a transport error, e.g. it was cancelled. The trial call
+        of a half open breaker counts as failed, so another is let through after reset_timeout;
+        other calls leave the breaker as it is.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._trial:
+                self.opens += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+    @property
+    def retry_in(self):
+        """
+        Seconds until an open breaker lets a trial call through.
+        """
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'opens': self.opens,
+                'rejected': self.rejected,
+                'retry_in': self.retry_in,
+            }
+
+
+class RetryPolicy(object):
+
+    # Calls that only read state, or set it to the same value each time, are safe to send again
+    # after a failure that may have reached msfrpcd. Session and console reads are not: they drain.
+    idempotent = frozenset([
+        'auth.token_list',
+        'console.list',
+        'console.tabs',
+        'core.version',
+        'core.setg',
+        'core.unsetg',
+        'core.module_stats',
+        'core.thread_list',
+        'db.hosts',
+        'db.services',
+        'db.vulns',
+        'db.workspaces',
+        'db.current_workspace',
+        'db.get_workspace',
+        'db.set_workspace',
+        'db.get_host',
+        'db.get_service',
+        'db.get_note',
+        'db.get_client',
+        'db.notes',
+        'db.get_ref',
+        'db.events',
+        'db.loots',
+        'db.creds',
+        'db.get_vuln',
+        'db.clients',
+        'db.driver',
+        'db.status',
+        'job.list',
+        'job.info',
+        'module.exploits',
+        'module.evasion',
+        'module.auxiliary',
+        'module.payloads',
+        'module.encoders',
+        'module.nops',
+        'module.platforms',
+        'module.post',
+        'module.info_html',
+        'module.info',
+        'module.compatible_payloads',
+        'module.compatible_evasion_payloads',
+        'module.compatible_sessions',
+        'module.target_compatible_payloads',
+        'module.target_compatible_evasion_payloads',
+        'module.options',
+        'module.encode_formats',
+        'module.search',
+        'module.running_stats',
+        'module.results',
+        'plugin.loaded',
+        'session.list',
+        'session.ring_read',
+        'session.ring_last',
+        'session.meterpreter_tabs',
+        'session.meterpreter_directory_separator',
+        'session.compatible_modules',
+    ])
+
+    def __init__(self, tries=3, base_delay=0.1, max_delay=2.0, deadline=10.0, breaker=None):
+        """
+        Decides whether a failed request to msfrpcd is sent again and how long to wait first.
+
+        A request that failed before it was sent (connection refused, connect timeout) can always
+        be retried. One that may have reached msfrpcd is only retried for idempotent methods, so
+        calls like module.execute or session.shell_write are never duplicated. Waits grow
+        exponentially from base_delay with full jitter, and no retry starts if it would end past
+        deadline seconds after the call began. A shared CircuitBreaker makes calls fail fast with
+        MsfRpcUnavailableError while msfrpcd is down.
+
+        Optional Keyword Arguments:
+        - tries : attempts per call, including the first (default: 3)
+        - base_delay / max_delay : bounds of the backoff before the jitter, in seconds
+        - deadline : seconds after which a call is no longer retried (default: 10)
+        - breaker : the CircuitBreaker to use (default: a new one)
+        """
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker = breaker or CircuitBreaker()
+        # The sync client calls from its executor threads
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.failures = 0
+        self.retries = 0
+        self.not_retried = 0
+        self.deadline_exceeded = 0
+
+    def is_idempotent(self, method):
+        return method in self.idempotent
+
+    def before_attempt(self, method):
+        """
+        Whether the circuit breaker lets the call out. Clients raise MsfRpcUnavailableError with
+        unavailable(method) as the message when it does not.
+        """
+        if not self.breaker.allow():
+            return False
+        with self._lock:
+            self.attempts += 1
+        return True
+
+    def unavailable(self, method):
+        """
+        Why a call to method was not let out.
+        """
+        return ('msfrpcd is unavailable after %d consecutive failures, not calling %s for another %.1fs'
+                % (self.breaker.consecutive_failures, method, self.breaker.retry_in))
+
+    def on_success(self):
+        self.breaker.record_success()
+
+    def on_abort(self):
+        """
+        Record an attempt that ended without a response or a transport error, e.g. a cancelled
+        call, so a half open breaker is not left waiting for its trial call forever.
+        """
+        self.breaker.record_abort()
+
+    def on_failure(self, method, sent, attempt, started):
+        """
+        Record a failed attempt. Returns the seconds to wait before retrying, or None to give up.
+
+        Mandatory Arguments:
+        - method : the RPC method
+        - sent : whether the request may have reached msfrpcd
+        - attempt : the number of the failed attempt, starting at 0
+        - started : the time.monotonic() the call began at
+        """
+        with self._lock:
+            self.failures += 1
+        self.breaker.record_failure()
+        if self.breaker.state == CircuitBreaker.OPEN:
+            # Retrying would only be rejected: report the failure itself
+            with self._lock:
+                self.not_retried += 1
+            return None
+        if attempt + 1 >= self.tries or (sent and not self.is_idempotent(method)):
+            with self._lock:
+                self.not_retried += 1
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if time.monotonic() - started + delay > self.deadline:
+            with self._lock:
+                self.deadline_exceeded += 1
+            return None
+        with self._lock:
+            self.retries += 1
+        return delay
+
+    @property
+    def stats(self):
+        """
+        Retry counters and the circuit breaker state.
+        """
+        with self._lock:
+            stats = {
+                'attempts': self.attempts,
+                'failures': self.failures,
+                'retries': self.retries,
+                'not_retried': self.not_retried,
+                'deadline_exceeded': self.deadline_exceeded,
+            }
+        stats['breaker'] = self.breaker.stats
+        return stats
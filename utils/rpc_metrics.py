@@ -0,0 +1,196 @@
+# utils/rpc_metrics.py
+"""Per-method RPC call metrics, exported as JSON or in the Prometheus text format."""
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class _MethodMetrics(object):
+
+    __slots__ = ('calls', 'errors', 'retries', 'bytes_sent', 'bytes_received', 'seconds', 'max', 'buckets',
+                 'recent', 'phases')
+
+    def __init__(self, buckets, window):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (buckets + 1)
+        self.recent = deque(maxlen=window)
+        self.phases = dict.fromkeys(RpcMetrics.phases, 0.0)
+
+
+class RpcMetrics(object):
+
+    # Upper bounds of the call latency histogram buckets, in seconds
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    # Where a call spends its time: encoding the request, the HTTP round trip (retries and their
+    # backoff included), unpacking the response and converting its strings. With fast_decode the
+    # conversion happens while unpacking and is counted as decode.
+    phases = ('encode', 'http', 'decode', 'convert')
+
+    def __init__(self, window=1024):
+        """
+        Per-method call counts, latencies, errors, retries, bytes sent and received, and the time
+        spent in each phase of a call. Percentiles are computed over the last window calls of each
+        method; the histogram counts every call since the metrics were created or reset.
+
+        Optional Keyword Arguments:
+        - window : latencies kept per method for the percentiles (default: 1024)
+        """
+        self.window = window
+        self.started = time.time()
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def _method(self, method):
+        # The caller holds the lock
+        m = self._methods.get(method)
+        if m is None:
+            m = self._methods[method] = _MethodMetrics(len(self.buckets), self.window)
+        return m
+
+    def observe(self, method, seconds, error=False):
+        """
+        Record a call and how long it took, from the caller's point of view.
+        """
+        with self._lock:
+            m = self._method(method)
+            m.calls += 1
+            m.errors += bool(error)
+            m.seconds += seconds
+            m.max = max(m.max, seconds)
+            m.buckets[bisect.bisect_left(self.buckets, seconds)] += 1
+            m.recent.append(seconds)
+
+    def phase(self, method, name, seconds):
+        with self._lock:
+            self._method(method).phases[name] += seconds
+
+    @contextmanager
+    def measure(self, method, name):
+        """
+        Add the time the with block takes to a phase of method.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase(method, name, time.perf_counter() - started)
+
+    def transferred(self, method, sent=0, received=0):
+        with self._lock:
+            m = self._method(method)
+            m.bytes_sent += sent
+            m.bytes_received += received
+
+    def retried(self, method):
+        with self._lock:
+            self._method(method).retries += 1
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self.started = time.time()
+
+    @staticmethod
+    def _percentile(ordered, q):
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def stats(self):
+        """
+        Totals and per-method metrics, slowest methods (by total time) first. Times are in
+        milliseconds.
+        """
+        with self._lock:
+            methods = {}
+            for method, m in sorted(self._methods.items(), key=lambda item: -item[1].seconds):
+                recent = sorted(m.recent)
+                methods[method] = {
+                    'calls': m.calls,
+                    'errors': m.errors,
+                    'retries': m.retries,
+                    'bytes_sent': m.bytes_sent,
+                    'bytes_received': m.bytes_received,
+                    'total_ms': round(m.seconds * 1000, 3),
+                    'mean_ms': round(m.seconds * 1000 / m.calls, 3) if m.calls else 0.0,
+                    'p50_ms': round(self._percentile(recent, 0.50) * 1000, 3),
+                    'p95_ms': round(self._percentile(recent, 0.95) * 1000, 3),
+                    'p99_ms': round(self._percentile(recent, 0.99) * 1000, 3),
+                    'max_ms': round(m.max * 1000, 3),
+                    'phases_ms': {name: round(s * 1000, 3) for name, s in m.phases.items()},
+                }
+            elapsed = time.time() - self.started
+            calls = sum(m['calls'] for m in methods.values())
+            return {
+                'uptime': round(elapsed, 3),
+                'calls': calls,
+                'errors': sum(m['errors'] for m in methods.values()),
+                'calls_per_second': round(calls / elapsed, 3) if elapsed > 0 else 0.0,
+                'methods': methods,
+            }
+
+    def prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        counters = [
+            ('msfrpc_calls_total', 'RPC calls made', 'calls'),
+            ('msfrpc_errors_total', 'RPC calls that raised or returned an error', 'errors'),
+            ('msfrpc_retries_total', 'RPC requests sent again after a failure', 'retries'),
+            ('msfrpc_request_bytes_total', 'Bytes of RPC requests sent', 'bytes_sent'),
+            ('msfrpc_response_bytes_total', 'Bytes of RPC responses received', 'bytes_received'),
+        ]
+        with self._lock:
+            methods = sorted(self._methods.items())
+            lines = []
+            for name, help_text, attr in counters:
+                lines += ['# HELP %s %s' % (name, help_text), '# TYPE %s counter' % name]
+                lines += ['%s{method="%s"} %d' % (name, method, getattr(m, attr)) for method, m in methods]
+            name = 'msfrpc_phase_seconds_total'
+            lines += ['# HELP %s Seconds spent in each phase of RPC calls' % name, '# TYPE %s counter' % name]
+            for method, m in methods:
+                lines += ['%s{method="%s",phase="%s"} %.6f' % (name, method, phase, s) for phase, s in m.phases.items()]
+            name = 'msfrpc_call_duration_seconds'
+            lines += ['# HELP %s RPC call latency' % name, '# TYPE %s histogram' % name]
+            for method, m in methods:
+                count = 0
+                for bound, n in zip(self.buckets + (float('inf'),), m.buckets):
+                    count += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_bucket{method="%s",le="%s"} %d' % (name, method, le, count))
+                lines.append('%s_sum{method="%s"} %.6f' % (name, method, m.seconds))
+                lines.append('%s_count{method="%s"} %d' % (name, method, m.calls))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """
+        Write the metrics to path, as JSON if it ends in .json and in the Prometheus text format
+        otherwise. The file is replaced atomically, so readers never see a partial dump.
+        """
+        if path.endswith('.json'):
+            text = json.dumps(self.stats, indent=2)
+        else:
+            text = self.prometheus()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.metrics-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
@@ -0,0 +1,63 @@
+# utils/session_buffer.py
+"""Client-side record of session output, for reads that resume where they left off."""
+import bisect
+import threading
+
+
+class SessionOutputBuffer(object):
+
+    def __init__(self, maxsize=1048576, lock=None):
+        """
+        A bounded, client-side ring of the output read from one session. Reading a session from
+        msfrpcd drains it, so every read is recorded here and numbered by character offset: a
+        reader keeps the seq it got back and resumes from it, and concurrent readers or a dropped
+        call lose nothing that is still within maxsize characters.
+
+        Optional Keyword Arguments:
+        - maxsize : the number of characters to keep (default: 1048576)
+        - lock : held while a session is read and its output recorded, so chunks stay in order
+                 (default: a threading.Lock)
+        """
+        self.maxsize = maxsize
+        self.lock = lock or threading.Lock()
+        self.first = 0
+        self.last = 0
+        self._starts = []
+        self._chunks = []
+
+    def append(self, data):
+        """
+        Record data read from the session. Returns the seq following it.
+        """
+        if data:
+            self._starts.append(self.last)
+            self._chunks.append(data)
+            self.last += len(data)
+            if self.last - self.first > self.maxsize:
+                self.first = self.last - self.maxsize
+                drop = bisect.bisect_right(self._starts, self.first) - 1
+                if drop > 0:
+                    del self._starts[:drop]
+                    del self._chunks[:drop]
+        return self.last
+
+    def read(self, seq=None):
+        """
+        Returns the output from seq on as a dict with 'data', the 'seq' to resume from and, when
+        output before seq was already discarded, the number of 'dropped' characters.
+
+        Optional Keyword Arguments:
+        - seq : where to start reading (default: the oldest output kept)
+        """
+        if seq is None or seq < self.first:
+            dropped = 0 if seq is None else self.first - seq
+            seq = self.first
+        else:
+            dropped = 0
+            seq = min(seq, self.last)
+        i = max(bisect.bisect_right(self._starts, seq) - 1, 0)
+        data = ''.join(self._chunks[i:])[seq - self._starts[i]:] if self._chunks else ''
+        result = {'data': data, 'seq': self.last}
+        if dropped:
+            result['dropped'] = dropped
+        return result
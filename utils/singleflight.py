@@ -0,0 +1,96 @@
+# utils/singleflight.py
+"""Merging of concurrent identical read-only RPCs into one request."""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from utils.retry_policy import RetryPolicy
+
+
+class Singleflight(object):
+
+    # Read-only calls whose concurrent identical requests can share one response. Writes are
+    # never merged even when idempotent: each caller expects its own call to reach msfrpcd.
+    coalescible = RetryPolicy.idempotent - frozenset([
+        'core.setg',
+        'core.unsetg',
+        'db.set_workspace',
+    ])
+
+    def __init__(self):
+        """
+        Merges concurrent identical read-only calls: while a request for a method and arguments is
+        in flight, other callers asking for the same wait for its response instead of sending
+        their own. Only the raw response is shared, each caller decodes its own copy.
+        """
+        self.calls = 0
+        self.shared = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Return fn(), or the result of the identical call already in flight.
+
+        Mandatory Arguments:
+        - key : identifies the call, the method and its encoded arguments
+        - fn : sends the request
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.shared += 1
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+        return future.result()
+
+    @property
+    def stats(self):
+        """
+        Coalescible calls made and how many of them shared another call's response.
+        """
+        return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._inflight)}
+
+
+class AsyncSingleflight(Singleflight):
+
+    def __init__(self):
+        """
+        Singleflight for coroutines. The request runs as a task of its own, so a caller that is
+        cancelled does not cancel the response the others are waiting for.
+        """
+        super().__init__()
+
+    async def do(self, key, fn):
+        """
+        Return await fn(), or the result of the identical call already in flight.
+
+        Mandatory Arguments:
+        - key : identifies the call, the method and its encoded arguments
+        - fn : returns the coroutine that sends the request
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Retrieve the error so it is not reported when every caller was cancelled
+            task.exception()
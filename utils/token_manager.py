@@ -0,0 +1,148 @@
+# utils/token_manager.py
+"""Lifecycle of the permanent API tokens this server adds to msfrpcd."""
+import json
+import logging
+import os
+import uuid
+from typing import Dict, List, Optional
+
+from msfrpc import MsfRpcMethod
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the permanent tokens this server creates, so they can be told apart in auth.token_list
+TOKEN_TAG = 'MCP'
+
+
+def default_token_path() -> Optional[str]:
+    """Token file from MSF_RPC_TOKEN_FILE, by default in the user cache directory. Empty disables it."""
+    default = os.path.join(os.path.expanduser('~'), '.cache', 'metasploit-mcp-server', 'token.json')
+    path = os.environ.get('MSF_RPC_TOKEN_FILE', default)
+    return os.path.expanduser(path) if path else None
+
+
+class TokenManager:
+    """Tracks the permanent tokens the clients add to msfrpcd, which never expires them.
+
+    Every token created is recorded in a local file. At startup the last one is reused instead
+    of logging in again, and the others, left behind by earlier runs or replaced after a re-login,
+    are removed from msfrpcd. At shutdown every tracked token is removed, except the current one
+    when there is a file to reuse it from.
+    """
+
+    def __init__(self, path: Optional[str] = None, tag: str = TOKEN_TAG):
+        self.path = path
+        self.tag = tag
+        self.current: Optional[str] = None
+        self.tracked: List[str] = []
+        self.removed = 0
+        self.daemon_tokens: Optional[int] = None
+        self.tagged_tokens: Optional[int] = None
+        self._load()
+
+    def new_token(self) -> str:
+        """A new tagged token for auth.token_add."""
+        return self.tag + uuid.uuid4().hex
+
+    def added(self, token: str) -> None:
+        """Record a permanent token a client just added to msfrpcd."""
+        if token not in self.tracked:
+            self.tracked.append(token)
+        self.current = token
+        self._save()
+
+    async def start(self, client) -> Dict:
+        """Authenticate the client, reusing the persisted token, and sweep stale tracked tokens."""
+        if client.token is None and self.current:
+            client.token = self.current
+        # Checks a reused token and logs in again if msfrpcd no longer knows it
+        await client.ensure_auth()
+        tokens = await self._daemon_tokens(client)
+        stale = [t for t in self.tracked if t != client.token]
+        await self._remove(client, [t for t in stale if t in tokens])
+        self.tracked = [t for t in self.tracked if t not in stale]
+        self._save()
+        self._count([t for t in tokens if t not in stale])
+        logger.info("msfrpcd holds %d tokens (%d created by this server), removed %d stale",
+                    self.daemon_tokens, self.tagged_tokens, len(stale))
+        return self.stats
+
+    async def shutdown(self, client) -> None:
+        """Remove the tokens this server created, keeping the current one if it can be reused."""
+        keep = client.token if self.path else None
+        others = [t for t in self.tracked if t not in (keep, client.token)]
+        await self._remove(client, others)
+        if client.token in self.tracked and client.token != keep:
+            # Removed last and alone: calls made with a removed token would trigger a re-login
+            await self._remove(client, [client.token])
+            client.token = None
+        self.tracked = [t for t in self.tracked if t == keep]
+        self.current = keep
+        self._save()
+
+    async def refresh_count(self, client) -> Dict:
+        """Count the tokens msfrpcd currently holds."""
+        self._count(await self._daemon_tokens(client))
+        return self.stats
+
+    @property
+    def stats(self) -> Dict:
+        return {
+            'daemon_tokens': self.daemon_tokens,
+            'tagged_tokens': self.tagged_tokens,
+            'tracked_tokens': len(self.tracked),
+            'removed_tokens': self.removed,
+        }
+
+    @staticmethod
+    async def _daemon_tokens(client) -> List[str]:
+        return (await client.call(MsfRpcMethod.AuthTokenList)).get('tokens', [])
+
+    def _count(self, tokens: List[str]) -> None:
+        self.daemon_tokens = len(tokens)
+        self.tagged_tokens = len([t for t in tokens if t.startswith(self.tag)])
+
+    async def _remove(self, client, tokens: List[str]) -> None:
+        if not tokens:
+            return
+        async with client.batch() as batch:
+            for token in tokens:
+                batch.call(MsfRpcMethod.AuthTokenRemove, [token])
+        for token, result in zip(tokens, batch.results(return_exceptions=True)):
+            if isinstance(result, dict) and result.get('result') == 'success':
+                self.removed += 1
+            else:
+                logger.warning("Could not remove msfrpcd token %s...: %s", token[:8], result)
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            self.current = state.get('current')
+            self.tracked = list(state.get('tokens', []))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning("Ignoring unreadable token file %s: %s", self.path, e)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # The tokens are credentials: keep the file private to the user. A new file is written
+            # and renamed over the old one, so a file created with other permissions is replaced too.
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'current': self.current, 'tokens': self.tracked}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            logger.warning("Could not save the token file %s: %s", self.path, e)
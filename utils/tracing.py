@@ -0,0 +1,258 @@
+# utils/tracing.py
+"""Traces of tool calls and the RPCs they make, written as JSON lines or OTLP/JSON."""
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+
+
+# The span the code running now belongs to. asyncio tasks and asyncio.to_thread inherit it.
+_current_span = contextvars.ContextVar('msfrpc_span', default=None)
+
+
+class _NoopSpan(object):
+    """
+    Stands in for a span when the code is not being traced, so callers need no checks.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, key, value):
+        pass
+
+    def fail(self, message):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span(object):
+
+    __slots__ = ('tracer', 'trace', 'trace_id', 'span_id', 'parent_id', 'name', 'kind', 'attributes', 'start_ns',
+                 'end_ns', 'error', '_started', '_token')
+
+    def __init__(self, tracer, name, parent=None, kind='internal', attributes=None):
+        """
+        A timed step of a trace. Use it as a context manager: spans started inside the with block,
+        in the same task or thread or in tasks it starts, become its children.
+
+        Mandatory Arguments:
+        - tracer : the Tracer exporting the trace
+        - name : what the step is, e.g. the tool or RPC method name
+
+        Optional Keyword Arguments:
+        - parent : the enclosing span, None for the root of a trace
+        - kind : 'internal' for local steps, 'client' for RPCs (default: internal)
+        - attributes : a dict of details about the step
+        """
+        self.tracer = tracer
+        # Every span of a trace appends itself to the same list once it ends
+        self.trace = parent.trace if parent is not None else []
+        self.trace_id = parent.trace_id if parent is not None else '%032x' % random.getrandbits(128)
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._started = time.perf_counter_ns()
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_span.reset(self._token)
+        if exc_value is not None and self.error is None:
+            self.error = '%s: %s' % (exc_type.__name__, exc_value)
+        self.finish()
+        return False
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def fail(self, message):
+        """
+        Mark the step as failed without an exception, e.g. for an error response.
+        """
+        self.error = str(message)
+
+    def child(self, name, kind='internal', attributes=None):
+        return Span(self.tracer, name, self, kind, attributes)
+
+    def finish(self, duration_ns=None):
+        """
+        End the span; ending the root span exports the whole trace.
+        """
+        if duration_ns is None:
+            duration_ns = time.perf_counter_ns() - self._started
+        else:
+            self.start_ns = time.time_ns() - duration_ns
+        self.end_ns = self.start_ns + duration_ns
+        self.trace.append(self)
+        if self.parent_id is None:
+            self.tracer.export(self.trace)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start_ns': self.start_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+def span(name, kind='internal', **attributes):
+    """
+    A child span of the current span, or a no-op stand-in when the code is not being traced.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP_SPAN
+    return parent.child(name, kind, attributes)
+
+
+def record_span(name, seconds, error=False, kind='client', **attributes):
+    """
+    Add a step that already ended, and took seconds, to the current trace. Cheaper than a span
+    for leaves such as single RPCs, which start no spans of their own.
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        s = parent.child(name, kind, attributes)
+        if error:
+            s.fail(error if isinstance(error, str) else 'error response')
+        s.finish(int(seconds * 1e9))
+
+
+class Tracer(object):
+
+    # OTLP span kinds and status codes
+    _otlp_kinds = {'internal': 1, 'client': 3}
+    _otlp_error = 2
+
+    def __init__(self, path=None, sample_rate=1.0, format='jsonl', service='metasploit-mcp-server'):
+        """
+        Starts traces and writes every sampled trace to a file once its root span ends. With format
+        'jsonl' each span is a JSON line; with 'otlp' each trace is a line of OTLP/JSON
+        (ExportTraceServiceRequest), which an OpenTelemetry collector's otlpjsonfile receiver reads.
+
+        Optional Keyword Arguments:
+        - path : the file traces are appended to, None disables tracing (default: None)
+        - sample_rate : the fraction of traces kept, between 0 and 1 (default: 1.0)
+        - format : 'jsonl' or 'otlp' (default: jsonl)
+        - service : the service.name of OTLP traces
+        """
+        if format not in ('jsonl', 'otlp'):
+            raise ValueError('Unknown trace format %s, expected jsonl or otlp' % format)
+        self.path = path
+        self.sample_rate = sample_rate
+        self.format = format
+        self.service = service
+        self.traces = 0
+        self.spans = 0
+        self.unsampled = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None and self.sample_rate > 0
+
+    def trace(self, name, **attributes):
+        """
+        A root span for name, a child span if a trace is already running, or a no-op stand-in
+        when tracing is disabled or the trace is not sampled.
+        """
+        parent = _current_span.get()
+        if parent is not None:
+            return parent.child(name, 'internal', attributes)
+        if not self.enabled:
+            return _NOOP_SPAN
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self.unsampled += 1
+            return _NOOP_SPAN
+        return Span(self, name, attributes=attributes)
+
+    def export(self, spans):
+        if self.format == 'otlp':
+            lines = [json.dumps(self._otlp(spans), default=str)]
+        else:
+            lines = [json.dumps(s.to_dict(), default=str) for s in spans]
+        with self._lock:
+            self.traces += 1
+            self.spans += len(spans)
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    self._file = open(self.path, 'a')
+                self._file.write('\n'.join(lines) + '\n')
+                self._file.flush()
+            except OSError:
+                # Losing a trace must never fail the call it describes
+                self.traces -= 1
+                self.spans -= len(spans)
+
+    def _otlp(self, spans):
+        def value(v):
+            if isinstance(v, bool):
+                return {'boolValue': v}
+            if isinstance(v, int):
+                return {'intValue': str(v)}
+            if isinstance(v, float):
+                return {'doubleValue': v}
+            return {'stringValue': str(v)}
+
+        otlp_spans = []
+        for s in spans:
+            otlp = {
+                'traceId': s.trace_id,
+                'spanId': s.span_id,
+                'name': s.name,
+                'kind': self._otlp_kinds.get(s.kind, 1),
+                'startTimeUnixNano': str(s.start_ns),
+                'endTimeUnixNano': str(s.end_ns),
+                'attributes': [{'key': k, 'value': value(v)} for k, v in s.attributes.items()],
+                'status': {'code': self._otlp_error, 'message': s.error} if s.error else {},
+            }
+            if s.parent_id is not None:
+                otlp['parentSpanId'] = s.parent_id
+            otlp_spans.append(otlp)
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service}}]},
+            'scopeSpans': [{'scope': {'name': 'msfrpc'}, 'spans': otlp_spans}],
+        }]}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @property
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'sample_rate': self.sample_rate,
+            'traces': self.traces,
+            'spans': self.spans,
+            'unsampled': self.unsampled,
+        }